@@ -0,0 +1,415 @@
+'''
+Benchmark suite for WDL Builder: the line model, the parser, the writer
+and the treeview, on synthetic WDL files from 20 lines up to 1M lines.
+
+Runs headless. The treeview cases need a display; they run against a
+withdrawn Tk root (use xvfb-run on a server) and are skipped otherwise.
+Usage:
+
+    python benchmark.py
+    python benchmark.py --sizes 20 1000 100000 1000000 --json results.json
+    python benchmark.py --cases parse write --repeat 5
+    python benchmark.py --memory 1000000
+'''
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from run import CustomTreeview
+from wdl_core import Application, WDLReader, open_wdl, parse_pasted_lines, write_wdl
+
+DEFAULT_SIZES = [20, 1000, 10000, 100000, 1000000]
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Synthetic Data
+
+###############################################################################################################
+###############################################################################################################
+
+def synthetic_records(size, seed=0):
+    '''
+    (line_number, description) records shaped like a real title block:
+    mostly consecutive numbers with the odd gap, short upper-case text.
+    '''
+    words = ["PROJECT", "TITLE", "CLIENT", "DRAWN", "CHECKED", "MOTOR", "CONTROL", "PANEL", "REV", "SITE"]
+    rng = random.Random(seed)
+    number = 0
+    records = []
+    for _ in range(size):
+        number += 1 if rng.random() < 0.95 else rng.randint(2, 5)
+        records.append((number, " ".join(rng.choice(words) for _ in range(3)) + f" {number}"))
+    return records
+
+
+def write_synthetic_file(directory, size):
+    path = os.path.join(directory, f"BENCH{size}_wdtitle.wdl")
+    if not os.path.exists(path):
+        write_wdl(path, synthetic_records(size))
+    return path
+
+
+def loaded_app(records):
+    app = Application(headless=True)
+    app.import_records(records)
+    return app
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Cases
+
+###############################################################################################################
+###############################################################################################################
+
+# Each case is setup(size, context) -> run(), where only run() is timed.
+
+def case_add_line(size, context):
+    line_ids = [f"Line {number}" for number, _ in context["records"]]
+    random.Random(size).shuffle(line_ids)
+
+    def run():
+        app = Application(headless=True)
+        for line_id in line_ids:
+            app.add_line(line_id)
+    return run
+
+
+def case_add_lines(size, context):
+    line_ids = [f"Line {number}" for number, _ in context["records"]]
+    random.Random(size).shuffle(line_ids)
+
+    def run():
+        Application(headless=True).add_lines(line_ids)
+    return run
+
+
+def case_edit_line(size, context):
+    app = loaded_app(context["records"])
+    edits = [(f"Line {number}", description.lower()) for number, description in context["records"]]
+
+    def run():
+        for line_id, description in edits:
+            app.edit_line(line_id, description)
+    return run
+
+
+def case_remove_line(size, context):
+    line_ids = [f"Line {number}" for number, _ in context["records"]]
+    random.Random(size).shuffle(line_ids)
+    app = None
+
+    def run():
+        for line_id in line_ids:
+            app.remove_line(line_id)
+
+    def setup():
+        nonlocal app
+        app = loaded_app(context["records"])
+    run.setup = setup
+    return run
+
+
+def case_generate_output(size, context):
+    app = loaded_app(context["records"])
+    return app.generate_output
+
+
+def case_write(size, context):
+    app = loaded_app(context["records"])
+    path = os.path.join(context["directory"], "write_wdtitle.wdl")
+    return lambda: app.write_output(path)
+
+
+def case_parse(size, context):
+    path = context["path"]
+
+    def run():
+        with open_wdl(path) as fd:
+            for _ in WDLReader(fd):
+                pass
+    return run
+
+
+def case_open(size, context):
+    path = context["path"]
+
+    def run():
+        app = Application(headless=True)
+        with open_wdl(path) as fd:
+            app.import_records(WDLReader(fd))
+    return run
+
+
+def case_filter(size, context):
+    app = loaded_app(context["records"])
+    app.text_index
+
+    def run():
+        for query in ("m", "mo", "mot", "moto", "motor"):
+            app.filter_lines(query)
+    return run
+
+
+def case_paste(size, context):
+    # A two-column block copied from Excel, applied over the default model
+    text = "".join(f"{number}\t{description}\r\n" for number, description in context["records"])
+
+    def run():
+        records, _ = parse_pasted_lines(text)
+        Application(headless=True).set_descriptions(records)
+    return run
+
+
+def case_undo_paste(size, context):
+    # Undo a paste that rewrote every line: one step proportional to the paste
+    edits = [(number, description.lower()) for number, description in context["records"]]
+    app = None
+
+    def run():
+        app.undo()
+
+    def setup():
+        nonlocal app
+        app = loaded_app(context["records"])
+        app.set_descriptions(edits)
+    run.setup = setup
+    return run
+
+
+def case_treeview_populate(size, context):
+    root = context["tk_root"]
+    app = loaded_app(context["records"])
+    tree = CustomTreeview(app, root, columns=["Line #", "Description"])
+
+    def run():
+        tree.populate()
+        root.update_idletasks()
+    return run
+
+
+def case_treeview_scroll(size, context):
+    root = context["tk_root"]
+    app = loaded_app(context["records"])
+    tree = CustomTreeview(app, root, columns=["Line #", "Description"])
+    tree.populate()
+    rng = random.Random(size)
+    targets = [rng.randrange(size) for _ in range(100)]
+
+    def run():
+        for top in targets:
+            tree.scroll_to(top)
+        root.update_idletasks()
+    return run
+
+
+def case_treeview_edit(size, context):
+    root = context["tk_root"]
+    app = loaded_app(context["records"])
+    tree = CustomTreeview(app, root, columns=["Line #", "Description"])
+    app.subscribe(tree.apply_changes)
+    tree.populate()
+    visible = [f"Line {number}" for number, _ in context["records"][:10]]
+
+    def run():
+        for i in range(100):
+            app.edit_line(visible[i % len(visible)], f"EDIT {i}")
+        root.update_idletasks()
+    return run
+
+
+CASES = {
+    "add_line": (case_add_line, False),
+    "add_lines": (case_add_lines, False),
+    "edit_line": (case_edit_line, False),
+    "remove_line": (case_remove_line, False),
+    "generate_output": (case_generate_output, False),
+    "write": (case_write, False),
+    "parse": (case_parse, False),
+    "open": (case_open, False),
+    "filter": (case_filter, False),
+    "paste": (case_paste, False),
+    "undo_paste": (case_undo_paste, False),
+    "treeview_populate": (case_treeview_populate, True),
+    "treeview_scroll": (case_treeview_scroll, True),
+    "treeview_edit": (case_treeview_edit, True),
+}
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Runner
+
+###############################################################################################################
+###############################################################################################################
+
+def make_tk_root():
+    '''
+    Returns a withdrawn Tk root, or None when no display is available.
+    '''
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        return root
+    except Exception:
+        return None
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def time_case(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        if hasattr(run, "setup"):
+            run.setup()
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_suite(sizes, cases, repeat, directory):
+    tk_root = make_tk_root() if any(CASES[name][1] for name in cases) else None
+
+    results = []
+    for size in sizes:
+        context = {
+            "records": synthetic_records(size),
+            "directory": directory,
+            "path": write_synthetic_file(directory, size),
+            "tk_root": tk_root,
+        }
+
+        for name in cases:
+            setup, needs_display = CASES[name]
+            result = {"case": name, "size": size}
+
+            if needs_display and tk_root is None:
+                result["skipped"] = "no display"
+            else:
+                timings = time_case(setup(size, context), repeat)
+                result["seconds"] = min(timings)
+                result["median_seconds"] = statistics.median(timings)
+                result["us_per_line"] = min(timings) / size * 1e6
+
+            results.append(result)
+            print_result(result)
+
+    if tk_root is not None:
+        tk_root.destroy()
+    return results
+
+
+def print_result(result):
+    if "skipped" in result:
+        print(f"{result['case']:>18} {result['size']:>9}   skipped ({result['skipped']})")
+    else:
+        print(f"{result['case']:>18} {result['size']:>9} {result['seconds']:10.4f}s {result['us_per_line']:10.3f}us/line")
+    sys.stdout.flush()
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Memory
+
+###############################################################################################################
+###############################################################################################################
+
+def measure_memory(build, size):
+    '''
+    Returns the bytes still allocated by build(descriptions), excluding the
+    description strings themselves, which both representations share.
+    '''
+    descriptions = [f"Description {n}" for n in range(1, size + 1)]
+    gc.collect()
+    tracemalloc.start()
+    model = build(descriptions)
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del model
+    return current
+
+
+def build_model(descriptions):
+    return loaded_app(zip(range(1, len(descriptions) + 1), descriptions))
+
+
+def build_legacy(descriptions):
+    # The pre-LineIndex layout: a "Line N" list plus a "Line N" -> description dictionary
+    line_ids = [f"Line {n}" for n in range(1, len(descriptions) + 1)]
+    lines = dict(zip(line_ids, descriptions))
+    return line_ids, lines
+
+
+def report_memory(size):
+    result = {"case": "memory", "size": size,
+              "model_bytes": measure_memory(build_model, size),
+              "legacy_bytes": measure_memory(build_legacy, size)}
+    print(f"{'lines':>10} {'model':>12} {'legacy':>12}")
+    print(f"{size:>10} {result['model_bytes'] / 2**20:10.1f}MB {result['legacy_bytes'] / 2**20:10.1f}MB")
+    return [result]
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Command Line
+
+###############################################################################################################
+###############################################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="WDL Builder benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="line counts to run each case at")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES), help="cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the fastest is reported")
+    parser.add_argument("--json", metavar="FILE", help="write machine-readable results to FILE")
+    parser.add_argument("--memory", type=int, metavar="LINES", help="measure model memory at LINES lines instead of timing")
+    args = parser.parse_args()
+
+    if args.memory:
+        results = report_memory(args.memory)
+    else:
+        with tempfile.TemporaryDirectory(prefix="wdl-bench-") as directory:
+            results = run_suite(args.sizes, args.cases, args.repeat, directory)
+
+    if args.json:
+        document = {
+            "meta": {
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "repeat": args.repeat,
+            },
+            "results": results,
+        }
+        with open(args.json, 'w') as fd:
+            json.dump(document, fd, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
+import time
+# Taken before the remaining imports so --startup-time covers module loading
+STARTUP_TIME = time.perf_counter()
+
 import os
 import sys
 import tkinter as tk
 from tkinter import ttk
 from tkinter import simpledialog, filedialog, messagebox
-import re
-from PIL import ImageTk, Image
+
+from wdl_core import (
+    JOURNAL_FLUSH_MS, WATCH_POLL_MS, ILLEGAL_DESCRIPTION_PATTERN,
+    Application, LineChange, ModelCache, BackgroundTask, TaskCancelled, SessionJournal, FileWatcher, ProjectIndex, WDLTemplate,
+    line_number, is_wdtitle_file, parse_pasted_lines, load_wdl_file, save_wdl_file, load_journal, load_wdl_model,
+    diff_models, merge_changes, load_table, run_template, instrumented, main,
+)
 
 ###############################################################################################################
 ###############################################################################################################
@@ -18,6 +27,14 @@ class AppletFrame(tk.Frame):
     def __init__(self, parent, app):
         tk.Frame.__init__(self, parent, width="180", bg=app.theme["frame_background"])
 
+        # Document Tabs: only the tab strip; every document shares the widgets below
+        self._parent = parent
+        self._tabs = ttk.Notebook(self, height=0)
+        self._tabs.enable_traversal()
+        self._tabs.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+        self._tabs.place(x=0, y=0, relwidth=1.0)
+        self.show_documents([document.name for document in app.documents], app.document_index)
+
         # Project Name Components
         self._projectNameLabel = CustomLabel(app, self, text="Project Name:")
         self._projectNameEntry = CustomEntry(app, self, width=20, initial_text='default')
@@ -29,207 +46,137 @@ class AppletFrame(tk.Frame):
         self._editButton = CustomButton(app, self, text="Edit Line", binding_function=parent.edit_line)
         self._saveButton = CustomButton(app, self, text="Save As", binding_function=parent.save_as)
 
-        self._projectNameLabel.place(x=10, y=10, anchor='nw')
-        self._projectNameEntry.place(x=90, y=10, anchor='nw')
-        self._projectNameLabelSuffix.place(x=229, y=10, anchor='nw')
+        self._projectNameLabel.place(x=10, y=34, anchor='nw')
+        self._projectNameEntry.place(x=90, y=34, anchor='nw')
+        self._projectNameLabelSuffix.place(x=229, y=34, anchor='nw')
 
-        self._addLineButton.place(x=10, y=50, anchor='nw')
-        self._removeLineButton.place(x=110, y=50, anchor='nw')
-        self._editButton.place(x=210, y=50, anchor='nw')
-        self._saveButton.place(x=310, y=50, anchor='nw')
+        self._addLineButton.place(x=10, y=74, anchor='nw')
+        self._removeLineButton.place(x=110, y=74, anchor='nw')
+        self._editButton.place(x=210, y=74, anchor='nw')
+        self._saveButton.place(x=310, y=74, anchor='nw')
+
+        # Filter Components
+        self._app = app
+        self._filterPending = False
+        self._filterText = tk.StringVar(self)
+        self._filterLabel = CustomLabel(app, self, text="Filter:")
+        self._filterEntry = CustomEntry(app, self, width=20)
+        self._filterEntry.configure(textvariable=self._filterText)
+        self._filterText.trace_add('write', self._schedule_filter)
+        # Build the text index when the user heads for the filter, not on the first keystroke
+        self._filterEntry.bind("<FocusIn>", lambda e: app.text_index)
+
+        self._filterLabel.place(x=10, y=101, anchor='nw')
+        self._filterEntry.place(x=90, y=101, anchor='nw')
+
+        # Status readout for instrumentation timings and background results, created when first needed
+        self._statusLabel = None
+        if app.instrumentation.enabled:
+            self._statusLabel = CustomLabel(app, self, text=" ")
+            self._statusLabel.place(x=10, y=354, anchor='nw')
+            app.instrumentation.subscribe(self._show_action_timing)
+
+        # Background task progress, created the first time a file is read or written
+        self._progressBar = None
+        self._cancelButton = None
 
         # Treeview Component
         columns = ["Line #", "Description"]
         self._treeview = CustomTreeview(app, self,columns=columns, binding_function=lambda e: parent.current_item(e))
         self._treeview.column("1", width=110, anchor='c')
         self._treeview.column("2", width=255, anchor='c')
-        self._treeview.place(x=10, y=100, anchor='nw')
+        self._treeview.place(x=10, y=124, anchor='nw')
         self._treeview.populate()
+        self._treeview.bind("<<Paste>>", lambda e: parent.paste_lines())
+        app.subscribe(self._on_model_change)
 
         # Vertical Scrollbar
         self._yscrollbar = CustomTreeviewScrollbarY(app, self, self._treeview)
-        self._yscrollbar.place(x=380, y=100, height=226)
+        self._yscrollbar.place(x=380, y=124, height=226)
         self._treeview.add_vertical_scrollbar(self._yscrollbar)
     
     def clear(self):
+        # The treeview follows the model through change events; only the name is reset here
         self._projectNameEntry.delete(0, 'end')
-        self._treeview.populate()
     
-    def update_file_name(self, filename):
-        self._projectNameEntry.insert('0', filename)
+    def show_documents(self, names, active):
+        '''
+        Rebuilds the tab strip for the given document names and selects active.
+        '''
+        for tab in self._tabs.tabs():
+            self._tabs.forget(tab)
+        for name in names:
+            self._tabs.add(tk.Frame(self._tabs, height=0), text=name)
+        self._tabs.select(active)
     
-    def get_file_name(self):
-        return f"{self._projectNameEntry.get()}_wdtitle.wdl"
-
-
-###############################################################################################################
-###############################################################################################################
-
-# Main Application
-
-###############################################################################################################
-###############################################################################################################
-
-class Application:
-    def __init__(self):
-        self._icon = None #os.path.abspath('img/wdl_builder.ico')
-
-        # DIRECTORY SETUP
-        self._srcDirectory = None
-        if getattr(sys, 'frozen', False):
-            self._srcDirectory = sys._MEIPASS
-        else:
-            self._srcDirectory = os.path.dirname(os.path.abspath(__file__))
-        
-        # APPLICATION COLORS
-        self._frameBackground = '#ffffff'
-        self._foreground = '#070707'
-
-        self._label_font = ('Sans', '8') #, 'bold')
-        self._label_background = '#ffffff'
-
-        self._entry_font = ('Sans', '8') #, 'bold')
-        self._entry_fg = '#000000'
-        self._entry_bg = '#ffffff'
-        self._entry_width = 10
-        self._entry_justify = 'left'
-
-        self._config = {
-            "icon_path":self._icon,
-            "src_dir":self._srcDirectory
-        }
-
-        self._theme = {
-            "frame_background": self._frameBackground,
-            "foreground": self._foreground,
-
-            "label_font": self._label_font,
-            "label_background": self._label_background,
-
-            "entry_font": self._entry_font,
-            "entry_fg": self._entry_fg,
-            "entry_bg": self._entry_bg,
-            "entry_width": self._entry_width,
-            "entry_justify": self._entry_justify
-        }
-
-        self._defaults = {
-            "lines": 20,
-            "project_name": "default"
-        }
-        
-        # List of Line Numbers (as strings), also serve as IDs for treeview
-        self._line_ids = [f"Line {x+1}" for x in range(self._defaults["lines"])]
-
-        # Dictionary of Line #s -> Line Descriptions
-        self._lines = {f"Line {x+1}": "" for x in range(len(self._line_ids))}
-
-        self._currentWindow = ApplicationWindow(self)
-
-    @property
-    def config(self):
-        return self._config
+    def _on_tab_changed(self, event):
+        # Also fires (later, from the event queue) for tabs selected in code; switching to the active document is a no-op
+        self._parent.switch_document(self._tabs.index('current'))
     
-    @property
-    def theme(self):
-        return self._theme
+    def get_project_name(self):
+        return self._projectNameEntry.get()
     
-    @property
-    def defaults(self):
-        return self._defaults
+    def set_project_name(self, name):
+        self._projectNameEntry.delete(0, 'end')
+        self._projectNameEntry.insert(0, name)
     
-    @property
-    def srcDirectory(self):
-        return self._srcDirectory
+    def show_status(self, text):
+        if self._statusLabel is None:
+            self._statusLabel = CustomLabel(self._app, self, text=" ")
+            self._statusLabel.place(x=10, y=354, anchor='nw')
+        self._statusLabel.configure(text=text)
     
-    @property
-    def lines(self):
-        return self._lines
+    def _show_action_timing(self, record):
+        phases = ", ".join(f"{name} {seconds * 1000:.1f}" for name, seconds in record.phases.items() if name != "dialog")
+        self.show_status(f"{record.name}: {record.work * 1000:.1f} ms" + (f" ({phases})" if phases else ""))
     
-    @property
-    def line_ids(self):
-        return self._line_ids
+    def show_progress(self, label, cancel):
+        if self._progressBar is None:
+            self._progressBar = ttk.Progressbar(self, orient='horizontal', length=90, mode='determinate', maximum=1.0)
+            self._cancelButton = CustomButton(self._app, self, text="Cancel")
+            self._cancelButton.configure(width=7)
+
+        self._progressBar.configure(value=0.0)
+        self._cancelButton.configure(command=cancel)
+        self._progressBar.place(x=229, y=103, anchor='nw')
+        self._cancelButton.place(x=325, y=99, anchor='nw')
+        self.winfo_toplevel().title(f"WDL Builder - {label}...")
     
-    def remove_line(self, line_id:str):
-        '''
-        Removes a line from the application with key line_id
-        '''
-        try:
-            self._line_ids.remove(line_id)
-            self._lines.pop(line_id)
-        except Exception as e:
-            return 0
+    def update_progress(self, fraction):
+        self._progressBar.configure(value=fraction)
     
-    def add_line(self, line_id:str):
-        '''
-        Adds a line to the application with key line_id
-        '''
-        try:
-            pattern = re.compile(r'^Line \d+$')
-            if bool(pattern.match(line_id)) and line_id != "Line 0":
-                self._line_ids.append(line_id)
-                self._line_ids = sorted(self._line_ids, key=lambda x: int(x.split()[-1]))
-                self._lines[line_id] = ""
-                return 0
-            return -1
-        except Exception as e:
-            return -1
-    
-    def edit_line(self, line_id:str, description:str):
-        '''
-        Edits a line's description.
-        '''
-        try:
-            pattern = re.compile(r'^Line \d+$')
-            if bool(pattern.match(line_id)) and line_id != "Line 0":
-                self._lines[line_id] = description
-                return 0
-            return -1
-        except Exception as e:
-            return -1
-    
-    def clear_line(self, line_id:str):
-        '''
-        Clears a line's description
-        '''
-        self.edit_line(line_id, "")
-    
-    def clear_all_lines(self):
-        '''
-        Clears all the line descriptions
-        '''
-        for line_id in self._line_ids:
-            self.edit_line(line_id, "")
+    def hide_progress(self):
+        self._progressBar.place_forget()
+        self._cancelButton.place_forget()
+        self.winfo_toplevel().title("WDL Builder")
     
-    def new(self):
+    def selected_line_ids(self):
         '''
-        Resets the application to default state.
+        Returns the line ids selected in the treeview, which keeps its
+        selection across edits that leave the selected rows in place.
         '''
-        # List of Line Numbers (as strings), also serve as IDs for treeview
-        self._line_ids = [f"Line {x+1}" for x in range(self._defaults["lines"])]
-        # Dictionary of Line #s -> Line Descriptions
-        self._lines = {f"Line {x+1}": "" for x in range(len(self._line_ids))}
-    
-    def import_lines(self, new_line_index, new_line_dict):
-        self._line_ids = new_line_index
-        self._lines = new_line_dict
-    
-    def generate_output(self):
-        output_content = ""
-        for line_id in self._line_ids:
-            if self._lines[line_id] != "":
-                output_content += f"{line_id.upper().replace(" ", "")}={self._lines[line_id]}\n"
-        
-        return output_content
-
-
-
-
-        
+        return self._treeview.selected_line_ids()
 
+    def _on_model_change(self, change):
+        if self._filterText.get() == "":
+            self._treeview.apply_changes(change)
+        else:
+            # Edits can move lines in or out of the filter; the index is already up to date
+            self._treeview.set_filter(self._app.filter_lines(self._filterText.get()), change)
     
+    def _schedule_filter(self, *args):
+        # Coalesce bursts of keystrokes into one filter pass per idle
+        if not self._filterPending:
+            self._filterPending = True
+            self.after_idle(self._apply_filter)
     
-
+    def _apply_filter(self):
+        self._filterPending = False
+        query = self._filterText.get()
+        self._treeview.set_filter(None if query == "" else self._app.filter_lines(query))
+    
+    def get_file_name(self):
+        return f"{self._projectNameEntry.get()}_wdtitle.wdl"
 
 
 ###############################################################################################################
@@ -245,11 +192,25 @@ class ApplicationWindow(tk.Tk):
         self._app: Application = application
         self._current_selection = []
 
+        # File I/O runs on a pool created with the first task; while a task
+        # is in flight the model is read-only
+        self._ioPool = None
+        self._task = None
+
+        # Crash-recovery journal, started once any previous session has been recovered
+        self._journal = None
+
+        # Document -> FileWatcher based on the version of its file it was last
+        # loaded from or saved to; only the active document's is polled, while
+        # File > Watch File is on, and the poll runs on the I/O pool
+        self._watchers = {}
+        self._watchPoll = None
+        self._watchFuture = None
+
         tk.Tk.__init__(self)
         self.winfo_toplevel().title("WDL Builder")
         #self.iconbitmap(application.config['icon_path'])
 
-        menubar = ApplicationMenu(self)
         self._appletFrame = AppletFrame(self, application)
         self.columnconfigure(0, minsize=100, weight=1)
         self.columnconfigure(1, minsize=100, weight=1)
@@ -261,11 +222,170 @@ class ApplicationWindow(tk.Tk):
 
         self._appletFrame.grid(row=0, column=0, columnspan=4, rowspan=3, sticky="NEWS")
 
-        self.winfo_toplevel().geometry("400x350+50+50")
+        self._watchEnabled = tk.BooleanVar(self, value=False)
+
+        self.winfo_toplevel().geometry("400x374+50+50")
+
+        # The menus are not needed for the first paint, so build them once the loop is idle
+        self._menubar = None
+        self.after_idle(self._build_menu)
+
+        self.bind("<Control-t>", lambda e: self.new_tab())
+        self.bind("<Control-w>", lambda e: self.close_tab())
+        self.bind("<Control-z>", lambda e: self.undo())
+        self.bind("<Control-y>", lambda e: self.redo())
+        self.bind("<Control-Shift-Z>", lambda e: self.redo())
+
+        self.protocol("WM_DELETE_WINDOW", self.kill)
+        self.bind("<Map>", self._on_first_map)
         self.mainloop()
 
+    def _build_menu(self):
+        self._menubar = ApplicationMenu(self)
+
+    def _on_first_map(self, event):
+        # <Map> on the root's bindtag also fires for every child widget
+        if event.widget is not self:
+            return
+        self.unbind("<Map>")
+
+        elapsed = time.perf_counter() - STARTUP_TIME
+        record = self._app.instrumentation.begin("startup")
+        if record is not None:
+            record.start = STARTUP_TIME
+            self._app.instrumentation.end(record)
+
+        if self._app.report_startup:
+            print(f"time to first window: {elapsed * 1000:.1f} ms", file=sys.stderr)
+            self.after_idle(self.kill)
+        elif self._app.autosave:
+            self.after_idle(self._recover_session)
+
+    def _recover_session(self):
+        '''
+        Offers to replay the journals of a session that did not exit cleanly,
+        then starts journaling this one.
+        '''
+        if not SessionJournal.found():
+            return self._start_journal()
+
+        answer = messagebox.askyesno("Recover Session", "WDL Builder did not shut down cleanly last time.\n\nRecover the unsaved changes from that session?")
+        if not answer:
+            return self._start_journal()
+
+        def load(task):
+            # One damaged journal should not cost the documents in the others
+            recovered = []
+            for path in SessionJournal.journal_paths():
+                try:
+                    recovered.append((path, load_journal(path, task), None))
+                except (OSError, ValueError) as error:
+                    recovered.append((path, None, error))
+            return recovered
+
+        def loaded(recovered, error):
+            problems = [] if error is None else [str(error)]
+            first = True
+            for path, result, failure in recovered or ():
+                if failure is not None:
+                    # Keep the journal around rather than overwrite it
+                    os.replace(path, path + ".bak")
+                    problems.append(f"Could not recover {os.path.basename(path)}: {failure}\nThe journal was kept as {path}.bak")
+                    continue
+
+                header, records, warnings = result
+                if not first:
+                    self._app.new_document()
+                first = False
+                self._app.import_records(records, encoding=header.get("encoding"))
+                document = self._app.document
+                document.path = header.get("path")
+                if header.get("name"):
+                    document.name = header["name"]
+                problems.extend(warnings)
+
+            self._appletFrame.clear()
+            self._appletFrame.set_project_name(self._app.document.name)
+            self._show_documents()
+            self._current_selection = self._appletFrame.selected_line_ids()
+            self._follow_document()
+            if problems:
+                messagebox.showwarning("Recover Session", "\n\n".join(problems[:10]))
+            self._start_journal()
+
+        self._start_task("Recovering session", load, loaded)
+
+    def _start_journal(self):
+        try:
+            self._journal = SessionJournal(self._app)
+            self._journal.start()
+        except OSError as error:
+            self._journal = None
+            messagebox.showwarning("Autosave", f"Unsaved changes will not be recoverable after a crash:\n{error}")
+            return
+        self.after(JOURNAL_FLUSH_MS, self._flush_journal)
+
+    def _flush_journal(self):
+        if self._journal is not None:
+            self._journal.flush()
+            self.after(JOURNAL_FLUSH_MS, self._flush_journal)
+
     def kill(self):
+        # A clean exit leaves nothing to recover
+        if self._journal is not None:
+            self._journal.close(discard=True)
+            self._journal = None
+        if self._task is not None:
+            self._task.cancel()
+        if self._ioPool is not None:
+            self._ioPool.shutdown(wait=False)
         self.winfo_toplevel().destroy()
+
+    @property
+    def busy(self):
+        return self._task is not None
+
+    def _dialog(self, function, *args, **kwargs):
+        # Time spent waiting on the user is kept out of an action's work time
+        with self._app.instrumentation.phase("dialog"):
+            return function(*args, **kwargs)
+
+    def _start_task(self, label, work, done):
+        '''
+        Runs work(task) on the I/O pool and later calls done(result, error)
+        back on the Tk thread. Returns -1 if another task is already running.
+        '''
+        if self._task is not None:
+            self.bell()
+            return -1
+
+        self._task = BackgroundTask(label)
+        self._task.future = self._io_pool().submit(work, self._task)
+        self._appletFrame.show_progress(label, self._task.cancel)
+        self.after(50, self._poll_task, done)
+        return 0
+
+    def _io_pool(self):
+        # One worker, so file reads and writes never overlap
+        if self._ioPool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._ioPool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wdl-io")
+        return self._ioPool
+
+    def _poll_task(self, done):
+        task = self._task
+        if not task.future.done():
+            self._appletFrame.update_progress(task.progress)
+            self.after(50, self._poll_task, done)
+            return
+
+        self._task = None
+        self._appletFrame.hide_progress()
+
+        error = task.future.exception()
+        if isinstance(error, TaskCancelled):
+            return
+        done(None if error is not None else task.future.result(), error)
     
     @property
     def app(self):
@@ -276,55 +396,178 @@ class ApplicationWindow(tk.Tk):
         Event function to keep track of currently selected rows
         '''
         tree = event.widget
-        self._current_selection = [tree.item(item)["text"] for item in tree.selection()]
+        self._current_selection = tree.selected_line_ids()
     
     def open(self):
         '''
         Opens the file dialog and asks user to open an existing WDL file.
         '''
+        if self.busy:
+            self.bell()
+            return -1
+
         try:
-            lines = []
-            filename = ""
-            with filedialog.askopenfile('r',defaultextension="wdl",title="Choose WDL file...") as fd:
-                if os.path.splitext(os.path.basename(fd.name))[1] != '.wdl':
-                    fd.close()
-                    return -1
-                
-                if not os.path.splitext(os.path.basename(fd.name))[0].lower().endswith('_wdtitle'):
-                    fd.close()
-                    return -1
-                
-                lines = fd.readlines()
-                filename = os.path.splitext(os.path.basename(fd.name))[0].lower().replace('_wdtitle', '')
-            
-                fd.close()
+            file_path = self._dialog(filedialog.askopenfilename, defaultextension="wdl", title="Choose WDL file...")
         except TypeError:
             return -1
-        
+
+        if not file_path:
+            return -1
+        return self.open_path(file_path)
+
+    def open_path(self, file_path):
+        '''
+        Loads an existing *_wdtitle.wdl file, in a new tab unless the
+        current one is untouched. A file opened before and unchanged since
+        is taken from the model cache without being parsed again.
+        '''
+        if self.busy:
+            self.bell()
+            return -1
+
+        if not is_wdtitle_file(file_path):
+            return -1
+
         try:
-            line_dict = {}
-            line_index = []
-            for line in lines:
-                line_key, line_description = line.split('=')
-                line_key = line_key.replace("LINE", "")
-                line_key = "Line " + line_key
-
-                line_index.append(line_key)
-                
-                line_description = line_description.strip()
-                line_dict[line_key] = line_description
-            
-            self._app.import_lines(line_index, line_dict)
-            self._appletFrame.clear()
-            self._appletFrame.update_file_name(filename)
-            self._current_selection = []
-        
-        except ValueError:
+            source = ModelCache.key(file_path)
+        except OSError as error:
+            messagebox.showerror("Open", f"Could not read {file_path}:\n{error}")
+            return -1
+
+        instrumentation = self._app.instrumentation
+        if source in self._app.model_cache:
+            watcher = FileWatcher(file_path)
+            with instrumentation.action("open"), instrumentation.phase("model"):
+                self._open_document(file_path, lambda: self._app.import_cached(source), watcher=watcher)
+            # The cache entry matched the file's mtime and size, so the file as it is now is the version loaded
+            self._io_pool().submit(watcher.rebase)
+            return 0
+
+        record = instrumentation.begin("open")
+        # The tab that may be reused is decided by the document current when the open started
+        document = self._app.document
+
+        def load(task):
+            with instrumentation.phase("parse", record):
+                records, reader = load_wdl_file(file_path, task)
+            # The file as just parsed is the version a watch compares against
+            watcher = FileWatcher(file_path)
+            try:
+                watcher.rebase()
+            except OSError:
+                pass
+            return records, reader, watcher
+
+        def loaded(result, error):
+            if error is not None:
+                instrumentation.end(record, error=str(error))
+                messagebox.showerror("Open", f"Could not read {file_path}:\n{error}")
+                return
+
+            records, reader, watcher = result
+            with instrumentation.activate(record):
+                with instrumentation.phase("model"):
+                    self._open_document(file_path, lambda: self._app.import_records(records, source=source, encoding=reader.encoding), document, watcher)
+            instrumentation.end(record, lines=len(self._app.line_ids))
+
+            problems = []
+            if reader.diagnostic_count > 0:
+                problems.append(f"Skipped {reader.diagnostic_count} malformed row(s):")
+                problems.extend(str(d) for d in reader.diagnostics[:10])
+            if reader.warning_count > 0:
+                problems.append(f"{reader.warning_count} description(s) contain characters that cannot be entered:")
+                problems.extend(str(d) for d in reader.warnings[:10])
+            if problems:
+                messagebox.showwarning("Open", "\n".join(problems))
+
+        return self._start_task(f"Opening {os.path.basename(file_path)}", load, loaded)
+
+    def _open_document(self, file_path, load, document=None, watcher=None):
+        # Reuse the current tab only if it is still the one the open started from and nothing would be lost by replacing it
+        if (document is not None and document is not self._app.document) or self._app.document.path is not None or self._app.modified:
+            self._app.document.name = self._appletFrame.get_project_name()
+            self._app.new_document()
+
+        if self._journal is not None:
+            self._journal.expect_base(file_path)
+        load()
+        # A tab's history starts at the file it was opened from
+        self._app.clear_history()
+
+        document = self._app.document
+        document.path = file_path
+        document.name = os.path.splitext(os.path.basename(file_path))[0].lower().replace('_wdtitle', '')
+        self._watchers[document] = watcher
+        self._appletFrame.set_project_name(document.name)
+        self._show_documents()
+        self._current_selection = self._appletFrame.selected_line_ids()
+        self._follow_document()
+
+    def _show_documents(self):
+        self._appletFrame.show_documents([document.name for document in self._app.documents], self._app.document_index)
+
+    @instrumented("new_tab")
+    def new_tab(self):
+        if self.busy:
+            self.bell()
             return -1
 
+        self._app.document.name = self._appletFrame.get_project_name()
+        with self._app.instrumentation.phase("model"):
+            self._app.new_document()
+        self._appletFrame.set_project_name(self._app.document.name)
+        self._show_documents()
+        self._current_selection = self._appletFrame.selected_line_ids()
+        self._follow_document()
+        return 0
+
+    @instrumented("close_tab")
+    def close_tab(self):
+        if self.busy:
+            self.bell()
+            return -1
+
+        name = self._appletFrame.get_project_name()
+        if self._app.modified:
+            answer = self._dialog(messagebox.askyesno, "Close Tab", f"Close {name} and discard its unsaved changes?")
+            if not answer:
+                return -1
+
+        with self._app.instrumentation.phase("model"):
+            self._app.close_document(self._app.document_index)
+        self._appletFrame.set_project_name(self._app.document.name)
+        self._show_documents()
+        self._current_selection = self._appletFrame.selected_line_ids()
+        self._follow_document()
+        return 0
+
+    def switch_document(self, index):
+        '''
+        Shows the document in tab index. Its model is kept in memory, so
+        nothing is re-read.
+        '''
+        if index == self._app.document_index:
+            return 0
+        if self.busy:
+            self.bell()
+            self._show_documents()
+            return -1
+
+        self._app.document.name = self._appletFrame.get_project_name()
+
+        with self._app.instrumentation.action("switch_document"), self._app.instrumentation.phase("model"):
+            self._app.switch_document(index)
+        self._appletFrame.set_project_name(self._app.document.name)
+        self._current_selection = self._appletFrame.selected_line_ids()
+        self._follow_document()
+        return 0
+
     def save_as(self):
-        content = self._app.generate_output()
-        if content == "":
+        if self.busy:
+            self.bell()
+            return -1
+
+        if not self._app.has_output():
             return -1
 
         initial_file_name = self._appletFrame.get_file_name()
@@ -333,42 +576,164 @@ class ApplicationWindow(tk.Tk):
 
         file_path = None
         try:
-            file_path = filedialog.asksaveasfilename(defaultextension=".wdl", confirmoverwrite=True, filetypes=[("WDL Files", "*.wdl")], initialfile=f"{initial_file_name}")
+            file_path = self._dialog(filedialog.asksaveasfilename, defaultextension=".wdl", confirmoverwrite=True, filetypes=[("WDL Files", "*.wdl")], initialfile=f"{initial_file_name}")
         except TypeError:
             return -1
         
-        try:
-            if file_path:
-                with open(file_path, 'w') as fd:
-                    fd.write(content)
-                    fd.close()
-                return 0
-            return -1
-        except Exception:
+        if not file_path:
             return -1
+
+        instrumentation = self._app.instrumentation
+        record = instrumentation.begin("save_as")
+
+        def save(task):
+            with instrumentation.phase("write", record):
+                lines = save_wdl_file(file_path, records, total, task, encoding)
+            # The file as just written is the version a watch compares against
+            try:
+                watcher.rebase()
+            except OSError:
+                pass
+            return lines
+
+        def saved(result, error):
+            if error is not None:
+                instrumentation.end(record, error=str(error))
+                messagebox.showerror("Save As", f"Could not write {file_path}:\n{error}")
+                return
+            instrumentation.end(record, lines=result)
+            document.path = file_path
+            self._app.mark_saved(document)
+            self._watchers[document] = watcher
+            if self._journal is not None:
+                self._journal.rebase(document)
+            if document is self._app.document:
+                self._follow_document()
+
+        # The model stays read-only until the task finishes, so the worker can stream it
+        document = self._app.document
+        records = self._app.records()
+        total = self._app.described_count
+        encoding = self._app.document.encoding
+        watcher = FileWatcher(file_path)
+        return self._start_task(f"Saving {os.path.basename(file_path)}", save, saved)
     
+    @property
+    def watch_enabled(self):
+        return self._watchEnabled
+
+    def _follow_document(self):
+        # Each document keeps its own watcher; switching tabs only changes which one is polled
+        documents = self._app.documents
+        for document in list(self._watchers):
+            # Closed documents, and ones New detached from their file, have nothing left to watch
+            if document.path is None or not any(document is open_document for open_document in documents):
+                del self._watchers[document]
+
+        document = self._app.document
+        if self._watchEnabled.get() and document.path is not None and self._watchers.get(document) is None:
+            # Nothing was loaded or saved here to compare against (a recovered document), so start from the file as it is now
+            watcher = self._watchers[document] = FileWatcher(document.path)
+            self._io_pool().submit(watcher.rebase)
+
+    def toggle_watch(self):
+        '''
+        Turns File > Watch File for Changes on or off.
+        '''
+        if not self._watchEnabled.get():
+            self._stop_watch()
+            return 0
+
+        if self._app.document.path is None:
+            self._watchEnabled.set(False)
+            messagebox.showinfo("Watch File", "Open or save a WDL file first.")
+            return -1
+        self._follow_document()
+        if self._watchPoll is None:
+            self._watchPoll = self.after(WATCH_POLL_MS, self._poll_watch)
+        return 0
+
+    def _stop_watch(self):
+        # A poll already in flight finishes on the pool and is dropped when it returns
+        if self._watchPoll is not None:
+            self.after_cancel(self._watchPoll)
+            self._watchPoll = None
+
+    def _poll_watch(self):
+        self._watchPoll = self.after(WATCH_POLL_MS, self._poll_watch)
+        # Leave the file alone while this window is reading or writing it; background tabs are polled when shown
+        watcher = self._watchers.get(self._app.document)
+        if watcher is None or self.busy or self._watchFuture is not None:
+            return
+        self._watchFuture = self._io_pool().submit(watcher.poll)
+        self.after(50, self._watch_polled, watcher)
+
+    def _watch_polled(self, watcher):
+        if not self._watchFuture.done():
+            self.after(50, self._watch_polled, watcher)
+            return
+        future, self._watchFuture = self._watchFuture, None
+        change = future.result() if future.exception() is None else None
+
+        # A change that cannot be applied now stays uncommitted, and the next poll finds it again
+        if change is None or self.busy or not self._watchEnabled.get():
+            return
+        if self._watchers.get(self._app.document) is not watcher or not watcher.commit(change):
+            return
+        if change.states:
+            # Selection and scroll position survive: the treeview only sees the changed lines
+            with self._app.instrumentation.action("reload"), self._app.instrumentation.phase("model"):
+                self._app.set_descriptions(change.states, label="reload")
+            self._current_selection = self._appletFrame.selected_line_ids()
+
+    @instrumented("clear")
     def clear(self):
-        self._app.clear_all_lines()
+        if self.busy:
+            self.bell()
+            return -1
+
+        with self._app.instrumentation.phase("model"):
+            self._app.clear_all_lines()
         self._appletFrame.clear()
-        self._current_selection = []
+        self._current_selection = self._appletFrame.selected_line_ids()
     
+    @instrumented("new")
     def new(self):
-        self._app.new()
+        if self.busy:
+            self.bell()
+            return -1
+
+        with self._app.instrumentation.phase("model"):
+            self._app.new()
         self._appletFrame.clear()
-        self._current_selection = []
+        self._current_selection = self._appletFrame.selected_line_ids()
+
+        # The new model no longer belongs to a file
+        self._app.document.path = None
+        self._follow_document()
     
+    @instrumented("add_line")
     def add_line(self):
-        user_input = simpledialog.askinteger("Enter", "Enter line number to add:")
+        if self.busy:
+            self.bell()
+            return -1
+
+        user_input = self._dialog(simpledialog.askinteger, "Enter", "Enter line number to add:")
         line_id = "Line " + str(user_input)
         if line_id in self._app.line_ids:
             return 0
         
-        self._app.add_line(line_id)
-        self._appletFrame.clear()
-        self._current_selection = []
+        with self._app.instrumentation.phase("model"):
+            self._app.add_line(line_id)
+        self._current_selection = self._appletFrame.selected_line_ids()
     
+    @instrumented("add_lines")
     def add_lines(self):
-        user_input = simpledialog.askstring("Enter", "Enter line numbers separated by commas:")
+        if self.busy:
+            self.bell()
+            return -1
+
+        user_input = self._dialog(simpledialog.askstring, "Enter", "Enter line numbers separated by commas:")
         
         def unique_integers(string):
             try:
@@ -380,62 +745,317 @@ class ApplicationWindow(tk.Tk):
                 return False
         
         if unique_integers(user_input):
-            for i in [int(num) for num in user_input.split(',')]:
-                line_id = "Line " + str(i)
-                if line_id in self._app.line_ids:
-                    continue
-                self._app.add_line(line_id)
-                self._appletFrame.clear()
-
-            self._current_selection = []
+            with self._app.instrumentation.phase("model"):
+                self._app.add_lines(["Line " + str(int(num)) for num in user_input.split(',')])
+            self._current_selection = self._appletFrame.selected_line_ids()
         
+    @instrumented("remove_lines")
     def remove_lines(self):
+        if self.busy:
+            self.bell()
+            return -1
+
         if len(self._current_selection) == 0:
             return -1
         
         result = ""
         if len(self._current_selection) == 1:
-            result = messagebox.askquestion("Remove Line",f"Are you sure you want to delete {self._current_selection[0]}?")
+            result = self._dialog(messagebox.askquestion, "Remove Line",f"Are you sure you want to delete {self._current_selection[0]}?")
         else:
-            result = messagebox.askquestion("Remove Lines",f"Are you sure you want to delete these lines?")
+            result = self._dialog(messagebox.askquestion, "Remove Lines",f"Are you sure you want to delete these lines?")
 
         if result == 'no':
             return -1
         
-        for selection in self._current_selection:
-            self._app.remove_line(selection)
-            self._appletFrame.clear()
+        with self._app.instrumentation.phase("model"), self._app.transaction():
+            for selection in self._current_selection:
+                self._app.remove_line(selection)
         
-        self._current_selection = []
+        self._current_selection = self._appletFrame.selected_line_ids()
 
         return 0
     
+    @instrumented("edit_line")
     def edit_line(self):
-        if len(self._current_selection) != 1:
+        if self.busy:
+            self.bell()
             return -1
 
-        description = simpledialog.askstring("Enter", f"Enter description for {self._current_selection[0]}:")
+        if len(self._current_selection) != 1:
+            return -1
 
-        def does_not_contain_special_characters(input_string):
-            pattern = re.compile(r'[@#.*?~\[\]-]')
-            match = pattern.search(input_string)
-            return match is None
+        description = self._dialog(simpledialog.askstring, "Enter", f"Enter description for {self._current_selection[0]}:")
         
-        if description is not None and does_not_contain_special_characters(description):
-            self._app.edit_line(self._current_selection[0], description)
-            self._appletFrame.clear()
-            self._current_selection = []
+        if description is not None and ILLEGAL_DESCRIPTION_PATTERN.search(description) is None:
+            with self._app.instrumentation.phase("model"):
+                self._app.edit_line(self._current_selection[0], description)
+            self._current_selection = self._appletFrame.selected_line_ids()
             return 0
         
         return -1
-        
+    
+    @instrumented("undo")
+    def undo(self):
+        if self.busy:
+            self.bell()
+            return -1
 
+        with self._app.instrumentation.phase("model"):
+            result = self._app.undo()
+        if result != 0:
+            self.bell()
+            return -1
+        self._current_selection = self._appletFrame.selected_line_ids()
+        return 0
+    
+    @instrumented("redo")
+    def redo(self):
+        if self.busy:
+            self.bell()
+            return -1
 
-        
+        with self._app.instrumentation.phase("model"):
+            result = self._app.redo()
+        if result != 0:
+            self.bell()
+            return -1
+        self._current_selection = self._appletFrame.selected_line_ids()
+        return 0
+    
+    @instrumented("paste_lines")
+    def paste_lines(self):
+        '''
+        Adds or updates lines from a tab-separated "line number, description"
+        block on the clipboard, e.g. two columns copied from Excel. The
+        block is applied as a whole or not at all.
+        '''
+        if self.busy:
+            self.bell()
+            return -1
 
+        try:
+            text = self.clipboard_get()
+        except tk.TclError:
+            self.bell()
+            return -1
+
+        with self._app.instrumentation.phase("parse"):
+            records, diagnostics = parse_pasted_lines(text)
+
+        if diagnostics:
+            details = "\n".join(str(diagnostic) for diagnostic in diagnostics[:10])
+            if len(diagnostics) > 10:
+                details += f"\n... and {len(diagnostics) - 10} more"
+            self._dialog(messagebox.showerror, "Paste Lines", f"Nothing was pasted; {len(diagnostics)} row(s) are invalid:\n\n{details}")
+            return -1
+        if not records:
+            self.bell()
+            return -1
+
+        with self._app.instrumentation.phase("model"):
+            self._app.set_descriptions(records)
+        self._current_selection = self._appletFrame.selected_line_ids()
+        return 0
+
+    def index_folder(self):
+        '''
+        Asks for a project folder and (re)indexes its WDL files for searching.
+        '''
+        if self.busy:
+            self.bell()
+            return -1
+
+        directory = self._dialog(filedialog.askdirectory, title="Choose project folder to index...")
+        if not directory:
+            return -1
+
+        def update(task):
+            # sqlite3 connections belong to the thread that opened them
+            index = ProjectIndex()
+            try:
+                return index.update(directory, task)
+            finally:
+                index.close()
+
+        def updated(stats, error):
+            if error is not None:
+                self._appletFrame.show_status(f"Could not index {os.path.basename(directory)}: {error}")
+                return
+            self._appletFrame.show_status(f"{stats['scanned']} WDL files scanned, {stats['indexed']} indexed, "
+                                          f"{stats['removed']} removed in {stats['seconds']:.2f}s.")
+
+        return self._start_task(f"Indexing {os.path.basename(directory)}", update, updated)
+
+    def search_projects(self):
+        '''
+        Searches the project index for a line description and lists the matches.
+        '''
+        query = simpledialog.askstring("Search Projects", "Find line descriptions containing:")
+        if not query:
+            return -1
+
+        index = ProjectIndex()
+        try:
+            rows = index.search(query)
+        finally:
+            index.close()
+
+        SearchResultsWindow(self, query, rows)
+        return 0
+
+    def compare_with_file(self):
+        '''
+        Shows the lines that differ between the current document and a WDL file.
+        '''
+        if self.busy:
+            self.bell()
+            return -1
+
+        file_path = self._dialog(filedialog.askopenfilename, defaultextension="wdl", title="Compare with WDL file...")
+        if not file_path:
+            return -1
+
+        def load(task):
+            return load_wdl_model(file_path)
+
+        def loaded(model, error):
+            if error is not None:
+                messagebox.showerror("Compare", f"Could not read {file_path}:\n{error}")
+                return
+            differences = diff_models(self._app, model)
+            if not differences:
+                messagebox.showinfo("Compare", f"{os.path.basename(file_path)} has the same lines.")
+                return
+            name = self._appletFrame.get_project_name()
+            DiffWindow(self, f"Compare: {name} / {os.path.basename(file_path)}", [name, os.path.basename(file_path)], differences)
+
+        return self._start_task(f"Reading {os.path.basename(file_path)}", load, loaded)
+
+    def merge_from_file(self):
+        '''
+        Three-way merges another copy of this title block into the current
+        document, given the version both were edited from. Conflicting
+        lines keep the current document's text and are listed afterwards.
+        '''
+        if self.busy:
+            self.bell()
+            return -1
+
+        theirs_path = self._dialog(filedialog.askopenfilename, defaultextension="wdl", title="Merge changes from WDL file...")
+        if not theirs_path:
+            return -1
+        base_path = self._dialog(filedialog.askopenfilename, defaultextension="wdl", title="Common original of both versions...")
+        if not base_path:
+            return -1
+
+        def load(task):
+            return load_wdl_model(base_path), load_wdl_model(theirs_path)
+
+        def loaded(result, error):
+            if error is not None:
+                messagebox.showerror("Merge", f"Could not read the files to merge:\n{error}")
+                return
+
+            base, theirs = result
+            with self._app.instrumentation.action("merge"), self._app.instrumentation.phase("model"):
+                states, conflicts = merge_changes(base, self._app, theirs)
+                self._app.set_descriptions(states, label="merge")
+            self._current_selection = self._appletFrame.selected_line_ids()
+
+            summary = f"Merged {len(states)} line(s) from {os.path.basename(theirs_path)}."
+            if conflicts:
+                messagebox.showwarning("Merge", f"{summary}\n\n{len(conflicts)} line(s) were changed on both sides; the current text was kept.")
+                DiffWindow(self, f"Merge conflicts: {os.path.basename(theirs_path)}", ["Original", "Current", "Theirs"], conflicts)
+            else:
+                messagebox.showinfo("Merge", summary)
+
+        return self._start_task(f"Reading {os.path.basename(theirs_path)}", load, loaded)
+
+    def save_as_template(self):
+        '''
+        Saves the current lines as a template; {{FIELD}} in a description is
+        filled in per project by Generate From Template.
+        '''
+        if self.busy:
+            self.bell()
+            return -1
+
+        if not self._app.has_output():
+            return -1
+
+        file_path = self._dialog(filedialog.asksaveasfilename, defaultextension=".wdlt", confirmoverwrite=True,
+                                 filetypes=[("WDL Templates", "*.wdlt")], title="Save as template...")
+        if not file_path:
+            return -1
+
+        def save(task):
+            return save_wdl_file(file_path, records, total, task, encoding)
+
+        def saved(result, error):
+            if error is not None:
+                messagebox.showerror("Save As Template", f"Could not write {file_path}:\n{error}")
+
+        records = self._app.records()
+        total = self._app.described_count
+        encoding = self._app.document.encoding
+        return self._start_task(f"Saving {os.path.basename(file_path)}", save, saved)
+
+    def generate_from_template(self):
+        '''
+        Writes one WDL file per row of a CSV or JSON table from a template.
+        '''
+        if self.busy:
+            self.bell()
+            return -1
+
+        template_path = self._dialog(filedialog.askopenfilename, title="Choose template...",
+                                     filetypes=[("WDL Templates", "*.wdlt"), ("WDL Files", "*.wdl")])
+        if not template_path:
+            return -1
+        table_path = self._dialog(filedialog.askopenfilename, title="Choose table of project values...",
+                                  filetypes=[("Tables", "*.csv *.json")])
+        if not table_path:
+            return -1
+        output_dir = self._dialog(filedialog.askdirectory, title="Choose output folder...")
+        if not output_dir:
+            return -1
+
+        def generate(task):
+            return run_template(WDLTemplate.load(template_path), load_table(table_path), output_dir, task=task)
+
+        def generated(result, error):
+            if error is not None:
+                messagebox.showerror("Generate From Template", f"Could not generate projects:\n{error}")
+                return
+            results, report = result
+            summary = (f"{report['succeeded']}/{report['projects']} projects written to {output_dir} "
+                       f"in {report['seconds']:.2f}s ({report['projects_per_second']:.0f} projects/s).")
+            failures = [f"{r['project'] or '(no name)'}: {r['error']}" for r in results if r["status"] != "ok"]
+            if failures:
+                more = f"\n...and {len(failures) - 10} more" if len(failures) > 10 else ""
+                messagebox.showwarning("Generate From Template", summary + "\n\n" + "\n".join(failures[:10]) + more)
+            else:
+                messagebox.showinfo("Generate From Template", summary)
+
+        return self._start_task(f"Generating from {os.path.basename(template_path)}", generate, generated)
+
+    def toggle_profile(self):
+        '''
+        Starts cProfile, or stops it and asks where to save the stats.
+        '''
+        instrumentation = self._app.instrumentation
+        if not instrumentation.profiling:
+            instrumentation.start_profile()
+            self._appletFrame.show_status("Profiling... choose Tools > Stop Profiling to save.")
+            return 0
+
+        file_path = filedialog.asksaveasfilename(defaultextension=".prof", filetypes=[("cProfile stats", "*.prof")], initialfile="wdl_builder.prof")
+        if not file_path:
+            return -1
+        instrumentation.stop_profile(file_path)
+        self._appletFrame.show_status(f"Profile saved to {os.path.basename(file_path)}")
+        return 0
 
-        
-        
 
 ###############################################################################################################
 ###############################################################################################################
@@ -453,9 +1073,15 @@ class ApplicationMenu(tk.Menu):
         # File Menu Items
         self._fileMenu = tk.Menu(self._menubar, tearoff=0)
         self._fileMenu.add_command(label="New", command=parent.new)
+        self._fileMenu.add_command(label="New Tab", accelerator="Ctrl+T", command=parent.new_tab)
+        self._fileMenu.add_command(label="Close Tab", accelerator="Ctrl+W", command=parent.close_tab)
         self._fileMenu.add_separator()
         self._fileMenu.add_command(label="Open...", command=parent.open)
         self._fileMenu.add_command(label="Save As...", command=parent.save_as)
+        self._fileMenu.add_checkbutton(label="Watch File for Changes", variable=parent.watch_enabled, command=parent.toggle_watch)
+        self._fileMenu.add_separator()
+        self._fileMenu.add_command(label="Save As Template...", command=parent.save_as_template)
+        self._fileMenu.add_command(label="Generate From Template...", command=parent.generate_from_template)
         self._fileMenu.add_separator()
         self._fileMenu.add_command(label="Clear Descriptions", command=parent.clear)
         self._fileMenu.add_command(label="Close", command=parent.kill)
@@ -463,14 +1089,130 @@ class ApplicationMenu(tk.Menu):
         self._menubar.add_cascade(label="File", menu = self._fileMenu)
 
         # Edit Menu Items
-        self._editMenu = tk.Menu(self._menubar, tearoff=0)
+        self._app = parent.app
+        self._editMenu = tk.Menu(self._menubar, tearoff=0, postcommand=self._update_undo_items)
+        self._editMenu.add_command(label="Undo", accelerator="Ctrl+Z", command=parent.undo)
+        self._editMenu.add_command(label="Redo", accelerator="Ctrl+Y", command=parent.redo)
+        self._editMenu.add_separator()
         self._editMenu.add_command(label="Add Line...", command=parent.add_line)
         self._editMenu.add_command(label="Add Lines...", command=parent.add_lines)
         self._editMenu.add_command(label="Modify Selected Line...", command=parent.edit_line)
         self._editMenu.add_command(label="Remove Selected Line(s)...", command=parent.remove_lines)
+        self._editMenu.add_separator()
+        self._editMenu.add_command(label="Paste Lines", accelerator="Ctrl+V", command=parent.paste_lines)
 
         self._menubar.add_cascade(label="Edit", menu=self._editMenu)
 
+        # Search Menu Items
+        self._searchMenu = tk.Menu(self._menubar, tearoff=0)
+        self._searchMenu.add_command(label="Index Project Folder...", command=parent.index_folder)
+        self._searchMenu.add_command(label="Search Projects...", command=parent.search_projects)
+
+        self._menubar.add_cascade(label="Search", menu=self._searchMenu)
+
+        # Compare Menu Items
+        self._compareMenu = tk.Menu(self._menubar, tearoff=0)
+        self._compareMenu.add_command(label="Compare With File...", command=parent.compare_with_file)
+        self._compareMenu.add_command(label="Merge From File...", command=parent.merge_from_file)
+
+        self._menubar.add_cascade(label="Compare", menu=self._compareMenu)
+
+        # Tools Menu Items (only with instrumentation switched on)
+        if parent.app.instrumentation.enabled:
+            self._toolsMenu = tk.Menu(self._menubar, tearoff=0)
+            self._toolsMenu.add_command(label="Start/Stop Profiling", command=parent.toggle_profile)
+
+            self._menubar.add_cascade(label="Tools", menu=self._toolsMenu)
+    
+    def _update_undo_items(self):
+        # Name the operation that will be undone/redone, e.g. "Undo Paste"
+        for index, action, label in ((0, "Undo", self._app.undo_label), (1, "Redo", self._app.redo_label)):
+            if label is None:
+                self._editMenu.entryconfigure(index, label=action, state='disabled')
+            else:
+                self._editMenu.entryconfigure(index, label=f"{action} {label.capitalize()}", state='normal')
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Search Results Window
+
+###############################################################################################################
+###############################################################################################################
+
+class SearchResultsWindow(tk.Toplevel):
+    def __init__(self, parent, query, rows):
+        tk.Toplevel.__init__(self, parent)
+        self.title(f"Search: {query}")
+        self.geometry("600x300")
+        self._parent = parent
+
+        self._tree = ttk.Treeview(self, columns=("1", "2", "3"), show='headings')
+        self._tree.heading("1", text="File")
+        self._tree.heading("2", text="Line #")
+        self._tree.heading("3", text="Description")
+        self._tree.column("1", width=300)
+        self._tree.column("2", width=60, anchor='c')
+        self._tree.column("3", width=220)
+
+        scrollbar = ttk.Scrollbar(self, orient='vertical', command=self._tree.yview)
+        self._tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        self._tree.pack(side='left', fill='both', expand=True)
+
+        for path, number, description in rows:
+            self._tree.insert("", 'end', values=(path, number, description))
+
+        # Double-click opens the file in the builder
+        self._tree.bind("<Double-1>", self._open_selected)
+
+    def _open_selected(self, event):
+        selection = self._tree.selection()
+        if len(selection) == 1:
+            self._parent.open_path(self._tree.item(selection[0])["values"][0])
+
+
+class DiffWindow(tk.Toplevel):
+    '''
+    Side-by-side listing of the lines that differ between two models, or
+    of merge conflicts. rows are (line_number, description, ...) tuples
+    matching headings; None descriptions are shown as absent.
+    '''
+    def __init__(self, parent, title, headings, rows):
+        tk.Toplevel.__init__(self, parent)
+        self.title(title)
+        self.geometry("600x300")
+
+        columns = [str(i) for i in range(1, len(headings) + 2)]
+        self._tree = ttk.Treeview(self, columns=columns, show='headings')
+        self._tree.heading("1", text="Line #")
+        self._tree.column("1", width=60, anchor='c')
+        for column, heading in zip(columns[1:], headings):
+            self._tree.heading(column, text=heading)
+            self._tree.column(column, width=540 // len(headings))
+
+        self._tree.tag_configure("added", background="#e6ffec")
+        self._tree.tag_configure("removed", background="#ffebe9")
+        self._tree.tag_configure("changed", background="#fff8c5")
+
+        scrollbar = ttk.Scrollbar(self, orient='vertical', command=self._tree.yview)
+        self._tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        self._tree.pack(side='left', fill='both', expand=True)
+
+        for number, *descriptions in rows:
+            if len(descriptions) != 2:
+                tag = "changed"
+            elif descriptions[0] is None:
+                tag = "added"
+            elif descriptions[1] is None:
+                tag = "removed"
+            else:
+                tag = "changed"
+            values = [number] + ["(absent)" if description is None else description for description in descriptions]
+            self._tree.insert("", 'end', values=values, tags=(tag,))
+
 
 
 ###############################################################################################################
@@ -542,6 +1284,14 @@ class CustomButton(ttk.Button):
 ###############################################################################################################
 
 class CustomTreeview(ttk.Treeview):
+    '''
+    Virtual-scrolling treeview over Application.line_ids. Only the rows in
+    the viewport plus a small buffer on either side exist as Tk items; the
+    scrollbar is driven in model coordinates and the materialized window
+    slides as the view approaches its edges.
+    '''
+    _buffer = 25
+
     def __init__(self, app:Application, parent, columns=[], binding_function=None):
         self._app = app
 
@@ -549,11 +1299,33 @@ class CustomTreeview(ttk.Treeview):
             raise ValueError("Can't build treeview without columns")
         
         ttk.Treeview.__init__(self, parent)
-        
-        if binding_function is not None:
-            self.bind("<<TreeviewSelect>>", binding_function)
+
+        self._binding_function = binding_function
+        self._scrollbar = None
+
+        # First model row in the viewport, and the materialized slice [start, end)
+        self._top = 0
+        self._start = 0
+        self._end = 0
+        self._rendering = False
+        self._recenter_pending = False
+
+        # Line numbers matching the filter entry, or None to show every line
+        self._filtered = None
+
+        # Selected line ids, including rows currently scrolled out of the window
+        self._selected = set()
+        self._replace_selection = False
+
+        self.bind("<<TreeviewSelect>>", self._on_select)
+        self.bind("<Button-1>", self._on_plain_select)
+        self.bind("<Control-Button-1>", self._on_extend_select)
+        self.bind("<Shift-Button-1>", self._on_extend_select)
+        self.bind("<KeyPress-Up>", self._on_plain_select)
+        self.bind("<KeyPress-Down>", self._on_plain_select)
 
         self.configure(height=10)
+        self.configure(yscrollcommand=self._on_local_scroll)
 
         # Configure and add column IDs to treeview
         column_ids = []
@@ -568,16 +1340,193 @@ class CustomTreeview(ttk.Treeview):
         for c_id in range(0, len(column_ids)):
             self.heading(str(c_id+1), text=columns[c_id])
 
+    @property
+    def visible_rows(self):
+        return int(self.cget("height"))
+
     def add_vertical_scrollbar(self, scrollbar:ttk.Scrollbar):
-        self.configure(yscrollcommand=scrollbar.set_scrollbar())
+        self._scrollbar = scrollbar
+        self._report_scroll()
+
+    def selected_line_ids(self):
+        '''
+        Returns every selected line id in line order, whether or not its row
+        is currently materialized.
+        '''
+        return sorted(self._selected, key=line_number)
 
     def populate(self):
-        self.delete(*self.get_children())
+        self._render(self._top)
 
-        for i in range(0, len(self._app.line_ids)):
-            text = self._app.line_ids[i]
-            value = self._app.lines[text]
-            self.insert("", 'end', text=text, values=(text, value))
+    def set_filter(self, numbers, change:LineChange=None):
+        '''
+        Shows only the given sorted line numbers, or every line for None.
+        change is the model change that prompted the refilter, if any.
+        '''
+        if change is not None:
+            if change.reset:
+                self._selected.clear()
+            else:
+                self._selected.difference_update(change.deleted)
+
+        self._filtered = numbers
+        self._render(0 if numbers is not None and change is None else self._top)
+
+    def _row_count(self):
+        if self._filtered is not None:
+            return len(self._filtered)
+        return len(self._app.line_ids)
+
+    def _row_slice(self, start, end):
+        if self._filtered is not None:
+            return [f"Line {number}" for number in self._filtered[start:end]]
+        return self._app.line_ids[start:end]
+
+    def scroll_to(self, top):
+        '''
+        Moves the viewport so model row top is the first visible row.
+        '''
+        top = self._clamp(top)
+        height = self.visible_rows
+        if top < self._start or top + height > self._end or self._near_edge(top):
+            self._render(top)
+        else:
+            self._top = top
+            self._show_local(top)
+        self._report_scroll()
+
+    def yview(self, *args):
+        '''
+        Scroll command for CustomTreeviewScrollbarY, in model coordinates.
+        '''
+        row_count = self._row_count()
+        if len(args) == 0:
+            if row_count == 0:
+                return (0.0, 1.0)
+            return (self._top / row_count, min(1.0, (self._top + self.visible_rows) / row_count))
+
+        if args[0] == 'moveto':
+            self.scroll_to(int(float(args[1]) * row_count))
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= self.visible_rows
+            self.scroll_to(self._top + amount)
+
+    def apply_changes(self, change:LineChange):
+        '''
+        Applies a model LineChange. Edits touch at most one materialized row;
+        inserts and removals shift rows, so only the small materialized
+        window is rebuilt. Neither depends on the size of the file.
+        '''
+        if change.reset:
+            self._selected.clear()
+            self._filtered = None
+            self._render(0)
+            return
+
+        self._selected.difference_update(change.deleted)
+
+        if change.inserted or change.deleted:
+            self._render(self._anchored_top())
+            return
+
+        for text in change.updated:
+            if self.exists(text):
+                self.item(text, values=(text, self._app.lines[text]))
+
+    def _anchored_top(self):
+        # Keeps the first visible line in place when rows are inserted or removed above it
+        children = self.get_children()
+        offset = self._top - self._start
+        if self._filtered is None and 0 <= offset < len(children) and children[offset] in self._app.lines:
+            return self._app.line_ids.index(children[offset])
+        return self._top
+
+    def _clamp(self, top):
+        return max(0, min(top, self._row_count() - self.visible_rows))
+
+    def _near_edge(self, top):
+        margin = self._buffer // 2
+        row_count = self._row_count()
+        near_start = self._start > 0 and top - self._start < margin
+        near_end = self._end < row_count and self._end - (top + self.visible_rows) < margin
+        return near_start or near_end
+
+    def _render(self, top):
+        # Rebuilds the materialized window around model row top
+        lines = self._app.lines
+        top = self._clamp(top)
+
+        self._rendering = True
+        try:
+            # Deleting the focus row clears Tk's focus item, and the arrow key bindings do nothing without one
+            focus = self.focus()
+            self.delete(*self.get_children())
+
+            self._top = top
+            self._start = max(0, top - self._buffer)
+            self._end = min(self._row_count(), top + self.visible_rows + self._buffer)
+
+            # Line ids double as item iids so edits can be applied row by row
+            for text in self._row_slice(self._start, self._end):
+                self.insert("", 'end', iid=text, text=text, values=(text, lines[text]))
+
+            materialized = [text for text in self._selected if self.exists(text)]
+            if len(materialized) > 0:
+                self.selection_set(materialized)
+            if focus and self.exists(focus):
+                self.focus(focus)
+
+            self._show_local(top)
+        finally:
+            self._rendering = False
+
+        self._report_scroll()
+
+    def _show_local(self, top):
+        count = self._end - self._start
+        if count > 0:
+            ttk.Treeview.yview(self, 'moveto', (top - self._start) / count)
+
+    def _on_local_scroll(self, first, last):
+        # Tk reports scrolling within the materialized rows (mouse wheel, keys)
+        if self._rendering:
+            return
+
+        count = self._end - self._start
+        self._top = self._start + int(float(first) * count + 0.5)
+        if self._near_edge(self._top) and not self._recenter_pending:
+            self._recenter_pending = True
+            self.after_idle(self._recenter)
+        self._report_scroll()
+
+    def _recenter(self):
+        self._recenter_pending = False
+        self._render(self._top)
+
+    def _report_scroll(self):
+        if self._scrollbar is not None:
+            self._scrollbar.set(*self.yview())
+
+    def _on_plain_select(self, event):
+        # A plain click or arrow key replaces the selection, even off-window
+        self._replace_selection = True
+
+    def _on_extend_select(self, event):
+        self._replace_selection = False
+
+    def _on_select(self, event):
+        current = set(self.selection())
+        if self._replace_selection:
+            self._selected = current
+            self._replace_selection = False
+        else:
+            materialized = {text for text in self._selected if self.exists(text)}
+            self._selected = (self._selected - materialized) | current
+
+        if self._binding_function is not None:
+            self._binding_function(event)
 
 ###############################################################################################################
 ###############################################################################################################
@@ -589,12 +1538,11 @@ class CustomTreeview(ttk.Treeview):
 
 class CustomTreeviewScrollbarY(ttk.Scrollbar):
     def __init__(self, app:Application, parent, treeview:ttk.Treeview):
+        # treeview.yview works in model rows, so the thumb spans the whole file
         ttk.Scrollbar.__init__(self, parent, orient='vertical', command=treeview.yview)
     
-    def set_scrollbar(self):
-        return self.set
-    
+
 
 
 if __name__ == "__main__":
-    app = Application()
\ No newline at end of file
+    sys.exit(main(window=ApplicationWindow))
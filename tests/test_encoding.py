@@ -0,0 +1,76 @@
+import codecs
+import io
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wdl_core import DEFAULT_WDL_ENCODING, load_wdl_file, sniff_wdl_encoding, write_wdl
+
+
+class SniffEncodingTest(unittest.TestCase):
+    def sniff(self, data, chunk_size=1 << 16):
+        raw = io.BytesIO(data)
+        encoding = sniff_wdl_encoding(raw, chunk_size)
+        # The reader starts from the top again
+        self.assertEqual(raw.tell(), 0)
+        return encoding
+
+    def test_bom_is_decisive(self):
+        self.assertEqual(self.sniff(codecs.BOM_UTF8 + b"LINE1=A\n"), 'utf-8-sig')
+        self.assertEqual(self.sniff(codecs.BOM_UTF16_LE + "LINE1=A\n".encode('utf-16-le')), 'utf-16')
+        self.assertEqual(self.sniff(codecs.BOM_UTF16_BE + "LINE1=A\n".encode('utf-16-be')), 'utf-16')
+        # Even ahead of bytes that would say otherwise
+        self.assertEqual(self.sniff(codecs.BOM_UTF8 + "LINE1=\xe9\n".encode('cp1252')), 'utf-8-sig')
+
+    def test_utf16_without_bom(self):
+        self.assertEqual(self.sniff("LINE1=A\nLINE2=é\n".encode('utf-16-le')), 'utf-16-le')
+        self.assertEqual(self.sniff("LINE1=A\nLINE2=é\n".encode('utf-16-be')), 'utf-16-be')
+
+    def test_eight_bit_text(self):
+        self.assertEqual(self.sniff(b""), DEFAULT_WDL_ENCODING)
+        self.assertEqual(self.sniff(b"LINE1=A\n"), DEFAULT_WDL_ENCODING)
+        self.assertEqual(self.sniff("LINE1=café\n".encode('utf-8')), 'utf-8')
+        self.assertEqual(self.sniff("LINE1=café\n".encode('cp1252')), 'cp1252')
+
+    def test_non_ascii_after_the_first_chunk(self):
+        text = "LINE1=A\n" * 100 + "LINE101=é\n"
+        self.assertEqual(self.sniff(text.encode('utf-8'), chunk_size=64), 'utf-8')
+        self.assertEqual(self.sniff(text.encode('cp1252'), chunk_size=64), 'cp1252')
+
+    def test_sequences_split_across_chunks(self):
+        data = ("LINE1=" + "€" * 40 + "\n").encode('utf-8')
+        for chunk_size in range(1, 40):
+            self.assertEqual(self.sniff(data, chunk_size), 'utf-8', chunk_size)
+
+    def test_random_text(self):
+        rng = random.Random(15)
+        alphabet = "LINE=0123456789 ABCabc\n" * 4 + "éü€ŠÆ"
+        for _ in range(2000):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60)))
+            chunk_size = rng.randint(1, 32)
+            expected = DEFAULT_WDL_ENCODING if text.isascii() else 'utf-8'
+            self.assertEqual(self.sniff(text.encode('utf-8'), chunk_size), expected, repr(text))
+            # ü, × and þ are bytes no UTF-8 text can contain where they stand (some cp1252 pairs, like ÆŠ, are valid UTF-8)
+            text = text.translate(str.maketrans("é€ŠÆ", "üü×þ"))
+            expected = DEFAULT_WDL_ENCODING if text.isascii() else 'cp1252'
+            self.assertEqual(self.sniff(text.encode('cp1252'), chunk_size), expected, repr(text))
+
+
+class EncodingRoundTripTest(unittest.TestCase):
+    def test_files_read_back_in_their_encoding(self):
+        records = [(1, "TITLE"), (2, "café"), (3, "€ 5")]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "TEST_wdtitle.wdl")
+            for encoding in ['cp1252', 'utf-8', 'utf-8-sig', 'utf-16']:
+                write_wdl(path, records, encoding=encoding)
+                loaded, reader = load_wdl_file(path)
+                self.assertEqual(loaded, records, encoding)
+                self.assertEqual(reader.encoding, encoding)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wdl_core import Application, SessionJournal, load_journal, load_wdl_file, write_wdl
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self._directory.name, "session")
+        self.app = Application(headless=True)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def start(self, **options):
+        journal = SessionJournal(self.app, self.directory, **options)
+        journal.start()
+        self.addCleanup(journal.close, True)
+        return journal
+
+    def replay(self):
+        # What the next launch would recover, one (header, model) per journal
+        recovered = []
+        for path in SessionJournal.journal_paths(self.directory):
+            header, records, warnings = load_journal(path)
+            self.assertEqual(warnings, [])
+            recovered.append((header, dict(records)))
+        return recovered
+
+    def open_file(self, journal, name, records, encoding):
+        # What the window does on File > Open
+        path = os.path.join(self._directory.name, f"{name}_wdtitle.wdl")
+        write_wdl(path, records, encoding=encoding)
+        loaded, reader = load_wdl_file(path)
+        journal.expect_base(path)
+        self.app.import_records(loaded, encoding=reader.encoding)
+        self.app.document.path = path
+        self.app.document.name = name.lower()
+        return path
+
+    def test_snapshot_replay(self):
+        journal = self.start()
+        self.app.edit_line("Line 1", "TITLE")
+        self.app.remove_line("Line 2")
+        self.app.set_descriptions([(30, "NEW"), (3, "C")])
+        journal.flush()
+
+        [(header, model)] = self.replay()
+        self.assertIsNone(header["base"])
+        self.assertEqual(model, dict(self.app.items()))
+
+    def test_file_base_replay_restores_header(self):
+        journal = self.start()
+        path = self.open_file(journal, "PROJ", [(1, "A"), (2, "é")], "utf-8")
+        self.app.edit_line("Line 2", "B")
+        self.app.add_line("Line 9")
+        journal.flush()
+
+        [(header, model)] = self.replay()
+        self.assertEqual((header["base"], header["name"], header["path"], header["encoding"]),
+                         (os.path.abspath(path), "proj", path, "utf-8"))
+        self.assertEqual(model, dict(self.app.items()))
+
+    def test_compaction_keeps_net_changes(self):
+        journal = self.start(batch_size=4, compact_after=10)
+        self.open_file(journal, "PROJ", [(number, f"D{number}") for number in range(1, 50)], "cp1252")
+        for step in range(200):
+            self.app.edit_line(f"Line {step % 60 + 1}", f"E{step}")
+            self.app.remove_line(f"Line {step % 7 + 1}")
+        journal.flush()
+
+        [(header, model)] = self.replay()
+        self.assertEqual(model, dict(self.app.items()))
+        self.assertEqual(header["name"], "proj")
+
+    def test_half_written_entry_is_ignored(self):
+        journal = self.start()
+        self.app.edit_line("Line 1", "KEPT")
+        journal.flush()
+        expected = dict(self.app.items())
+        [path] = SessionJournal.journal_paths(self.directory)
+        with open(path, 'a') as fd:
+            fd.write("1\tLOS")
+
+        [(_, model)] = self.replay()
+        self.assertEqual(model, expected)
+
+    def test_every_tab_is_recoverable(self):
+        journal = self.start()
+        self.app.edit_line("Line 1", "FIRST")
+        self.app.new_document("second")
+        path = self.open_file(journal, "SECOND", [(1, "S")], "utf-16")
+        self.app.edit_line("Line 1", "SS")
+        self.app.new_document("third")
+        self.app.edit_line("Line 2", "THIRD")
+        self.app.switch_document(0)
+        # A background tab's edits were journaled before the switch
+        self.app.edit_line("Line 3", "BACK")
+        journal.flush()
+
+        expected = []
+        for index in range(3):
+            self.app.switch_document(index)
+            expected.append((self.app.document.name, dict(self.app.items())))
+        recovered = self.replay()
+        self.assertEqual([(header["name"], model) for header, model in recovered], expected)
+        self.assertEqual((recovered[1][0]["path"], recovered[1][0]["encoding"]), (path, "utf-16"))
+
+        self.app.close_document(1)
+        journal.flush()
+        self.assertEqual([header["name"] for header, _ in self.replay()], ["default", "third"])
+
+    def test_random_sessions(self):
+        rng = random.Random(15)
+        for _ in range(10):
+            self.app = Application(headless=True)
+            journal = SessionJournal(self.app, self.directory, batch_size=rng.randint(1, 8), compact_after=rng.randint(1, 30))
+            journal.start()
+            for step in range(300):
+                number = rng.randint(1, 30)
+                operation = rng.random()
+                if operation < 0.5:
+                    self.app.edit_line(f"Line {number}", rng.choice(["", "A", "B\tC"]))
+                elif operation < 0.6:
+                    self.app.add_line(f"Line {number}")
+                elif operation < 0.7:
+                    self.app.remove_line(f"Line {number}")
+                elif operation < 0.75:
+                    self.app.import_records([(rng.randint(1, 30), "I") for _ in range(rng.randint(0, 5))])
+                elif operation < 0.85:
+                    self.app.undo()
+                elif operation < 0.9:
+                    self.app.redo()
+                else:
+                    journal.flush()
+            journal.flush()
+
+            [(_, model)] = self.replay()
+            self.assertEqual(model, dict(self.app.items()))
+            journal.close(discard=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import io
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wdl_core import WDLReader, lint_wdl_rows, lint_wdl_text, parse_pasted_lines
+
+
+class LintTest(unittest.TestCase):
+    def assertAgree(self, text):
+        # The fast path may only skip files the row-by-row check passes
+        self.assertEqual(self.summary(lint_wdl_text(text)), self.summary(lint_wdl_rows(text)), repr(text))
+
+    def summary(self, result):
+        findings, counts = result
+        return [(finding.row, finding.code, finding.text) for finding in findings], counts
+
+    def test_every_character(self):
+        # Catches the fast path's character set drifting from the rules'
+        for code in range(0x3000):
+            self.assertAgree(f"LINE1=a{chr(code)}b\nLINE2=c\n")
+
+    def test_random_files(self):
+        rng = random.Random(22)
+        pieces = ["LINE", "line ", "1", "0", "7", "4294967296", "=", "==", "A", " ", "-", "#", "\x07", "\x0c",
+                  "\t", "\r", "\n", "\n", "\n", "�", "é"]
+        for _ in range(3000):
+            self.assertAgree("".join(rng.choice(pieces) for _ in range(rng.randint(0, 30))))
+
+    def test_reader_reports_what_lint_does(self):
+        text = "LINE1=OK\nLINE2=A-B\nLINE3=bell\x07\nLINE 0=zero\nno separator\nLINEx=key\nLINE5=a\x0c#\n"
+        reader = WDLReader(io.StringIO(text))
+        records = list(reader)
+        findings, counts = lint_wdl_text(text)
+
+        self.assertEqual(records, [(1, "OK"), (2, "A-B"), (3, "bell\x07"), (5, "a\x0c#")])
+        self.assertEqual(sorted((d.row, d.code) for d in reader.diagnostics + reader.warnings),
+                         sorted((finding.row, finding.code) for finding in findings))
+        self.assertEqual(reader.warning_count, 3)
+        self.assertEqual(counts["control-character"], 2)
+
+    def test_pasted_rows_use_the_same_rules(self):
+        records, diagnostics = parse_pasted_lines("1\tTITLE\n0\tzero\n4294967296\tbig\n3\tA-B\n4\tbell\x07")
+        self.assertEqual(records, [(1, "TITLE"), (3, "A-B"), (4, "bell\x07")])
+        self.assertEqual([(d.row, d.code) for d in diagnostics],
+                         [(2, "zero-line-number"), (3, "line-number-range"), (4, "illegal-character"), (5, "control-character")])
+
+
+if __name__ == '__main__':
+    unittest.main()
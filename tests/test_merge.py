@@ -0,0 +1,77 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wdl_core import LineIndex, merge_changes, merge_models
+
+
+def model(lines):
+    return LineIndex(lines.keys(), lines)
+
+
+class MergeTest(unittest.TestCase):
+    def expected_merge(self, base, ours, theirs):
+        # Line by line: whichever side changed the line wins, and ours wins a conflict
+        merged, conflicts = {}, []
+        for number in sorted(base.keys() | ours.keys() | theirs.keys()):
+            original, mine, other = base.get(number), ours.get(number), theirs.get(number)
+            if mine == original:
+                result = other
+            else:
+                result = mine
+                if other != original and other != mine:
+                    conflicts.append((number, original, mine, other))
+            if result is not None:
+                merged[number] = result
+        return merged, conflicts
+
+    def apply(self, lines, states):
+        lines = dict(lines)
+        for number, description in states:
+            if description is None:
+                lines.pop(number, None)
+            else:
+                lines[number] = description
+        return lines
+
+    def test_examples(self):
+        base = {1: "TITLE", 2: "CLIENT", 3: "JOB", 4: "OLD"}
+        ours = {1: "TITLE", 2: "OUR CLIENT", 3: "JOB", 4: "OLD", 5: "OURS"}
+        theirs = {1: "THEIR TITLE", 2: "THEIR CLIENT", 3: "JOB", 6: "THEIRS"}
+        states, conflicts = merge_changes(model(base), model(ours), model(theirs))
+        self.assertEqual(sorted(states), [(1, "THEIR TITLE"), (4, None), (6, "THEIRS")])
+        self.assertEqual(conflicts, [(2, "CLIENT", "OUR CLIENT", "THEIR CLIENT")])
+
+        merged, conflicts = merge_models(model(base), model(ours), model(theirs))
+        self.assertEqual(dict(merged.items()), {1: "THEIR TITLE", 2: "OUR CLIENT", 3: "JOB", 5: "OURS", 6: "THEIRS"})
+
+    def test_same_change_on_both_sides_is_not_a_conflict(self):
+        base = {1: "A", 2: "B"}
+        both = {1: "X"}
+        self.assertEqual(merge_changes(model(base), model(both), model(both)), ([], []))
+
+    def test_random_merges(self):
+        rng = random.Random(15)
+
+        def edit(lines):
+            lines = dict(lines)
+            for _ in range(rng.randint(0, 6)):
+                number = rng.randint(1, 12)
+                if rng.random() < 0.3:
+                    lines.pop(number, None)
+                else:
+                    lines[number] = rng.choice(["", "A", "B", "C"])
+            return lines
+
+        for _ in range(3000):
+            base = edit({})
+            ours, theirs = edit(base), edit(base)
+            states, conflicts = merge_changes(model(base), model(ours), model(theirs))
+            self.assertEqual((self.apply(ours, states), conflicts), self.expected_merge(base, ours, theirs))
+
+
+if __name__ == '__main__':
+    unittest.main()
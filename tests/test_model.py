@@ -0,0 +1,195 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wdl_core import Application, LineIndex
+
+
+class LineIndexTest(unittest.TestCase):
+    def assertMatches(self, index, expected):
+        numbers = sorted(expected)
+        self.assertEqual(len(index), len(numbers))
+        self.assertEqual(list(index), numbers)
+        self.assertEqual(list(index.items()), [(number, expected[number]) for number in numbers])
+        self.assertEqual(index.count_described(), sum(1 for description in expected.values() if description != ""))
+        # Every chunk is sorted, non-empty and capped at twice the load, and its maximum is cached
+        self.assertEqual(index._maxes, [chunk[-1] for chunk in index._chunks])
+        for chunk, values in zip(index._chunks, index._values):
+            self.assertTrue(0 < len(chunk) <= 2 * index._load)
+            self.assertEqual(len(chunk), len(values))
+        for position, number in enumerate(numbers):
+            self.assertEqual(index[position], number)
+            self.assertEqual(index.position(number), position)
+        self.assertEqual(index[3:17], numbers[3:17])
+
+    def test_random_operations(self):
+        # A tiny load makes chunks split and empty out every few operations
+        rng = random.Random(15)
+        for _ in range(20):
+            index = LineIndex()
+            index._load = rng.choice([1, 2, 4])
+            expected = {}
+            for _ in range(400):
+                number = rng.randint(1, 60)
+                operation = rng.random()
+                if operation < 0.4:
+                    description = rng.choice(["", "A", "B"])
+                    self.assertEqual(index.add(number, description), number not in expected)
+                    expected.setdefault(number, description)
+                elif operation < 0.7:
+                    self.assertEqual(index.pop(number), expected.pop(number, None))
+                elif operation < 0.85:
+                    self.assertEqual(index.set(number, "S"), expected.get(number))
+                    if number in expected:
+                        expected[number] = "S"
+                else:
+                    numbers = [rng.randint(1, 60) for _ in range(rng.randint(0, 12))]
+                    new_numbers = index.add_many(numbers)
+                    self.assertEqual(new_numbers, sorted(set(numbers) - expected.keys()))
+                    for number in new_numbers:
+                        expected[number] = ""
+                self.assertEqual(number in index, number in expected)
+            self.assertMatches(index, expected)
+
+    def test_split_and_empty_chunks(self):
+        index = LineIndex()
+        index._load = 2
+        for number in range(1, 11):
+            index.add(number, str(number))
+        self.assertGreater(len(index._chunks), 1)
+        self.assertMatches(index, {number: str(number) for number in range(1, 11)})
+
+        for number in range(1, 11, 2):
+            index.remove(number)
+        for number in (2, 4):
+            index.remove(number)
+        self.assertMatches(index, {number: str(number) for number in (6, 8, 10)})
+
+        for number in (6, 8, 10):
+            index.remove(number)
+        self.assertEqual((len(index), index._chunks), (0, []))
+        self.assertTrue(index.add(5))
+        self.assertMatches(index, {5: ""})
+
+    def test_bulk_merge(self):
+        # Enough new numbers to take the single-pass merge rather than one add each
+        index = LineIndex(range(0, 3000, 3), {number: "D" for number in range(0, 3000, 6)})
+        new_numbers = index.add_many(range(0, 3000, 2))
+        self.assertEqual(new_numbers, [number for number in range(0, 3000, 2) if number % 3 != 0])
+        expected = {number: "" for number in range(0, 3000) if number % 2 == 0 or number % 3 == 0}
+        expected.update((number, "D") for number in range(0, 3000, 6))
+        self.assertMatches(index, expected)
+
+    def test_copy_is_independent(self):
+        index = LineIndex([1, 2, 3], {2: "B"})
+        clone = index.copy()
+        clone.set(2, "X")
+        clone.add(4)
+        self.assertEqual(dict(index.items()), {1: "", 2: "B", 3: ""})
+        self.assertEqual(dict(clone.items()), {1: "", 2: "X", 3: "", 4: ""})
+
+
+class ApplicationTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Application(headless=True)
+
+    def state(self):
+        return dict(self.app.items())
+
+    def assertDescribed(self):
+        self.assertEqual(self.app.described_count, sum(1 for description in self.app.lines.values() if description != ""))
+
+    def test_rollback_after_wholesale_replace(self):
+        self.app.import_records([(1, "A"), (2, "B"), (5, "E")])
+        before = self.state()
+        undo_label = self.app.undo_label
+        with self.assertRaises(RuntimeError):
+            with self.app.transaction("edit"):
+                self.app.edit_line("Line 1", "CHANGED")
+                self.app.remove_line("Line 2")
+                self.app.import_records([(9, "Z")])
+                self.app.edit_line("Line 9", "ZZ")
+                raise RuntimeError
+        self.assertEqual(self.state(), before)
+        self.assertEqual(self.app.undo_label, undo_label)
+        self.assertDescribed()
+
+    def test_undo_redo_of_imports(self):
+        self.app.edit_line("Line 3", "BEFORE")
+        states = [self.state()]
+        self.app.import_records([(1, "A"), (7, "G")])
+        states.append(self.state())
+        self.app.edit_line("Line 7", "EDITED")
+        states.append(self.state())
+        self.app.import_records([(2, "B")])
+        states.append(self.state())
+
+        for state in reversed(states[:-1]):
+            self.assertEqual(self.app.undo(), 0)
+            self.assertEqual(self.state(), state)
+            self.assertDescribed()
+        for state in states[1:]:
+            self.assertEqual(self.app.redo(), 0)
+            self.assertEqual(self.state(), state)
+            self.assertDescribed()
+        self.assertEqual(self.app.redo(), -1)
+
+    def test_described_count_follows_random_edits(self):
+        rng = random.Random(15)
+        expected = self.state()
+        for step in range(2000):
+            number = rng.randint(1, 40)
+            line_id = f"Line {number}"
+            operation = rng.random()
+            if operation < 0.3:
+                description = rng.choice(["", "A", "B"])
+                if self.app.edit_line(line_id, description) == 0:
+                    expected[number] = description
+            elif operation < 0.45:
+                self.app.add_line(line_id)
+                expected.setdefault(number, "")
+            elif operation < 0.6:
+                self.app.remove_line(line_id)
+                expected.pop(number, None)
+            elif operation < 0.7:
+                records = [(rng.randint(1, 40), rng.choice([None, "", "P"])) for _ in range(rng.randint(1, 5))]
+                self.app.set_descriptions(records)
+                for record_number, description in records:
+                    if description is None:
+                        expected.pop(record_number, None)
+                    else:
+                        expected[record_number] = description
+            elif operation < 0.75:
+                self.app.clear_all_lines()
+                expected = dict.fromkeys(expected, "")
+            elif operation < 0.8:
+                records = [(rng.randint(1, 40), rng.choice(["", "I"])) for _ in range(rng.randint(0, 8))]
+                self.app.import_records(records)
+                expected = dict(records)
+            elif operation < 0.9:
+                self.app.undo()
+                expected = self.state()
+            else:
+                self.app.redo()
+                expected = self.state()
+            self.assertEqual(self.state(), expected, step)
+            self.assertDescribed()
+
+    def test_described_count_survives_tab_switches(self):
+        self.app.import_records([(1, "A"), (2, ""), (3, "C")])
+        self.app.new_document()
+        self.app.edit_line("Line 1", "X")
+        self.assertEqual(self.app.described_count, 1)
+        self.app.switch_document(0)
+        self.assertEqual(self.app.described_count, 2)
+        self.app.remove_line("Line 1")
+        self.app.close_document(1)
+        self.assertEqual(self.app.described_count, 1)
+        self.assertDescribed()
+
+
+if __name__ == '__main__':
+    unittest.main()
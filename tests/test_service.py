@@ -0,0 +1,109 @@
+import http.client
+import json
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wdl_core import WDLService, make_service_server
+
+
+class ServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.service = WDLService(max_documents=2)
+        # Port 0 binds a free port on localhost
+        self.server = make_service_server(self.service, 0, workers=4)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        self.connection = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=10)
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+    def request(self, method, path, body=None):
+        self.connection.request(method, path, body=None if body is None else json.dumps(body),
+                                headers={"Content-Type": "application/json"})
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_health(self):
+        self.assertEqual(self.request("GET", "/health"), (200, {"status": "ok"}))
+
+    def test_generate(self):
+        status, payload = self.request("POST", "/generate", {"lines": {"1": "TITLE", "3": "X"}, "edits": [[2, "NEW"], [3, None]]})
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["output"].splitlines(), ["LINE1=TITLE", "LINE2=NEW"])
+        self.assertEqual(payload["lines"], 2)
+
+    def test_document_lifecycle(self):
+        status, payload = self.request("POST", "/documents", {"lines": [[1, "A"], [2, "B"]]})
+        self.assertEqual(status, 200)
+        path = f"/documents/{payload['id']}"
+
+        self.assertEqual(self.request("POST", path + "/edit", {"lines": {"2": "BB", "1": None}})[0], 200)
+        self.assertEqual(self.request("GET", path + "/output")[1]["output"].splitlines(), ["LINE2=BB"])
+        self.assertEqual(self.request("POST", path + "/import", {"lines": {"5": "E"}})[0], 200)
+        self.assertEqual(self.request("GET", path)[1]["described"], 1)
+
+        self.assertEqual(self.request("DELETE", path)[0], 200)
+        self.assertEqual(self.request("GET", path)[0], 404)
+
+    def test_document_limit(self):
+        self.assertEqual(self.request("POST", "/documents", {})[0], 200)
+        self.assertEqual(self.request("POST", "/documents", {})[0], 200)
+        self.assertEqual(self.request("POST", "/documents", {})[0], 503)
+
+    def test_illegal_descriptions_rejected_on_every_route(self):
+        document = "/documents/" + self.request("POST", "/documents", {})[1]["id"]
+        for method, path, body in [("POST", "/generate", {"lines": {"1": "A-B"}}),
+                                   ("POST", "/generate", {"lines": {}, "edits": {"1": "A#B"}}),
+                                   ("POST", "/documents", {"lines": {"1": "A.B"}}),
+                                   ("POST", document + "/import", {"lines": {"1": "A*B"}}),
+                                   ("POST", document + "/edit", {"lines": {"1": "A?B"}})]:
+            status, payload = self.request(method, path, body)
+            self.assertEqual(status, 400, path)
+            self.assertIn("illegal character", payload["error"])
+
+    def test_invalid_lines(self):
+        for lines in ["x", [[1]], {"0": "A"}, {"1": 5}, {"1": "A\nLINE2=B"}]:
+            self.assertEqual(self.request("POST", "/generate", {"lines": lines})[0], 400, lines)
+
+    def test_batch(self):
+        document = "/documents/" + self.request("POST", "/documents", {})[1]["id"]
+        status, payload = self.request("POST", "/batch", {"requests": [
+            {"method": "POST", "path": document + "/import", "body": {"lines": {"9": "Z"}}},
+            {"method": "GET", "path": document + "/output"},
+            {"method": "GET", "path": "/nope"},
+            {"method": "POST", "path": "/batch"},
+            {"method": "POST", "path": "//batch/?nested=1", "body": {"requests": []}},
+            {"method": "GET", "path": 5},
+            {"method": "GET"},
+            "GET /health",
+        ]})
+        self.assertEqual(status, 200)
+        statuses = [response["status"] for response in payload["responses"]]
+        self.assertEqual(statuses, [200, 200, 404, 400, 400, 400, 400, 400])
+        self.assertEqual(payload["responses"][1]["body"]["output"], "LINE9=Z\n")
+
+    def test_malformed_json_closes_connection(self):
+        self.connection.request("POST", "/generate", body=b"{bad")
+        response = self.connection.getresponse()
+        self.assertEqual(response.status, 400)
+        self.assertEqual(response.getheader("Connection"), "close")
+        response.read()
+
+    def test_metrics(self):
+        self.request("GET", "/health")
+        self.request("GET", "/nope")
+        status, payload = self.request("GET", "/metrics")
+        self.assertEqual(status, 200)
+        self.assertIn("GET /health", payload["routes"])
+
+
+if __name__ == '__main__':
+    unittest.main()
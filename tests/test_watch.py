@@ -0,0 +1,119 @@
+import os
+import random
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wdl_core import Application, FileWatcher, parse_wdl_text
+
+
+class FileWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._directory.name, "TEST_wdtitle.wdl")
+        self.mtime = time.time_ns()
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def write(self, text):
+        with open(self.path, 'w') as fd:
+            fd.write(text)
+        # Coarse filesystem timestamps could hide a rewrite of the same size
+        self.mtime += 1_000_000_000
+        os.utime(self.path, ns=(self.mtime, self.mtime))
+
+    def follow(self, texts):
+        '''
+        Applies each version of the file to a model through the watcher and
+        checks the model matches a full parse after every step.
+        '''
+        self.write(texts[0])
+        app = Application(headless=True)
+        app.import_records(parse_wdl_text(texts[0]).items())
+        watcher = FileWatcher(self.path)
+        watcher.rebase()
+        for text in texts[1:]:
+            self.write(text)
+            change = watcher.poll()
+            if change is not None:
+                app.set_descriptions(change.states, label="reload")
+                self.assertTrue(watcher.commit(change))
+            self.assertEqual(dict(app.items()), parse_wdl_text(text), text)
+
+    def test_uncommitted_change_is_found_again(self):
+        self.write("LINE1=A\nLINE2=B\n")
+        watcher = FileWatcher(self.path)
+        watcher.rebase()
+        self.write("LINE1=A\nLINE2=X\n")
+        self.assertEqual(watcher.poll().states, [(2, "X")])
+        self.write("LINE1=Y\nLINE2=X\n")
+        change = watcher.poll()
+        self.assertEqual(change.states, [(1, "Y"), (2, "X")])
+        self.assertTrue(watcher.commit(change))
+        self.assertIsNone(watcher.poll())
+
+    def test_rebase_discards_pending_change(self):
+        self.write("LINE1=A\n")
+        watcher = FileWatcher(self.path)
+        watcher.rebase()
+        self.write("LINE1=B\n")
+        change = watcher.poll()
+        # Saved from the window in the meantime
+        self.write("LINE1=C\n")
+        watcher.rebase()
+        self.assertFalse(watcher.commit(change))
+        self.assertIsNone(watcher.poll())
+
+    def test_unreadable_file_has_no_base_until_it_returns(self):
+        watcher = FileWatcher(self.path)
+        with self.assertRaises(OSError):
+            watcher.rebase()
+        self.assertIsNone(watcher.poll())
+        self.write("LINE1=A\n")
+        self.assertIsNone(watcher.poll())
+        self.write("LINE1=B\n")
+        self.assertEqual(watcher.poll().states, [(1, "B")])
+
+    def test_edit(self):
+        self.follow(["LINE1=A\nLINE2=B\nLINE3=C\n", "LINE1=A\nLINE2=X\nLINE3=C\n", "LINE1=A\nLINE3=C\n"])
+
+    def test_row_joined_to_unchanged_rows(self):
+        self.follow(["LINE1=A\nLINE2=B\n", "LINE1=A\nLINE3=XLINE2=B\n"])
+
+    def test_duplicate_removed_from_changed_rows(self):
+        # LINE1 is still in the file after its second row is removed
+        self.follow(["LINE1=A\nLINE2=B\nLINE1=C\n", "LINE1=A\nLINE2=B\n"])
+
+    def test_duplicate_added_before_later_row(self):
+        # The later, unchanged LINE2 row keeps winning
+        self.follow(["LINE1=A\nLINE2=B\n", "LINE2=X\nLINE1=A\nLINE2=B\n"])
+
+    def test_duplicate_in_other_case(self):
+        self.follow(["line 1=A\nLINE2=B\nLINE1=C\n", "line 1=A\nLINE2=B\n", "Line1=D\nline 1=A\nLINE2=B\n"])
+
+    def test_random_edits_with_duplicates(self):
+        rng = random.Random(7)
+        for _ in range(300):
+            rows = [f"LINE{rng.randint(1, 25)}={rng.choice(['A', 'B', '', 'x=y'])}\n" for _ in range(rng.randint(0, 30))]
+            texts = ["".join(rows)]
+            for _ in range(3):
+                for _ in range(rng.randint(1, 4)):
+                    operation = rng.random()
+                    i = rng.randint(0, len(rows))
+                    if operation < 0.3:
+                        rows.insert(i, f"LINE{rng.randint(1, 30)}={rng.choice(['N', 'Q', ''])}\n")
+                    elif operation < 0.6 and rows:
+                        rows.pop(min(i, len(rows) - 1))
+                    elif rows:
+                        j = min(i, len(rows) - 1)
+                        rows[j] = rows[j].replace("=", "=Z", 1)
+                texts.append("".join(rows))
+            self.follow(texts)
+
+
+if __name__ == "__main__":
+    unittest.main()
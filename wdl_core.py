@@ -0,0 +1,3927 @@
+'''
+The line model, WDL reading and writing, and the headless engines (batch,
+templates, diff and merge, lint, transcode, search index and the HTTP/JSON
+service) behind WDL Builder. Nothing here imports Tk, so scripts, the
+service and worker processes can use it without a display; run.py builds
+the window on top of it.
+'''
+import time
+import os
+import sys
+import io
+import json
+import argparse
+import functools
+import contextlib
+import threading
+import re
+import bisect
+import itertools
+import operator
+from array import array
+from collections.abc import Mapping
+
+# Only needed by features used after the window is up (search index, batch
+# mode, instrumentation, background I/O), so they are imported where used:
+# sqlite3, csv, tempfile, logging, concurrent.futures
+
+###############################################################################################################
+###############################################################################################################
+
+# Line Index
+
+###############################################################################################################
+###############################################################################################################
+
+# Compiled once; "Line N" strings are the ids shared by the model and the treeview
+LINE_ID_PATTERN = re.compile(r'^Line (\d+)$')
+
+# Line numbers are stored as unsigned 32-bit integers
+MAX_LINE_NUMBER = 0xFFFFFFFF
+
+# Characters that may not appear in a line description, as a regex character set
+ILLEGAL_DESCRIPTION_CHARACTERS = r'@#.*?~\[\]\-'
+ILLEGAL_DESCRIPTION_PATTERN = re.compile(f'[{ILLEGAL_DESCRIPTION_CHARACTERS}]')
+
+
+def line_number(line_id:str):
+    '''
+    Returns the integer line number of a "Line N" id, or None if the id is
+    malformed or refers to line 0.
+    '''
+    match = LINE_ID_PATTERN.match(line_id) if isinstance(line_id, str) else None
+    if match is None:
+        return None
+    number = int(match.group(1))
+    return number if 0 < number <= MAX_LINE_NUMBER else None
+
+
+class LineIndex:
+    '''
+    Sorted line numbers and their descriptions. Numbers are stored as a
+    list of sorted array('I') chunks (4 bytes per line) with a parallel
+    list of descriptions per chunk, so an insert or removal only shifts
+    one chunk. Chunks are found by bisecting their maximums, giving
+    O(log n) inserts and lookups, and bulk inserts are merged in a
+    single pass. Lines without a description hold "".
+    '''
+    _load = 1000
+
+    def __init__(self, numbers=(), descriptions=None):
+        numbers = sorted(set(numbers))
+        if descriptions is None:
+            values = [""] * len(numbers)
+        else:
+            values = [descriptions.get(number, "") for number in numbers]
+        self._rebuild(numbers, values)
+
+    def _rebuild(self, numbers, values):
+        load = self._load
+        self._chunks = [array('I', numbers[i:i + load]) for i in range(0, len(numbers), load)]
+        self._values = [values[i:i + load] for i in range(0, len(values), load)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._len = len(numbers)
+        self._offsets = None
+
+    def _chunk_offsets(self):
+        # Starting position of each chunk, rebuilt lazily after a mutation
+        if self._offsets is None:
+            offsets = []
+            total = 0
+            for chunk in self._chunks:
+                offsets.append(total)
+                total += len(chunk)
+            self._offsets = offsets
+        return self._offsets
+
+    def _locate(self, number):
+        # Returns (chunk number, position within chunk) where number belongs
+        k = bisect.bisect_left(self._maxes, number)
+        if k == len(self._maxes):
+            k -= 1
+        return k, bisect.bisect_left(self._chunks[k], number)
+
+    def _find(self, number):
+        # Returns (chunk number, position within chunk) of number, or None
+        if self._len == 0:
+            return None
+        k, i = self._locate(number)
+        chunk = self._chunks[k]
+        if i < len(chunk) and chunk[i] == number:
+            return k, i
+        return None
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield from chunk
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            start, stop, step = position.indices(self._len)
+            if step != 1:
+                return list(self)[position]
+            result = []
+            if start >= stop:
+                return result
+            offsets = self._chunk_offsets()
+            k = bisect.bisect_right(offsets, start) - 1
+            i = start - offsets[k]
+            while len(result) < stop - start:
+                result.extend(self._chunks[k][i:i + (stop - start - len(result))])
+                k += 1
+                i = 0
+            return result
+
+        if position < 0:
+            position += self._len
+        if position < 0 or position >= self._len:
+            raise IndexError("line index out of range")
+        offsets = self._chunk_offsets()
+        k = bisect.bisect_right(offsets, position) - 1
+        return self._chunks[k][position - offsets[k]]
+
+    def __contains__(self, number):
+        return self._find(number) is not None
+
+    def items(self):
+        '''
+        Yields (line_number, description) for every line in order.
+        '''
+        for chunk, values in zip(self._chunks, self._values):
+            yield from zip(chunk, values)
+
+    def copy(self):
+        '''
+        Returns an independent index sharing only the (immutable) description strings.
+        '''
+        clone = LineIndex.__new__(LineIndex)
+        clone._chunks = [chunk[:] for chunk in self._chunks]
+        clone._values = [values[:] for values in self._values]
+        clone._maxes = self._maxes[:]
+        clone._len = self._len
+        clone._offsets = None
+        return clone
+
+    def count_described(self):
+        return sum(len(values) - values.count("") for values in self._values)
+
+    def memory_estimate(self):
+        '''
+        Approximate bytes held: 4 per number, a list slot per description,
+        and the descriptions themselves (49 bytes of str header each).
+        '''
+        return sum(12 * len(values) + 49 * len(values) + sum(map(len, values)) for values in self._values)
+
+    def position(self, number):
+        '''
+        Returns the sorted position of number, or -1 if it is not present.
+        '''
+        found = self._find(number)
+        if found is None:
+            return -1
+        return self._chunk_offsets()[found[0]] + found[1]
+
+    def get(self, number, default=None):
+        found = self._find(number)
+        if found is None:
+            return default
+        return self._values[found[0]][found[1]]
+
+    def set(self, number, description):
+        '''
+        Sets an existing line's description. Returns the previous
+        description, or None if the line is not present.
+        '''
+        found = self._find(number)
+        if found is None:
+            return None
+        values = self._values[found[0]]
+        previous = values[found[1]]
+        values[found[1]] = description
+        return previous
+
+    def clear_descriptions(self):
+        '''
+        Blanks every description and returns the numbers that had one.
+        '''
+        cleared = []
+        for chunk, values in zip(self._chunks, self._values):
+            for i, description in enumerate(values):
+                if description != "":
+                    cleared.append(chunk[i])
+                    values[i] = ""
+        return cleared
+
+    def add(self, number, description=""):
+        '''
+        Inserts number in order. Returns False if it was already present.
+        '''
+        if self._len == 0:
+            self._rebuild([number], [description])
+            return True
+
+        k, i = self._locate(number)
+        chunk = self._chunks[k]
+        if i < len(chunk) and chunk[i] == number:
+            return False
+
+        values = self._values[k]
+        chunk.insert(i, number)
+        values.insert(i, description)
+        self._maxes[k] = chunk[-1]
+        if len(chunk) > 2 * self._load:
+            load = self._load
+            self._chunks[k:k + 1] = [chunk[:load], chunk[load:]]
+            self._values[k:k + 1] = [values[:load], values[load:]]
+            self._maxes[k:k + 1] = [chunk[load - 1], chunk[-1]]
+        self._len += 1
+        self._offsets = None
+        return True
+
+    def add_many(self, numbers):
+        '''
+        Merges an iterable of numbers into the index and returns the sorted
+        list of numbers that were actually new.
+        '''
+        new_numbers = sorted(number for number in set(numbers) if number not in self)
+        if len(new_numbers) == 0:
+            return new_numbers
+
+        if len(new_numbers) < self._load:
+            for number in new_numbers:
+                self.add(number)
+        else:
+            # Two sorted runs: timsort merges them in linear time
+            merged = list(self.items())
+            merged.extend((number, "") for number in new_numbers)
+            merged.sort(key=lambda item: item[0])
+            self._rebuild([item[0] for item in merged], [item[1] for item in merged])
+        return new_numbers
+
+    def pop(self, number, default=None):
+        '''
+        Removes number and returns its description, or default if it was not present.
+        '''
+        found = self._find(number)
+        if found is None:
+            return default
+
+        k, i = found
+        chunk = self._chunks[k]
+        values = self._values[k]
+        description = values[i]
+        del chunk[i]
+        del values[i]
+        if len(chunk) == 0:
+            del self._chunks[k]
+            del self._values[k]
+            del self._maxes[k]
+        else:
+            self._maxes[k] = chunk[-1]
+        self._len -= 1
+        self._offsets = None
+        return description
+
+    def remove(self, number):
+        '''
+        Removes number. Returns False if it was not present.
+        '''
+        return self.pop(number) is not None
+
+
+class LineIdView:
+    '''
+    Read-only sequence of "Line N" ids over a LineIndex, so callers can keep
+    treating Application.line_ids as an ordered list of strings.
+    '''
+    def __init__(self, index:LineIndex):
+        self._index = index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        for number in self._index:
+            yield f"Line {number}"
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [f"Line {number}" for number in self._index[position]]
+        return f"Line {self._index[position]}"
+
+    def __contains__(self, line_id):
+        number = line_number(line_id)
+        return number is not None and number in self._index
+
+    def index(self, line_id):
+        number = line_number(line_id)
+        position = -1 if number is None else self._index.position(number)
+        if position == -1:
+            raise ValueError(f"{line_id} is not in line_ids")
+        return position
+
+
+class LinesView(Mapping):
+    '''
+    Read-only "Line N" -> description mapping over a LineIndex, so callers
+    can keep treating Application.lines as the old dictionary.
+    '''
+    def __init__(self, index:LineIndex):
+        self._index = index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        for number in self._index:
+            yield f"Line {number}"
+
+    def __contains__(self, line_id):
+        number = line_number(line_id)
+        return number is not None and number in self._index
+
+    def __getitem__(self, line_id):
+        number = line_number(line_id)
+        description = None if number is None else self._index.get(number)
+        if description is None:
+            raise KeyError(line_id)
+        return description
+
+
+class LineChange:
+    '''
+    Describes one model mutation for listeners such as the treeview:
+    the "Line N" ids that were inserted, updated and deleted. A reset means
+    the whole model was replaced and views should rebuild from scratch.
+    '''
+    __slots__ = ("inserted", "updated", "deleted", "reset")
+
+    def __init__(self, inserted=(), updated=(), deleted=(), reset=False):
+        self.inserted = list(inserted)
+        self.updated = list(updated)
+        self.deleted = list(deleted)
+        self.reset = reset
+
+    def __bool__(self):
+        return self.reset or bool(self.inserted or self.updated or self.deleted)
+
+    def __repr__(self):
+        return f"LineChange(inserted={self.inserted}, updated={self.updated}, deleted={self.deleted}, reset={self.reset})"
+
+
+class LineTransaction:
+    '''
+    An open Application.transaction(). before holds the description each
+    touched line had when the transaction began (None if it did not exist),
+    which is enough to roll the batch back or to report it as one
+    LineChange. base is the pre-transaction LineIndex once the model has
+    been replaced wholesale inside the transaction.
+    '''
+    __slots__ = ("label", "before", "base", "base_described")
+
+    def __init__(self, label):
+        self.label = label
+        self.before = {}
+        self.base = None
+        self.base_described = 0
+
+
+class UndoOperation:
+    '''
+    One entry in the undo/redo log: the inverse delta of an operation.
+    numbers and descriptions are parallel; a None description means the
+    line did not exist. A wholesale replacement (new, import) instead keeps
+    the LineIndex it replaced in base. Replaying an operation yields the
+    operation that reverses it, so the same entry type serves undo and redo.
+    '''
+    __slots__ = ("label", "numbers", "descriptions", "base", "base_described")
+
+    def __init__(self, label, numbers=(), descriptions=(), base=None, base_described=0):
+        self.label = label
+        self.numbers = array('I', numbers)
+        self.descriptions = list(descriptions)
+        self.base = base
+        self.base_described = base_described
+
+    def __len__(self):
+        return len(self.numbers)
+
+
+class TextIndex:
+    '''
+    Incremental substring index over "number<TAB>description" text, used by
+    the treeview filter. Lines are grouped into blocks by line number; each
+    block keeps one lowercase haystack string, rebuilt only after a line in
+    that block changes. A query skips every block whose haystack does not
+    contain it with a single str.find, and tests the remaining lines at C
+    speed, so no per-line Python code runs on a keystroke.
+    '''
+    _block_bits = 10
+
+    def __init__(self, items=()):
+        # block id -> {line number: lowercase text}
+        self._blocks = {}
+        # block id -> (haystack, line numbers, texts); dropped when the block changes
+        self._haystacks = {}
+
+        for number, description in items:
+            self.set(number, description)
+
+    def set(self, number, description):
+        block_id = number >> self._block_bits
+        # A newline never occurs in a WDL description, so it separates lines safely
+        text = f"{number}\t{description.lower()}".replace("\n", " ")
+        self._blocks.setdefault(block_id, {})[number] = text
+        self._invalidate(block_id)
+
+    def remove(self, number):
+        block_id = number >> self._block_bits
+        block = self._blocks.get(block_id)
+        if block is not None and block.pop(number, None) is not None:
+            if len(block) == 0:
+                del self._blocks[block_id]
+            self._invalidate(block_id)
+
+    def _invalidate(self, block_id):
+        self._haystacks.pop(block_id, None)
+
+    def _haystack(self, block_id):
+        cached = self._haystacks.get(block_id)
+        if cached is None:
+            block = self._blocks[block_id]
+            numbers = sorted(block)
+            texts = [block[number] for number in numbers]
+            cached = ("\n".join(texts), numbers, texts)
+            self._haystacks[block_id] = cached
+        return cached
+
+    def search(self, query):
+        '''
+        Returns the sorted line numbers whose number or description contains
+        query, ignoring case.
+        '''
+        query = query.lower()
+
+        result = []
+        for block_id in sorted(self._blocks):
+            haystack, numbers, texts = self._haystack(block_id)
+            if haystack.find(query) != -1:
+                result.extend(itertools.compress(numbers, map(operator.contains, texts, itertools.repeat(query))))
+        return result
+
+
+###############################################################################################################
+###############################################################################################################
+
+# Main Application
+
+###############################################################################################################
+###############################################################################################################
+
+class Document:
+    '''
+    One open WDL model: its name, the file it came from, and its undo
+    history. The active document's model lives on the Application itself;
+    switching documents parks it here.
+    '''
+    __slots__ = ("name", "path", "source", "encoding", "line_index", "described", "text_index", "undo", "redo", "saved")
+
+    def __init__(self, name, line_index=None):
+        self.name = name
+        self.path = None
+
+        # ModelCache key of the file the model was loaded from
+        self.source = None
+
+        # Encoding the file was read in and is saved back in; None for the default
+        self.encoding = None
+
+        self.line_index = line_index
+        self.described = 0 if line_index is None else line_index.count_described()
+        self.text_index = None
+        self.undo = []
+        self.redo = []
+
+        # Undo entry that was on top when the document was last saved
+        self.saved = None
+
+
+class ModelCache:
+    '''
+    Least-recently-used cache of parsed WDL models keyed by (path, mtime,
+    size), so reopening a file that has not changed skips parsing. Entries
+    are private copies of a LineIndex; the cache is bounded by their
+    estimated memory and evicts the least recently used first.
+    '''
+    def __init__(self, max_bytes):
+        self._maxBytes = max_bytes
+        self._entries = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(path):
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    @property
+    def max_bytes(self):
+        return self._maxBytes
+
+    def get(self, key):
+        '''
+        Returns a copy of the cached model for key, or None. The encoding
+        the file was read in is available from encoding(key).
+        '''
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        # Re-inserting moves the entry to the most recently used end
+        self._entries[key] = entry
+        self.hits += 1
+        return entry[0].copy()
+
+    def encoding(self, key):
+        entry = self._entries.get(key)
+        return None if entry is None else entry[2]
+
+    def put(self, key, line_index:LineIndex, encoding=None):
+        size = line_index.memory_estimate()
+        self.discard(key)
+        if size > self._maxBytes:
+            return
+        self._entries[key] = (line_index.copy(), size, encoding)
+        self._bytes += size
+        while self._bytes > self._maxBytes:
+            self.discard(next(iter(self._entries)))
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+
+class Application:
+    def __init__(self, headless=False, instrument=None, report_startup=False, autosave=True, cache_megabytes=None, window=None):
+        self._icon = None #os.path.abspath('img/wdl_builder.ico')
+
+        # DIRECTORY SETUP
+        self._srcDirectory = None
+        if getattr(sys, 'frozen', False):
+            self._srcDirectory = sys._MEIPASS
+        else:
+            self._srcDirectory = os.path.dirname(os.path.abspath(__file__))
+        
+        # APPLICATION COLORS
+        self._frameBackground = '#ffffff'
+        self._foreground = '#070707'
+
+        self._label_font = ('Sans', '8') #, 'bold')
+        self._label_background = '#ffffff'
+
+        self._entry_font = ('Sans', '8') #, 'bold')
+        self._entry_fg = '#000000'
+        self._entry_bg = '#ffffff'
+        self._entry_width = 10
+        self._entry_justify = 'left'
+
+        self._config = {
+            "icon_path":self._icon,
+            "src_dir":self._srcDirectory
+        }
+
+        self._theme = {
+            "frame_background": self._frameBackground,
+            "foreground": self._foreground,
+
+            "label_font": self._label_font,
+            "label_background": self._label_background,
+
+            "entry_font": self._entry_font,
+            "entry_fg": self._entry_fg,
+            "entry_bg": self._entry_bg,
+            "entry_width": self._entry_width,
+            "entry_justify": self._entry_justify
+        }
+
+        self._defaults = {
+            "lines": 20,
+            "project_name": "default",
+            "undo_operations": 100,
+            "cache_megabytes": 256
+        }
+        
+        # Open LineTransaction while mutations are being batched
+        self._transaction = None
+
+        # Undo/redo log of UndoOperations, most recent last
+        self._undoStack = []
+        self._redoStack = []
+
+        # Sorted, array-backed line numbers and descriptions. "Line N"
+        # strings are derived on demand by the line_ids and lines views.
+        self._load_model(range(1, self._defaults["lines"] + 1))
+
+        # Open documents; the active one's model is the one above
+        self._documents = [Document(self._defaults["project_name"])]
+        self._documentIndex = 0
+
+        # Parsed models of recently opened files, shared by all documents
+        if cache_megabytes is None:
+            cache_megabytes = self._defaults["cache_megabytes"]
+        self._modelCache = ModelCache(cache_megabytes << 20)
+
+        # Callbacks notified with a LineChange after every mutation
+        self._listeners = []
+
+        # Opt-in action timing (--instrument / WDL_BUILDER_INSTRUMENT). Headless
+        # instances, such as service requests and batch workers, only time
+        # actions when asked to directly.
+        if headless:
+            self._instrumentation = Instrumentation(bool(instrument))
+        else:
+            self._instrumentation = Instrumentation.from_environment(instrument)
+
+        # --startup-time: print time to first window and exit
+        self._reportStartup = report_startup
+
+        # Journal unsaved changes for crash recovery (windowed sessions only)
+        self._autosave = autosave
+
+        # Headless instances (batch engine, scripting) never touch Tk; run.py
+        # passes its window class to show the others in
+        self._currentWindow = None
+        if not headless and window is not None:
+            self._currentWindow = window(self)
+
+    @property
+    def config(self):
+        return self._config
+    
+    @property
+    def theme(self):
+        return self._theme
+    
+    @property
+    def defaults(self):
+        return self._defaults
+    
+    @property
+    def srcDirectory(self):
+        return self._srcDirectory
+    
+    @property
+    def lines(self):
+        return self._lines
+    
+    @property
+    def line_ids(self):
+        return self._line_ids
+    
+    @property
+    def instrumentation(self):
+        return self._instrumentation
+    
+    @property
+    def report_startup(self):
+        return self._reportStartup
+    
+    @property
+    def autosave(self):
+        return self._autosave
+    
+    @property
+    def model_cache(self):
+        return self._modelCache
+    
+    @property
+    def documents(self):
+        return list(self._documents)
+    
+    @property
+    def document(self):
+        '''
+        The active Document.
+        '''
+        return self._documents[self._documentIndex]
+    
+    @property
+    def document_index(self):
+        return self._documentIndex
+    
+    def _park(self):
+        # Move the live model into the active Document before another one takes over
+        document = self.document
+        document.line_index = self._line_index
+        document.described = self._described
+        document.text_index = self._textIndex
+        document.undo = self._undoStack
+        document.redo = self._redoStack
+    
+    def _activate(self, index):
+        self._documentIndex = index
+        document = self.document
+        self._use_index(document.line_index, document.described)
+        self._textIndex = document.text_index
+        self._undoStack = document.undo
+        self._redoStack = document.redo
+        document.line_index = document.text_index = None
+        self._notify(LineChange(reset=True))
+    
+    def new_document(self, name=None):
+        '''
+        Opens a new document with the default lines and makes it active.
+        Returns its index.
+        '''
+        if self._transaction is not None:
+            return -1
+        self._park()
+        document = Document(name or self._defaults["project_name"], LineIndex(range(1, self._defaults["lines"] + 1)))
+        self._documents.append(document)
+        self._activate(len(self._documents) - 1)
+        return self._documentIndex
+    
+    def switch_document(self, index):
+        '''
+        Makes the document at index active. Its model, undo history and
+        filter index are swapped in as they were, so no parsing is needed.
+        '''
+        if self._transaction is not None or not 0 <= index < len(self._documents):
+            return -1
+        if index != self._documentIndex:
+            self._park()
+            self._activate(index)
+        return 0
+    
+    def close_document(self, index):
+        '''
+        Closes the document at index. Closing the last document leaves a
+        new default one open.
+        '''
+        if self._transaction is not None or not 0 <= index < len(self._documents):
+            return -1
+        if len(self._documents) == 1:
+            self._documents.append(Document(self._defaults["project_name"], LineIndex(range(1, self._defaults["lines"] + 1))))
+
+        if index != self._documentIndex:
+            # The active model stays where it is; only its position in the list moves
+            del self._documents[index]
+            if index < self._documentIndex:
+                self._documentIndex -= 1
+            return 0
+
+        del self._documents[index]
+        self._activate(min(index, len(self._documents) - 1))
+        return 0
+    
+    @property
+    def modified(self):
+        '''
+        True if the active document has changed since it was opened or last saved.
+        '''
+        top = self._undoStack[-1] if self._undoStack else None
+        return top is not self.document.saved
+    
+    def mark_saved(self, document=None):
+        '''
+        Marks document, by default the active one, as matching what was last
+        written. A background document is marked at the top of its parked
+        history.
+        '''
+        if document is None or document is self.document:
+            self.document.saved = self._undoStack[-1] if self._undoStack else None
+        else:
+            document.saved = document.undo[-1] if document.undo else None
+    
+    def clear_history(self):
+        self._undoStack.clear()
+        self._redoStack.clear()
+        self.document.saved = None
+    
+    @property
+    def text_index(self):
+        if self._textIndex is None:
+            self._textIndex = TextIndex(self._line_index.items())
+        return self._textIndex
+    
+    def filter_lines(self, query:str):
+        '''
+        Returns the sorted line numbers whose number or description contains query.
+        '''
+        return self.text_index.search(query)
+    
+    def subscribe(self, callback):
+        '''
+        Registers callback(change:LineChange) to be called after each mutation.
+        '''
+        self._listeners.append(callback)
+    
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+    
+    def _notify(self, change:LineChange):
+        # Inside a transaction listeners hear about the whole batch once, on commit
+        if not change or self._transaction is not None:
+            return
+        with self._instrumentation.phase("treeview"):
+            for callback in list(self._listeners):
+                callback(change)
+    
+    def _load_model(self, numbers, descriptions=None):
+        described = 0 if descriptions is None else sum(1 for d in descriptions.values() if d != "")
+        self._replace_index(LineIndex(numbers, descriptions), described)
+    
+    def _replace_index(self, line_index, described):
+        transaction = self._transaction
+        if transaction is not None and transaction.base is None:
+            # The current index is being discarded; wind it back so a rollback can reinstate it
+            self._restore(transaction.before.items())
+            transaction.base = self._line_index
+            transaction.base_described = self._described
+
+        self._use_index(line_index, described)
+    
+    def _use_index(self, line_index, described):
+        self._line_index = line_index
+
+        # Number of lines with a non-empty description
+        self._described = described
+
+        # Substring index for the treeview filter, built on first use
+        self._textIndex = None
+
+        # Compatibility views: ordered "Line N" ids, and "Line N" -> description
+        self._line_ids = LineIdView(self._line_index)
+        self._lines = LinesView(self._line_index)
+    
+    def _touch(self, number):
+        # Remember a line's description before the first change to it in a transaction
+        transaction = self._transaction
+        if transaction is not None and transaction.base is None and number not in transaction.before:
+            transaction.before[number] = self._line_index.get(number)
+    
+    def _restore(self, states):
+        '''
+        Puts each (line_number, description) state into the model, where a
+        None description removes the line. Keeps the description count and
+        the text index in step. Does not notify listeners.
+        '''
+        line_index = self._line_index
+        text_index = self._textIndex
+        for number, description in states:
+            self._touch(number)
+            if description is None:
+                previous = line_index.pop(number)
+                if previous is None:
+                    continue
+                if text_index is not None:
+                    text_index.remove(number)
+            else:
+                previous = line_index.set(number, description)
+                if previous is None:
+                    line_index.add(number, description)
+                elif previous == description:
+                    continue
+                if text_index is not None:
+                    text_index.set(number, description)
+            self._described += (description is not None and description != "") - (previous is not None and previous != "")
+    
+    @contextlib.contextmanager
+    def transaction(self, label="edit"):
+        '''
+        Batches mutations. Listeners are notified once, with a single
+        coalesced LineChange, when the block exits, and the batch is undone
+        as one step named label; if the block raises, every change made
+        inside it is rolled back. Nested transactions join the outermost one.
+
+            with app.transaction("fill title block"):
+                app.add_line("Line 30")
+                app.edit_line("Line 30", "CLIENT")
+        '''
+        if self._transaction is not None:
+            yield self._transaction
+            return
+
+        transaction = self._transaction = LineTransaction(label)
+        try:
+            yield transaction
+        except BaseException:
+            self._transaction = None
+            self._rollback(transaction)
+            raise
+
+        self._transaction = None
+        change = self._coalesce(transaction)
+        if change:
+            self._log(self._inverse(transaction))
+        self._notify(change)
+    
+    def _inverse(self, transaction:LineTransaction):
+        if transaction.base is not None:
+            return UndoOperation(transaction.label, base=transaction.base, base_described=transaction.base_described)
+        return UndoOperation(transaction.label, transaction.before.keys(), transaction.before.values())
+    
+    def _log(self, operation:UndoOperation):
+        # A new edit forks history, so anything undone can no longer be redone
+        self._undoStack.append(operation)
+        del self._undoStack[:-self._defaults["undo_operations"]]
+        self._redoStack.clear()
+    
+    def _replay(self, operation:UndoOperation):
+        '''
+        Applies an inverse delta in O(len(operation)), notifies listeners,
+        and returns the operation that reverses it.
+        '''
+        transaction = self._transaction = LineTransaction(operation.label)
+        try:
+            if operation.base is not None:
+                self._replace_index(operation.base, operation.base_described)
+            else:
+                self._restore(zip(operation.numbers, operation.descriptions))
+        finally:
+            self._transaction = None
+
+        self._notify(self._coalesce(transaction))
+        return self._inverse(transaction)
+    
+    def undo(self):
+        '''
+        Reverts the most recent operation. Returns -1 if there is nothing
+        to undo or a transaction is open.
+        '''
+        if not self._undoStack or self._transaction is not None:
+            return -1
+        self._redoStack.append(self._replay(self._undoStack.pop()))
+        return 0
+    
+    def redo(self):
+        '''
+        Re-applies the most recently undone operation.
+        '''
+        if not self._redoStack or self._transaction is not None:
+            return -1
+        self._undoStack.append(self._replay(self._redoStack.pop()))
+        return 0
+    
+    @property
+    def undo_label(self):
+        '''
+        Name of the operation undo() would revert, or None.
+        '''
+        return self._undoStack[-1].label if self._undoStack else None
+    
+    @property
+    def redo_label(self):
+        return self._redoStack[-1].label if self._redoStack else None
+    
+    def _rollback(self, transaction:LineTransaction):
+        if transaction.base is not None:
+            self._use_index(transaction.base, transaction.base_described)
+        else:
+            self._restore(transaction.before.items())
+    
+    def _coalesce(self, transaction:LineTransaction):
+        if transaction.base is not None:
+            return LineChange(reset=True)
+
+        inserted, updated, deleted = [], [], []
+        for number, before in transaction.before.items():
+            after = self._line_index.get(number)
+            if before is None:
+                if after is not None:
+                    inserted.append(f"Line {number}")
+            elif after is None:
+                deleted.append(f"Line {number}")
+            elif after != before:
+                updated.append(f"Line {number}")
+        return LineChange(inserted=inserted, updated=updated, deleted=deleted)
+    
+    def set_descriptions(self, records, label="paste"):
+        '''
+        Adds or updates lines from (line_number, description) records, such
+        as a block pasted from a spreadsheet, in one transaction. A None
+        description removes the line. Returns the number of records applied.
+        '''
+        records = list(records)
+        with self.transaction(label):
+            self._restore(records)
+        return len(records)
+    
+    def remove_line(self, line_id:str):
+        '''
+        Removes a line from the application with key line_id
+        '''
+        number = line_number(line_id)
+        if number is not None:
+            self._touch(number)
+        description = None if number is None else self._line_index.pop(number)
+        if description is None:
+            return -1
+        if description != "":
+            self._described -= 1
+        if self._textIndex is not None:
+            self._textIndex.remove(number)
+        if self._transaction is None:
+            self._log(UndoOperation("remove", (number,), (description,)))
+        self._notify(LineChange(deleted=[line_id]))
+        return 0
+    
+    def add_line(self, line_id:str):
+        '''
+        Adds a line to the application with key line_id
+        '''
+        number = line_number(line_id)
+        if number is None or number in self._line_index:
+            return -1
+        self._touch(number)
+        self._line_index.add(number)
+        if self._textIndex is not None:
+            self._textIndex.set(number, "")
+        if self._transaction is None:
+            self._log(UndoOperation("add", (number,), (None,)))
+        self._notify(LineChange(inserted=[line_id]))
+        return 0
+    
+    def add_lines(self, line_ids):
+        '''
+        Adds many lines at once. Every id is validated first; if any is
+        malformed nothing is added and -1 is returned. Ids that already
+        exist are skipped. Returns the number of lines added.
+        '''
+        numbers = []
+        for line_id in line_ids:
+            number = line_number(line_id)
+            if number is None:
+                return -1
+            numbers.append(number)
+
+        with self.transaction("add"):
+            new_numbers = self._line_index.add_many(numbers)
+            transaction = self._transaction
+            if transaction.base is None:
+                for number in new_numbers:
+                    transaction.before.setdefault(number, None)
+            if self._textIndex is not None:
+                for number in new_numbers:
+                    self._textIndex.set(number, "")
+        return len(new_numbers)
+    
+    def edit_line(self, line_id:str, description:str):
+        '''
+        Edits a line's description.
+        '''
+        number = line_number(line_id)
+        if number is not None:
+            self._touch(number)
+        previous = None if number is None else self._line_index.set(number, description)
+        if previous is None:
+            return -1
+        if previous != description:
+            self._described += (description != "") - (previous != "")
+            if self._textIndex is not None:
+                self._textIndex.set(number, description)
+            if self._transaction is None:
+                self._log(UndoOperation("edit", (number,), (previous,)))
+            self._notify(LineChange(updated=[line_id]))
+        return 0
+    
+    def clear_line(self, line_id:str):
+        '''
+        Clears a line's description
+        '''
+        self.edit_line(line_id, "")
+    
+    def clear_all_lines(self):
+        '''
+        Clears all the line descriptions
+        '''
+        with self.transaction("clear"):
+            for number, description in self._line_index.items():
+                if description != "":
+                    self._touch(number)
+            cleared = self._line_index.clear_descriptions()
+            if self._textIndex is not None:
+                for number in cleared:
+                    self._textIndex.set(number, "")
+            self._described = 0
+    
+    def new(self):
+        '''
+        Resets the application to default state.
+        '''
+        with self.transaction("new"):
+            self._load_model(range(1, self._defaults["lines"] + 1))
+    
+    def import_records(self, records, source=None, encoding=None):
+        '''
+        Replaces the model with (line_number, description) records, such as
+        those streamed by WDLReader. Later duplicates win. source is the
+        ModelCache key of the file the records were read from, if any; the
+        parsed model is cached under it. encoding is the file's encoding,
+        which the document is saved back in.
+        '''
+        descriptions = {}
+        for number, description in records:
+            descriptions[number] = description
+
+        with self.transaction("import"):
+            self._load_model(descriptions.keys(), descriptions)
+        self.document.source = source
+        self.document.encoding = encoding
+        if source is not None:
+            self._modelCache.put(source, self._line_index, encoding)
+    
+    def import_cached(self, source):
+        '''
+        Replaces the model with the cached parse of source, a ModelCache
+        key. Returns False, leaving the model alone, on a cache miss.
+        '''
+        line_index = self._modelCache.get(source)
+        if line_index is None:
+            return False
+        with self.transaction("import"):
+            self._replace_index(line_index, line_index.count_described())
+        self.document.source = source
+        self.document.encoding = self._modelCache.encoding(source)
+        return True
+    
+    def import_lines(self, new_line_index, new_line_dict):
+        '''
+        Replaces the model with the given "Line N" ids and descriptions.
+        Malformed ids are dropped.
+        '''
+        records = []
+        for line_id in new_line_index:
+            number = line_number(line_id)
+            if number is not None:
+                records.append((number, new_line_dict.get(line_id, "")))
+        self.import_records(records)
+    
+    def items(self):
+        '''
+        Yields (line_number, description) for every line, described or not, in line order.
+        '''
+        return self._line_index.items()
+    
+    def records(self):
+        '''
+        Yields (line_number, description) for every line with a description,
+        in line order. This is what a WDL file contains.
+        '''
+        for number, description in self._line_index.items():
+            if description != "":
+                yield number, description
+    
+    def has_output(self):
+        return self._described > 0
+    
+    @property
+    def described_count(self):
+        return self._described
+    
+    def generate_output(self):
+        return "".join(format_wdl_record(number, description) for number, description in self.records())
+    
+    def write_output(self, path):
+        '''
+        Streams the WDL file to path in the document's encoding, replacing
+        it atomically. Returns the number of lines written.
+        '''
+        return write_wdl(path, self.records(), encoding=self.document.encoding)
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   WDL Parsing
+
+###############################################################################################################
+###############################################################################################################
+
+# "LINE12", "Line 12", "line12" ... as written by hand in Notepad
+WDL_KEY_PATTERN = re.compile(r'^\s*LINE\s*(\d+)\s*$', re.IGNORECASE)
+
+# Control characters other than tab and line endings, as a regex character set
+CONTROL_CHARACTERS = r'\x00-\x08\x0b\x0c\x0e-\x1f\x7f'
+CONTROL_CHARACTER_PATTERN = re.compile(f'[{CONTROL_CHARACTERS}]')
+
+# Any character a description warning is raised for; one search over a
+# block of rows tells whether any of them needs description_warnings
+DESCRIPTION_WARNING_PATTERN = re.compile(f'[{ILLEGAL_DESCRIPTION_CHARACTERS}{CONTROL_CHARACTERS}]')
+
+# Every check made on WDL rows, by code: (severity, message). Rows with an
+# error are skipped when a file is read; warnings are loaded but reported.
+# parse_wdl_row and description_warnings make the checks for every reader.
+LINT_RULES = {
+    "missing-separator": ("error", "missing '='"),
+    "malformed-key": ("error", "malformed LINEn key"),
+    "zero-line-number": ("error", "line number 0"),
+    "line-number-range": ("error", "line number out of range"),
+    "duplicate-line-number": ("warning", "duplicate line number"),
+    "illegal-character": ("warning", "illegal character"),
+    "control-character": ("warning", "control character"),
+    "encoding": ("warning", "bytes that do not decode"),
+}
+
+
+def line_number_problem(number):
+    '''
+    Returns the LINT_RULES error code a line number breaks, or None.
+    '''
+    if number == 0:
+        return "zero-line-number"
+    if number > MAX_LINE_NUMBER:
+        return "line-number-range"
+    return None
+
+
+def parse_wdl_row(row):
+    '''
+    Parses one row of a WDL file, without its "\n", into (line_number,
+    description, code). code is the LINT_RULES error the row breaks, if
+    any, and line_number is then None. A blank row gives (None, "", None).
+    '''
+    row = row.rstrip('\r')
+    if row.strip() == "":
+        return None, "", None
+
+    # Descriptions may themselves contain '=', so only split on the first
+    key, separator, description = row.partition('=')
+    if separator == "":
+        return None, "", "missing-separator"
+
+    match = WDL_KEY_PATTERN.match(key)
+    if match is None:
+        return None, "", "malformed-key"
+
+    number = int(match.group(1))
+    code = line_number_problem(number)
+    if code is not None:
+        return None, "", code
+    return number, description.strip(), None
+
+
+def description_warnings(description):
+    '''
+    Returns the LINT_RULES warning codes a description raises.
+    '''
+    codes = []
+    if ILLEGAL_DESCRIPTION_PATTERN.search(description):
+        codes.append("illegal-character")
+    if CONTROL_CHARACTER_PATTERN.search(description):
+        codes.append("control-character")
+    return codes
+
+
+def description_problem(description):
+    '''
+    Returns why description cannot be stored as a line description, or
+    None if it can. Everything that writes descriptions from outside the
+    GUI checks them here, so they are held to what the GUI accepts.
+    '''
+    if not isinstance(description, str):
+        return "not a string"
+    if "\n" in description or "\r" in description:
+        return "line break"
+    for code in description_warnings(description):
+        return LINT_RULES[code][1]
+    return None
+
+
+class WDLDiagnostic:
+    '''
+    A problem found on one row of a WDL file. row is 1-based; code is
+    the LINT_RULES entry it breaks, if any.
+    '''
+    __slots__ = ("row", "message", "text", "code")
+
+    def __init__(self, row, message, text, code=None):
+        self.row = row
+        self.message = message
+        self.text = text
+        self.code = code
+
+    @classmethod
+    def rule(cls, code, row, text, detail=""):
+        message = LINT_RULES[code][1]
+        return cls(row, f"{message} ({detail})" if detail else message, text, code)
+
+    @property
+    def severity(self):
+        return LINT_RULES[self.code][0] if self.code is not None else "error"
+
+    def __str__(self):
+        return f"row {self.row}: {self.message}: {self.text!r}"
+
+
+class WDLReader:
+    '''
+    Streaming parser for WDL files. Iterating yields (line_number,
+    description) records lazily while the file is read in fixed-size
+    chunks, so memory stays constant regardless of file size. Malformed
+    rows are skipped and recorded in diagnostics instead of aborting;
+    rows that are loaded despite a problem, such as an illegal character
+    in the description, are recorded in warnings. warning_count counts
+    rows, which may each have several warnings.
+
+        with open_wdl(path) as fd:
+            reader = WDLReader(fd)
+            for number, description in reader:
+                ...
+            print(reader.diagnostics)
+    '''
+    def __init__(self, fd, chunk_size=1 << 16, max_diagnostics=1000):
+        self._fd = fd
+        self._chunkSize = chunk_size
+
+        # The encoding the text is decoded from, for writing it back the same way
+        self.encoding = getattr(fd, "encoding", None)
+        self._maxDiagnostics = max_diagnostics
+
+        self.diagnostics = []
+        self.diagnostic_count = 0
+        self.warnings = []
+        self.warning_count = 0
+        self.rows = 0
+        self.chars_read = 0
+
+    def __iter__(self):
+        remainder = ""
+        while True:
+            chunk = self._fd.read(self._chunkSize)
+            if not chunk:
+                break
+            self.chars_read += len(chunk)
+
+            # One search per chunk; only a hit needs descriptions checked row by row
+            text = remainder + chunk
+            check = DESCRIPTION_WARNING_PATTERN.search(text) is not None
+            rows = text.split('\n')
+            remainder = rows.pop()
+            for row in rows:
+                record = self._parse_row(row, check)
+                if record is not None:
+                    yield record
+
+        if remainder:
+            record = self._parse_row(remainder, True)
+            if record is not None:
+                yield record
+
+    def _parse_row(self, row, check=False):
+        self.rows += 1
+        number, description, code = parse_wdl_row(row)
+        if code is not None:
+            self._diagnose(code, row.rstrip('\r'))
+        if number is None:
+            return None
+
+        codes = description_warnings(description) if check else ()
+        if codes:
+            self.warning_count += 1
+            for code in codes:
+                if len(self.warnings) < self._maxDiagnostics:
+                    self.warnings.append(WDLDiagnostic.rule(code, self.rows, row.rstrip('\r')))
+        return number, description
+
+    def _diagnose(self, code, row):
+        self.diagnostic_count += 1
+        if len(self.diagnostics) < self._maxDiagnostics:
+            self.diagnostics.append(WDLDiagnostic.rule(code, self.rows, row))
+
+
+def is_wdtitle_file(path):
+    '''
+    True for AutoCAD Electrical title block files named <project>_wdtitle.wdl
+    '''
+    stem, extension = os.path.splitext(os.path.basename(path))
+    return extension == '.wdl' and stem.lower().endswith('_wdtitle')
+
+
+# AutoCAD Electrical writes title block files in the Windows ANSI code page
+DEFAULT_WDL_ENCODING = 'cp1252'
+
+
+def sniff_wdl_encoding(raw, chunk_size=1 << 16):
+    '''
+    Guesses the encoding of a WDL file from its bytes, read from the
+    binary file raw, which is left rewound. A BOM is decisive; without
+    one, mostly-zero alternate bytes mean UTF-16, and 8-bit text is UTF-8
+    if its first non-ASCII bytes decode as UTF-8, else cp1252. Pure ASCII
+    is reported as DEFAULT_WDL_ENCODING, so later edits are saved the way
+    AutoCAD Electrical expects.
+    '''
+    import codecs
+
+    head = raw.read(chunk_size)
+    try:
+        if head.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+        if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            return 'utf-16'
+
+        # "LINE1=..." as UTF-16 has a zero byte beside nearly every character
+        if len(head) >= 2:
+            if head[1::2].count(0) > len(head) // 4:
+                return 'utf-16-le'
+            if head[0::2].count(0) > len(head) // 4:
+                return 'utf-16-be'
+
+        # Pure ASCII has to be read to the end to be told apart from either
+        chunk = head
+        while chunk:
+            if not chunk.isascii():
+                try:
+                    (chunk + raw.read(3)).decode('utf-8')
+                except UnicodeDecodeError as e:
+                    # A sequence cut off after the 3 extra bytes still counts as UTF-8
+                    return 'utf-8' if e.start >= len(chunk) else 'cp1252'
+                return 'utf-8'
+            chunk = raw.read(chunk_size)
+        return DEFAULT_WDL_ENCODING
+    finally:
+        raw.seek(0)
+
+
+def wdl_errors(encoding):
+    # Bytes that do not decode are carried as surrogates and written back
+    # unchanged; UTF-16 cannot carry them, so they become U+FFFD there
+    return 'replace' if encoding.startswith('utf-16') else 'surrogateescape'
+
+
+def open_wdl(path, newline=None, errors=None):
+    '''
+    Opens a WDL file for reading as text in the encoding sniffed from its
+    bytes. The file's encoding attribute names it, so the file can be
+    written back in the encoding it was read in.
+    '''
+    raw = open(path, 'rb')
+    try:
+        encoding = sniff_wdl_encoding(raw)
+        return io.TextIOWrapper(raw, encoding=encoding, errors=errors or wdl_errors(encoding), newline=newline)
+    except BaseException:
+        raw.close()
+        raise
+
+
+def format_wdl_record(number, description):
+    return f"LINE{number}={description}\n"
+
+
+def write_wdl(path, records, chunk_size=1 << 16, encoding=None):
+    '''
+    Writes (line_number, description) records to path in encoding
+    (default DEFAULT_WDL_ENCODING). Formatted records are flushed to a
+    temporary file in the same directory in buffered chunks, which is then
+    renamed over path, so a crash mid-write never leaves a truncated file
+    behind. Returns the number of records written.
+    '''
+    count = 0
+
+    def write(fd):
+        nonlocal count
+        pending = []
+        pending_size = 0
+        for number, description in records:
+            record = format_wdl_record(number, description)
+            pending.append(record)
+            pending_size += len(record)
+            count += 1
+            if pending_size >= chunk_size:
+                fd.write("".join(pending))
+                pending = []
+                pending_size = 0
+        fd.write("".join(pending))
+
+    replace_file(path, write, encoding)
+    return count
+
+
+_umask = None
+_umaskLock = threading.Lock()
+
+
+def process_umask():
+    '''
+    The process umask. It can only be read by setting it, which is not
+    safe while other threads create files, so it is read once.
+    '''
+    global _umask
+    with _umaskLock:
+        if _umask is None:
+            _umask = os.umask(0)
+            os.umask(_umask)
+        return _umask
+
+
+def replace_file(path, write, encoding=None, newline=None, errors=None):
+    '''
+    Calls write(fd) on a temporary text file next to path, fsyncs it and
+    renames it over path, so readers only ever see the old or the new
+    contents. A character encoding cannot represent fails the write.
+    '''
+    import tempfile
+
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(prefix=".", suffix=".wdl.tmp", dir=directory)
+    encoding = encoding or DEFAULT_WDL_ENCODING
+
+    try:
+        with os.fdopen(handle, 'w', encoding=encoding, errors=errors or wdl_errors(encoding), newline=newline) as fd:
+            write(fd)
+            fd.flush()
+            os.fsync(fd.fileno())
+
+        # mkstemp creates the file 0600; give it the permissions open() would have
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+        else:
+            os.chmod(temp_path, 0o666 & ~process_umask())
+
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def parse_csv(lines):
+    '''
+    Parses "line number,description" rows (e.g. a spreadsheet export) into a
+    (line_index, line_dict) pair. Raises ValueError on a malformed row.
+    '''
+    import csv
+
+    line_dict = {}
+    for row_number, row in enumerate(csv.reader(lines)):
+        if len(row) == 0:
+            continue
+        # Tolerate a header row such as "Line #,Description"
+        if row_number == 0 and not row[0].strip().isdigit():
+            continue
+        line_key = "Line " + str(int(row[0]))
+        line_dict[line_key] = ",".join(row[1:]).strip()
+
+    line_index = sorted(line_dict.keys(), key=lambda x: int(x.split()[-1]))
+    return line_index, line_dict
+
+
+# One pasted spreadsheet row: "12<TAB>TITLE" or "Line 12<TAB>TITLE"; further columns are ignored
+PASTED_ROW_PATTERN = re.compile(r'^ *(?:line *)?(\d+) *(?:\t([^\t]*).*)?$', re.IGNORECASE)
+
+
+def parse_pasted_lines(text):
+    '''
+    Parses a tab-separated "line number, description" block copied from a
+    spreadsheet into ((line_number, description) records, diagnostics).
+    Every row is checked before anything is returned, so a caller can
+    reject the whole block if diagnostics is non-empty.
+    '''
+    rows = text.replace('\r', '').split('\n')
+    matches = list(map(PASTED_ROW_PATTERN.match, rows))
+
+    records = []
+    diagnostics = []
+    for row_number, (row, match) in enumerate(zip(rows, matches), start=1):
+        if match is None:
+            # Tolerate blank rows and a header row such as "Line #<TAB>Description"
+            if row.strip() != "" and not (row_number == 1 and len(rows) > 1):
+                diagnostics.append(WDLDiagnostic(row_number, "expected line number<TAB>description", row))
+            continue
+
+        number = int(match.group(1))
+        code = line_number_problem(number)
+        if code is not None:
+            diagnostics.append(WDLDiagnostic.rule(code, row_number, row))
+        else:
+            records.append((number, (match.group(2) or "").strip(), row_number))
+
+    # One search over every description; only a hit needs the per-row scan
+    if DESCRIPTION_WARNING_PATTERN.search("\n".join(description for _, description, _ in records)):
+        for number, description, row_number in records:
+            for code in description_warnings(description):
+                diagnostics.append(WDLDiagnostic.rule(code, row_number, rows[row_number - 1]))
+        diagnostics.sort(key=lambda diagnostic: diagnostic.row)
+
+    return [(number, description) for number, description, _ in records], diagnostics
+
+
+    
+    
+
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Instrumentation
+
+###############################################################################################################
+###############################################################################################################
+
+# Per-user files (project index, instrumentation log, ...)
+USER_DATA_DIR = os.path.join(os.path.expanduser("~"), ".wdl_builder")
+
+INSTRUMENT_ENV = "WDL_BUILDER_INSTRUMENT"
+DEFAULT_INSTRUMENT_LOG = os.path.join(USER_DATA_DIR, "instrumentation.log")
+
+
+class ActionRecord:
+    '''
+    Timing for one UI action: wall time plus exclusive time per phase
+    (dialog, parse, model, treeview, write).
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.wall = 0.0
+        self.phases = {}
+        # Open phases as [name, start, time spent in nested phases]
+        self._stack = []
+
+    @property
+    def work(self):
+        # Time not spent waiting on the user in a dialog
+        return self.wall - self.phases.get("dialog", 0.0)
+
+    def as_dict(self):
+        return {
+            "action": self.name,
+            "wall_ms": round(self.wall * 1000, 3),
+            "work_ms": round(self.work * 1000, 3),
+            "phases_ms": {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()},
+        }
+
+
+@functools.lru_cache(maxsize=None)
+def instrumentation_logger(log_path):
+    '''
+    The logger writing to log_path. It is created once per file and shared
+    by every Instrumentation using it, so no file handle is opened twice.
+    '''
+    import logging
+    import logging.handlers
+
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    logger = logging.getLogger(f"wdl_builder.instrumentation.{instrumentation_logger.cache_info().currsize}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=1 << 20, backupCount=3)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    return logger
+
+
+class Instrumentation:
+    '''
+    Opt-in timing of ApplicationWindow actions, enabled with --instrument or
+    the WDL_BUILDER_INSTRUMENT environment variable. Each finished action
+    is appended as one JSON line, with running per-action counters, to a
+    rotating log file and optionally shown in the status bar. When
+    disabled every hook is a shared no-op context manager.
+    '''
+    def __init__(self, enabled=False, log_path=DEFAULT_INSTRUMENT_LOG):
+        self.enabled = enabled
+        self._current = None
+        self._listeners = []
+        self._profiler = None
+
+        # action name -> [count, total work seconds, max work seconds]
+        self.counters = {}
+
+        self._logger = instrumentation_logger(os.path.abspath(log_path)) if enabled else None
+
+    @classmethod
+    def from_environment(cls, enabled=None):
+        if enabled is None:
+            enabled = os.environ.get(INSTRUMENT_ENV, "") not in ("", "0")
+        return cls(enabled)
+
+    def subscribe(self, callback):
+        '''
+        Registers callback(record:ActionRecord) for every finished action.
+        '''
+        self._listeners.append(callback)
+
+    def action(self, name):
+        '''
+        Context manager timing a synchronous action.
+        '''
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._action(name)
+
+    @contextlib.contextmanager
+    def _action(self, name):
+        record = self.begin(name)
+        try:
+            with self.activate(record):
+                yield record
+        finally:
+            self.end(record)
+
+    def begin(self, name):
+        '''
+        Starts an action that finishes asynchronously; pass the record to
+        phase()/activate() and finally to end(). Returns None when disabled.
+        '''
+        return ActionRecord(name) if self.enabled else None
+
+    def activate(self, record):
+        '''
+        Attributes phases opened without an explicit record to record.
+        '''
+        if record is None:
+            return contextlib.nullcontext()
+        return self._activate(record)
+
+    @contextlib.contextmanager
+    def _activate(self, record):
+        previous = self._current
+        self._current = record
+        try:
+            yield record
+        finally:
+            self._current = previous
+
+    def phase(self, name, record=None):
+        '''
+        Context manager adding the time spent inside it to a phase of record
+        (or of the active action). Nested phases are subtracted from their
+        parent, so phase times are exclusive.
+        '''
+        if record is None:
+            record = self._current
+        if record is None:
+            return contextlib.nullcontext()
+        return self._phase(name, record)
+
+    @contextlib.contextmanager
+    def _phase(self, name, record):
+        frame = [name, time.perf_counter(), 0.0]
+        record._stack.append(frame)
+        try:
+            yield
+        finally:
+            record._stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            record.phases[name] = record.phases.get(name, 0.0) + elapsed - frame[2]
+            if len(record._stack) > 0:
+                record._stack[-1][2] += elapsed
+
+    def end(self, record, **extra):
+        if record is None:
+            return
+        record.wall = time.perf_counter() - record.start
+
+        counter = self.counters.setdefault(record.name, [0, 0.0, 0.0])
+        counter[0] += 1
+        counter[1] += record.work
+        counter[2] = max(counter[2], record.work)
+
+        entry = record.as_dict()
+        entry.update(extra)
+        entry["time"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        entry["count"] = counter[0]
+        entry["mean_work_ms"] = round(counter[1] / counter[0] * 1000, 3)
+        entry["max_work_ms"] = round(counter[2] * 1000, 3)
+        self._logger.info(json.dumps(entry))
+
+        for callback in list(self._listeners):
+            callback(record)
+
+    @property
+    def profiling(self):
+        return self._profiler is not None
+
+    def start_profile(self):
+        import cProfile
+        if self._profiler is None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop_profile(self, path):
+        '''
+        Stops the profiler and writes pstats data to path.
+        '''
+        if self._profiler is None:
+            return -1
+        self._profiler.disable()
+        self._profiler.dump_stats(path)
+        self._profiler = None
+        return 0
+
+
+def instrumented(name):
+    '''
+    Decorator timing an ApplicationWindow action with the app's Instrumentation.
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.app.instrumentation.action(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Background Tasks
+
+###############################################################################################################
+###############################################################################################################
+
+class TaskCancelled(Exception):
+    pass
+
+
+class BackgroundTask:
+    '''
+    Handle shared between the Tk thread and a worker thread. The worker
+    updates progress (0.0 - 1.0) and calls check_cancelled() regularly;
+    the Tk thread only reads progress and sets the cancel flag.
+    '''
+    def __init__(self, label):
+        self.label = label
+        self.progress = 0.0
+        self.future = None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise TaskCancelled(self.label)
+
+
+def load_wdl_file(path, task:BackgroundTask=None):
+    '''
+    Reads and parses a WDL file into a list of records. Safe to run on a
+    worker thread: it never touches the model. Returns (records, reader).
+    '''
+    size = max(1, os.path.getsize(path))
+    records = []
+    with open_wdl(path) as fd:
+        reader = WDLReader(fd)
+        for record in reader:
+            records.append(record)
+            if task is not None and len(records) % 4096 == 0:
+                task.check_cancelled()
+                task.progress = min(1.0, reader.chars_read / size)
+    return records, reader
+
+
+def save_wdl_file(path, records, total, task:BackgroundTask=None, encoding=None):
+    '''
+    Streams records to path with write_wdl. Cancelling aborts before the
+    rename, so the existing file is left untouched.
+    '''
+    def tracked():
+        for count, record in enumerate(records, 1):
+            if count % 4096 == 0:
+                task.check_cancelled()
+                task.progress = min(1.0, count / max(1, total))
+            yield record
+
+    return write_wdl(path, records if task is None else tracked(), encoding=encoding)
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Journal
+
+###############################################################################################################
+###############################################################################################################
+
+DEFAULT_JOURNAL_DIR = os.path.join(USER_DATA_DIR, "session")
+
+# Upper bound on how long a journal entry waits in memory before it is fsync'd
+JOURNAL_FLUSH_MS = 1000
+
+
+class Journal:
+    '''
+    Append-only record of one document's changes, so unsaved work
+    survives a crash.
+
+    The first line is a JSON header naming the document, the file and
+    encoding it is saved to, and the base the changes apply to: either a
+    WDL file (checked by mtime and size on replay) or nothing, in which
+    case a snapshot of the model follows.
+    Every later line is one line state, "N<TAB>description", or just "N"
+    for a removed line. Descriptions never contain newlines, so no
+    escaping is needed.
+
+    Entries are buffered and fsync'd in batches of batch_size (and by
+    flush(), which the window calls every second). Once the appended
+    entries outgrow what the journal describes, it is compacted into a
+    fresh header plus the net changes. A journal only reads the model
+    while its document is the active one.
+    '''
+    def __init__(self, path, app, document, batch_size=64, compact_after=10000):
+        self._path = path
+        self._app = app
+        self._document = document
+        self._batchSize = batch_size
+        self._compactAfter = compact_after
+
+        self._fd = None
+        self._pending = []
+
+        # Header of the current journal, and the net state of every line changed since it was written
+        self._header = None
+        self._net = {}
+        self._appended = 0
+
+    @property
+    def path(self):
+        return self._path
+
+    def record_change(self, change:LineChange):
+        lines = self._app.lines
+        for line_id in itertools.chain(change.inserted, change.updated):
+            self._append(line_number(line_id), lines[line_id])
+        for line_id in change.deleted:
+            self._append(line_number(line_id), None)
+
+        if len(self._pending) >= self._batchSize:
+            self.flush()
+
+        # Compaction costs the size of what it rewrites, so wait until the log has grown by at least that much
+        cost = len(self._net) if self._header["base"] is not None else len(self._app.line_ids)
+        if self._appended >= self._compactAfter + cost:
+            self.compact()
+
+    def _append(self, number, description):
+        self._net[number] = description
+        self._pending.append(f"{number}\n" if description is None else f"{number}\t{description}\n")
+        self._appended += 1
+
+    def flush(self):
+        '''
+        Writes buffered entries and fsyncs them.
+        '''
+        if self._pending and self._fd is not None:
+            self._fd.write("".join(self._pending))
+            self._fd.flush()
+            os.fsync(self._fd.fileno())
+        self._pending = []
+
+    def reset(self, base=None, items=None):
+        '''
+        Starts over after the model was replaced wholesale: from the WDL file
+        base it was loaded from, if any, or else from a snapshot of items
+        (by default, the active model's).
+        '''
+        header = self._describe({"journal": 1, "base": None})
+        if base is not None and os.path.exists(base):
+            stat = os.stat(base)
+            header.update(base=os.path.abspath(base), mtime=stat.st_mtime_ns, size=stat.st_size)
+
+        self._net = {}
+        if header["base"] is None:
+            self._rewrite(header, self._app.items() if items is None else items)
+        else:
+            self._rewrite(header, ())
+
+    def compact(self):
+        '''
+        Rewrites the journal as its header plus the net change of every
+        line, dropping superseded entries.
+        '''
+        header = self._describe(dict(self._header))
+        if header["base"] is None:
+            self._net = {}
+            self._rewrite(header, self._app.items())
+        else:
+            self._rewrite(header, sorted(self._net.items()))
+
+    def _describe(self, header):
+        document = self._document
+        header.update(name=document.name, path=document.path, encoding=document.encoding)
+        return header
+
+    def _rewrite(self, header, states):
+        import tempfile
+
+        self._pending = []
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+        directory = os.path.dirname(os.path.abspath(self._path))
+        os.makedirs(directory, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(prefix=".", suffix=".journal.tmp", dir=directory)
+        try:
+            with os.fdopen(handle, 'w', encoding='utf-8', errors='surrogateescape', newline='\n') as fd:
+                fd.write(json.dumps(header) + "\n")
+                fd.write("".join(f"{number}\n" if description is None else f"{number}\t{description}\n"
+                                 for number, description in states))
+                fd.flush()
+                os.fsync(fd.fileno())
+            os.replace(temp_path, self._path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self._header = header
+        self._appended = 0
+        self._fd = open(self._path, 'a', encoding='utf-8', errors='surrogateescape', newline='\n')
+
+    def close(self, discard=False):
+        '''
+        Flushes and closes the journal. discard removes it.
+        '''
+        self.flush()
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+        if discard and os.path.exists(self._path):
+            os.remove(self._path)
+
+
+class SessionJournal:
+    '''
+    The journals of every open document, one file each in directory, so
+    edits in background tabs are recoverable too. Changes go to the
+    active document's journal. Switching tabs only changes which journal
+    that is; a journal is rewritten only when its own document's model is
+    replaced, and removed when the document is closed.
+
+    A replaced model is journaled at the next flush or change rather than
+    at once, so the header records the name and path the window gives a
+    document after loading it.
+    '''
+    def __init__(self, app, directory=DEFAULT_JOURNAL_DIR, batch_size=64, compact_after=10000):
+        self._app = app
+        self._directory = directory
+        self._batchSize = batch_size
+        self._compactAfter = compact_after
+
+        # Document -> its Journal, and the document changes are currently going to
+        self._journals = {}
+        self._active = None
+        self._count = 0
+
+        # WDL file the next reset was loaded from (see expect_base)
+        self._nextBase = None
+
+        # (document, base) whose journal still has to be started over
+        self._reset = None
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @staticmethod
+    def journal_paths(directory=DEFAULT_JOURNAL_DIR):
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return []
+        # Journals are numbered in the order their documents were first journaled
+        names = [name for name in names if name.endswith(".journal")]
+        return [os.path.join(directory, name) for name in sorted(names, key=lambda name: (len(name), name))]
+
+    @staticmethod
+    def found(directory=DEFAULT_JOURNAL_DIR):
+        '''
+        True if a previous session left journals behind.
+        '''
+        return any(os.path.getsize(path) > 0 for path in SessionJournal.journal_paths(directory))
+
+    def start(self):
+        '''
+        Starts journaling every open document, replacing any journals
+        already on disk.
+        '''
+        for path in self.journal_paths(self._directory):
+            os.remove(path)
+        for document in self._app.documents:
+            if document is not self._app.document:
+                self._journal(document).reset(items=document.line_index.items())
+        self._active = self._app.document
+        self._journal(self._active).reset()
+        self._app.subscribe(self.record_change)
+
+    def expect_base(self, path):
+        '''
+        Announces that the next model reset is a load of the WDL file at
+        path, so the journal can refer to the file instead of copying it.
+        '''
+        self._nextBase = path
+
+    def rebase(self, document):
+        '''
+        Announces that document was just written to document.path, so its
+        journal can start over from that file.
+        '''
+        self._defer_reset(document, document.path)
+
+    def _defer_reset(self, document, base):
+        if self._reset is not None and self._reset[0] is not document:
+            self._settle()
+        self._reset = (document, base)
+
+    def _settle(self):
+        # Makes a deferred reset, from the model as it is now
+        if self._reset is None:
+            return
+        document, base = self._reset
+        self._reset = None
+        if any(document is open_document for open_document in self._app.documents):
+            items = None if document is self._app.document else document.line_index.items()
+            self._journal(document).reset(base, items)
+
+    def _journal(self, document):
+        journal = self._journals.get(document)
+        if journal is None:
+            self._count += 1
+            journal = self._journals[document] = Journal(os.path.join(self._directory, f"{self._count}.journal"), self._app,
+                                                         document, self._batchSize, self._compactAfter)
+        return journal
+
+    def record_change(self, change:LineChange):
+        document = self._app.document
+        if change.reset:
+            self._prune()
+            if document is not self._active and document in self._journals:
+                # A tab switch: the model is the one that document's journal already describes
+                self._settle()
+                self._active = document
+                return
+            self._active = document
+            base, self._nextBase = self._nextBase, None
+            self._defer_reset(document, base)
+            return
+        self._settle()
+        self._journal(document).record_change(change)
+
+    def _prune(self):
+        # Closed documents have nothing left to recover
+        open_documents = set(map(id, self._app.documents))
+        for document in [document for document in self._journals if id(document) not in open_documents]:
+            self._journals.pop(document).close(discard=True)
+
+    def flush(self):
+        '''
+        Writes and fsyncs every journal's buffered entries.
+        '''
+        self._settle()
+        self._prune()
+        for journal in self._journals.values():
+            journal.flush()
+
+    def close(self, discard=False):
+        '''
+        Flushes and closes every journal. discard removes them, for a clean exit.
+        '''
+        self._app.unsubscribe(self.record_change)
+        if not discard:
+            self._settle()
+        self._reset = None
+        for journal in self._journals.values():
+            journal.close(discard)
+        self._journals = {}
+
+
+def load_journal(path, task:BackgroundTask=None):
+    '''
+    Replays a journal left by a previous session. Returns its JSON header,
+    which names the document, its file, encoding and base file, the recovered
+    (line_number, description) records and a list of warnings. Safe to
+    run on a worker thread.
+    '''
+    with open(path, 'r', encoding='utf-8', errors='surrogateescape', newline='\n') as fd:
+        data = fd.read()
+
+    rows = data.split('\n')
+    # A crash can leave a half-written last entry; everything before it was complete
+    rows.pop()
+
+    warnings = []
+    try:
+        header = json.loads(rows[0])
+    except (IndexError, ValueError):
+        raise ValueError(f"{path} is not a session journal")
+
+    states = {}
+    base = header.get("base")
+    if base is not None:
+        try:
+            stat = os.stat(base)
+            if (stat.st_mtime_ns, stat.st_size) != (header.get("mtime"), header.get("size")):
+                warnings.append(f"{base} has changed since the session started; recovered changes were applied to the current file")
+            records, _ = load_wdl_file(base, task)
+            states.update(records)
+        except OSError:
+            warnings.append(f"{base} could not be read; only the lines changed in the session were recovered")
+
+    for row in rows[1:]:
+        number, separator, description = row.partition('\t')
+        try:
+            states[int(number)] = description if separator else None
+        except ValueError:
+            warnings.append(f"skipped a damaged journal entry: {row!r}")
+
+    records = [(number, description) for number, description in states.items() if description is not None]
+    return header, records, warnings
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   File Watcher
+
+###############################################################################################################
+###############################################################################################################
+
+WATCH_POLL_MS = 1000
+
+
+def common_prefix_length(a, b):
+    '''
+    Length of the longest common prefix of two strings, found by comparing
+    slices of shrinking size so most of the work is done in C.
+    '''
+    limit = min(len(a), len(b))
+    length = 0
+    step = 1 << 16
+    while step:
+        if length + step <= limit and a[length:length + step] == b[length:length + step]:
+            length += step
+        else:
+            step >>= 1
+    return length
+
+
+def common_suffix_length(a, b, limit):
+    '''
+    Length of the longest common suffix of two strings, at most limit.
+    '''
+    length = 0
+    step = 1 << 16
+    while step:
+        if length + step <= limit and a[len(a) - length - step:len(a) - length] == b[len(b) - length - step:len(b) - length]:
+            length += step
+        else:
+            step >>= 1
+    return length
+
+
+def parse_wdl_text(text):
+    '''
+    Parses WDL text into a line number -> description dict. Later duplicates win.
+    '''
+    return dict(WDLReader(io.StringIO(text)))
+
+
+def find_wdl_rows(numbers, text, pos=0, endpos=None):
+    '''
+    Returns (line_number, row) for the rows of text[pos:endpos] whose key
+    is one of numbers, as WDL_KEY_PATTERN reads keys. pos must start a
+    row. A row the reader would still reject may be included, but none it
+    accepts is missed.
+    '''
+    endpos = len(text) if endpos is None else endpos
+    rows = []
+    if pos == 0:
+        # The search below finds rows by the newline before them
+        key = text[:endpos].split('\n', 1)[0].partition('=')[0]
+        match = WDL_KEY_PATTERN.match(key)
+        if match is not None and int(match.group(1)) in numbers:
+            rows.append((int(match.group(1)), text[:endpos].split('\n', 1)[0]))
+        pos = 1
+
+    # A literal newline first lets the regex engine skip ahead quickly
+    alternatives = "|".join(str(number) for number in sorted(numbers))
+    pattern = re.compile(rf'\n([^\S\n]*LINE[^\S\n]*0*({alternatives})[^\S\n]*=.*)', re.IGNORECASE)
+    rows.extend((int(match.group(2)), match.group(1)) for match in pattern.finditer(text, pos - 1, endpos))
+    return rows
+
+
+# Beyond this many changed line numbers, poll() reparses the whole file
+# rather than search the unchanged text for each of them
+WATCH_MAX_NUMBERS = 256
+
+
+class WatchChange:
+    '''
+    What FileWatcher.poll found: the changed line states, and the version
+    of the file they lead to, which FileWatcher.commit makes the new base.
+    '''
+    __slots__ = ("states", "_stat", "_data", "_generation")
+
+    def __init__(self, states, stat, data, generation):
+        self.states = states
+        self._stat = stat
+        self._data = data
+        self._generation = generation
+
+
+class FileWatcher:
+    '''
+    Watches one WDL file for changes made by other programs, polling its
+    mtime and size. The text of the version the model matches is kept, so
+    a change is found by trimming the rows both versions share at the
+    start and end and reparsing only the rows in between. poll() turns
+    that region into (line_number, description) states, where None means
+    the line is gone, ready for Application.set_descriptions.
+
+    A number that also appears in the unchanged rows is resolved against
+    the whole text instead, since the later of duplicate rows wins.
+
+    rebase() and poll() read the file and belong on a worker thread; the
+    kept text is compressed, since WDL rows compress well. Nothing moves
+    the base until commit() is called with what poll() found, so a change
+    that could not be applied is found again by the next poll.
+    '''
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._stat = None
+        self._data = None
+        self._generation = 0
+
+    @property
+    def path(self):
+        return self._path
+
+    def _read(self):
+        stat = os.stat(self._path)
+        with open_wdl(self._path) as fd:
+            text = fd.read()
+        return (stat.st_mtime_ns, stat.st_size), text
+
+    @staticmethod
+    def _compress(text):
+        import zlib
+        return zlib.compress(text.encode('utf-8', 'surrogatepass'), 1)
+
+    @staticmethod
+    def _decompress(data):
+        import zlib
+        return zlib.decompress(data).decode('utf-8', 'surrogatepass')
+
+    def rebase(self):
+        '''
+        Takes the file as it is now as the version the model matches, right
+        after the model was loaded from it or saved to it. Raises OSError,
+        leaving the watcher without a base, if the file cannot be read.
+        '''
+        with self._lock:
+            self._generation += 1
+            self._stat = self._data = None
+            stat, text = self._read()
+            self._stat, self._data = stat, self._compress(text)
+
+    def poll(self):
+        '''
+        Returns a WatchChange holding the line states that changed since
+        the base, or None if the file is unchanged or cannot be read right
+        now. A watcher without a base tries to take one instead.
+        '''
+        with self._lock:
+            stat, data, generation = self._stat, self._data, self._generation
+        try:
+            if data is None:
+                self.rebase()
+                return None
+            current = os.stat(self._path)
+            if (current.st_mtime_ns, current.st_size) == stat:
+                return None
+            stat, text = self._read()
+        except OSError:
+            # Missing or locked mid-write; try again on the next poll
+            return None
+
+        old = self._decompress(data)
+        return WatchChange(self._diff(old, text), stat, self._compress(text), generation)
+
+    def commit(self, change:WatchChange):
+        '''
+        Makes the version change was found in the new base, once its states
+        have been applied. Returns False, changing nothing, if the watcher
+        was rebased since the poll.
+        '''
+        with self._lock:
+            if change._generation != self._generation:
+                return False
+            self._stat, self._data = change._stat, change._data
+            return True
+
+    @staticmethod
+    def _diff(old, text):
+        # Widen the differing span to whole rows on both sides
+        start = common_prefix_length(old, text)
+        start = old.rfind('\n', 0, start) + 1
+        suffix = common_suffix_length(old, text, min(len(old), len(text)) - start)
+        old_end = len(old) - suffix
+        new_end = len(text) - suffix
+        # The shared rows must start a row in both versions, not just the old one
+        while (0 < old_end < len(old) and old[old_end - 1] != '\n') or (0 < new_end < len(text) and text[new_end - 1] != '\n'):
+            newline = old.find('\n', old_end)
+            old_end = len(old) if newline == -1 else newline + 1
+            new_end = len(text) - (len(old) - old_end)
+
+        before = parse_wdl_text(old[start:old_end])
+        after = parse_wdl_text(text[start:new_end])
+        numbers = before.keys() | after.keys()
+
+        if len(numbers) > WATCH_MAX_NUMBERS:
+            before = parse_wdl_text(old)
+            after = parse_wdl_text(text)
+            numbers = before.keys() | after.keys()
+        elif numbers:
+            shared = {number for number, _ in find_wdl_rows(numbers, text, 0, start) + find_wdl_rows(numbers, text, new_end)}
+            if shared:
+                whole_before = parse_wdl_text("\n".join(row for _, row in find_wdl_rows(shared, old)))
+                whole_after = parse_wdl_text("\n".join(row for _, row in find_wdl_rows(shared, text)))
+                for number in shared:
+                    before.pop(number, None)
+                    after.pop(number, None)
+                    if number in whole_before:
+                        before[number] = whole_before[number]
+                    if number in whole_after:
+                        after[number] = whole_after[number]
+
+        return [(number, after.get(number)) for number in sorted(numbers) if before.get(number) != after.get(number)]
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Project Index
+
+###############################################################################################################
+###############################################################################################################
+
+DEFAULT_INDEX_PATH = os.path.join(USER_DATA_DIR, "index.sqlite")
+
+
+class ProjectIndex:
+    '''
+    Persistent SQLite index of the line descriptions in every
+    *_wdtitle.wdl file under a directory tree. Files are re-read only when
+    their mtime or size changes, and descriptions are searched through an
+    FTS5 table (falling back to LIKE if this SQLite lacks FTS5).
+    '''
+    def __init__(self, db_path=DEFAULT_INDEX_PATH):
+        import sqlite3
+
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS lines (
+                id INTEGER PRIMARY KEY,
+                file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+                line_number INTEGER NOT NULL,
+                description TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS lines_file ON lines(file_id);
+        ''')
+
+        self._fts = True
+        try:
+            self._db.executescript('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS lines_fts USING fts5(
+                    description, content='lines', content_rowid='id'
+                );
+                CREATE TRIGGER IF NOT EXISTS lines_ai AFTER INSERT ON lines BEGIN
+                    INSERT INTO lines_fts(rowid, description) VALUES (new.id, new.description);
+                END;
+                CREATE TRIGGER IF NOT EXISTS lines_ad AFTER DELETE ON lines BEGIN
+                    INSERT INTO lines_fts(lines_fts, rowid, description) VALUES ('delete', old.id, old.description);
+                END;
+            ''')
+        except sqlite3.OperationalError:
+            self._fts = False
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def update(self, root, task:BackgroundTask=None):
+        '''
+        Brings the index up to date with the *_wdtitle.wdl files under root.
+        Returns counts of files scanned, (re)indexed, unchanged and removed.
+        A cancelled task rolls the whole update back.
+        '''
+        start = time.perf_counter()
+        root = os.path.abspath(root)
+        stats = {"scanned": 0, "indexed": 0, "unchanged": 0, "removed": 0, "lines": 0}
+
+        known = {}
+        prefix = os.path.join(root, "")
+        for file_id, path, mtime, size in self._db.execute("SELECT id, path, mtime, size FROM files"):
+            if path.startswith(prefix):
+                known[path] = (file_id, mtime, size)
+
+        with self._db:
+            for directory, _, filenames in os.walk(root):
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    if not is_wdtitle_file(path):
+                        continue
+                    if task is not None:
+                        task.check_cancelled()
+
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+
+                    stats["scanned"] += 1
+                    previous = known.pop(path, None)
+                    if previous is not None and previous[1] == stat.st_mtime and previous[2] == stat.st_size:
+                        stats["unchanged"] += 1
+                        continue
+
+                    stats["lines"] += self._index_file(path, stat, previous)
+                    stats["indexed"] += 1
+
+            # Anything left in known has been deleted or moved away
+            for file_id, _, _ in known.values():
+                self._db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+                stats["removed"] += 1
+
+        stats["seconds"] = time.perf_counter() - start
+        return stats
+
+    def _index_file(self, path, stat, previous):
+        if previous is not None:
+            self._db.execute("DELETE FROM files WHERE id = ?", (previous[0],))
+
+        file_id = self._db.execute(
+            "INSERT INTO files(path, mtime, size) VALUES (?, ?, ?)",
+            (path, stat.st_mtime, stat.st_size)).lastrowid
+
+        try:
+            with open_wdl(path, errors='replace') as fd:
+                rows = [(file_id, number, description) for number, description in WDLReader(fd) if description != ""]
+        except OSError:
+            return 0
+
+        self._db.executemany("INSERT INTO lines(file_id, line_number, description) VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def search(self, query, limit=200):
+        '''
+        Returns (path, line_number, description) rows whose description
+        matches every word of query (as prefixes), best matches first.
+        '''
+        words = re.findall(r'\w+', query)
+        if len(words) == 0:
+            return []
+
+        if self._fts:
+            match = " ".join(f'"{word}"*' for word in words)
+            sql = '''
+                SELECT files.path, lines.line_number, lines.description
+                FROM lines_fts
+                JOIN lines ON lines.id = lines_fts.rowid
+                JOIN files ON files.id = lines.file_id
+                WHERE lines_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            '''
+            return self._db.execute(sql, (match, limit)).fetchall()
+
+        clauses = " AND ".join("lines.description LIKE ?" for _ in words)
+        sql = f'''
+            SELECT files.path, lines.line_number, lines.description
+            FROM lines JOIN files ON files.id = lines.file_id
+            WHERE {clauses}
+            ORDER BY files.path, lines.line_number
+            LIMIT ?
+        '''
+        return self._db.execute(sql, [f"%{word}%" for word in words] + [limit]).fetchall()
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Batch Engine
+
+###############################################################################################################
+###############################################################################################################
+
+# Project names become file names, so they cannot name a directory
+PROJECT_NAME_PATTERN = re.compile(r'^[^<>:"/\\|?*\x00-\x1f]+$')
+
+
+def load_manifest(manifest_path):
+    '''
+    Loads a batch manifest. A manifest is a JSON document of the form:
+
+        {
+            "output_dir": "out",
+            "projects": [
+                {"project": "PROJ1", "lines": {"1": "TITLE", "2": "CLIENT"}},
+                {"project": "PROJ2", "source": "legacy/PROJ2_wdtitle.wdl"},
+                {"project": "PROJ3", "source": "sheets/PROJ3.csv"}
+            ]
+        }
+
+    Relative paths are resolved against the manifest's directory. Raises
+    ValueError if the manifest as a whole is malformed; a malformed project
+    becomes a job with an "error", which generate_project reports as failed
+    so the rest of the batch still runs.
+    '''
+    with open(manifest_path, 'r') as fd:
+        manifest = json.load(fd)
+
+    if isinstance(manifest, list):
+        manifest = {"projects": manifest}
+    if not isinstance(manifest, dict):
+        raise ValueError("a manifest must be an object or a list of projects")
+    if not isinstance(manifest.get("projects", []), list):
+        raise ValueError("\"projects\" must be a list")
+    if not isinstance(manifest.get("output_dir", "."), str):
+        raise ValueError("\"output_dir\" must be a string")
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    output_dir = os.path.join(base_dir, manifest.get("output_dir", "."))
+
+    # Optional project members, with the type each must have
+    expected = {"source": (str, "a string"), "output_dir": (str, "a string"), "lines": (dict, "an object")}
+    jobs = []
+    for position, entry in enumerate(manifest.get("projects", [])):
+        if not isinstance(entry, dict):
+            jobs.append({"project": f"projects[{position}]", "output_dir": output_dir,
+                         "error": f"expected an object, got {entry!r}"})
+            continue
+
+        job = dict(entry)
+        wrong = [key for key, (kind, _) in expected.items() if key in job and not isinstance(job[key], kind)]
+        if wrong:
+            job["error"] = f"\"{wrong[0]}\" must be {expected[wrong[0]][1]}"
+            job.pop("source", None)
+            job["output_dir"] = output_dir
+        else:
+            if "source" in job:
+                job["source"] = os.path.join(base_dir, job["source"])
+            job["output_dir"] = os.path.abspath(os.path.join(base_dir, job.get("output_dir", output_dir)))
+        jobs.append(job)
+
+    return jobs
+
+
+def generate_project(job):
+    '''
+    Builds and writes a single project's WDL file without a display.
+    Runs inside a worker process, so it only returns plain data.
+    '''
+    project = job.get("project", "")
+    result = {"project": project, "path": None, "lines": 0, "warnings": 0, "status": "ok", "error": ""}
+
+    try:
+        if "error" in job:
+            raise ValueError(job["error"])
+        if project == "":
+            raise ValueError("missing project name")
+        if not isinstance(project, str) or not PROJECT_NAME_PATTERN.match(project):
+            raise ValueError(f"invalid project name {project!r}")
+
+        app = Application(headless=True)
+
+        if "source" in job:
+            with open_wdl(job["source"]) as fd:
+                if os.path.splitext(job["source"])[1].lower() == '.csv':
+                    line_index, line_dict = parse_csv(fd)
+                    app.import_lines(line_index, line_dict)
+                else:
+                    reader = WDLReader(fd)
+                    app.import_records(reader)
+                    result["warnings"] = reader.diagnostic_count
+
+        for number, description in job.get("lines", {}).items():
+            problem = description_problem(description)
+            if problem is not None:
+                raise ValueError(f"invalid description for line {number}: {problem}")
+            line_id = f"Line {int(number)}"
+            if line_id not in app.lines:
+                if app.add_line(line_id) != 0:
+                    raise ValueError(f"invalid line number {number}")
+            app.edit_line(line_id, description)
+
+        if not app.has_output():
+            raise ValueError("no line descriptions to write")
+
+        os.makedirs(job["output_dir"], exist_ok=True)
+        result["path"] = os.path.join(job["output_dir"], f"{project}_wdtitle.wdl")
+        result["lines"] = app.write_output(result["path"])
+
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    return result
+
+
+def run_pool(function, items, workers=None):
+    '''
+    Returns [function(item) for item in items], computed across a process
+    pool of workers (default: one per CPU), and the seconds it took. One
+    worker, or a single item, runs in this process. function must be a
+    module-level function and return plain data, so both can be pickled.
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+
+    start = time.perf_counter()
+    if workers == 1 or len(items) <= 1:
+        results = [function(item) for item in items]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(function, items, chunksize=max(1, len(items) // 64)))
+    return results, time.perf_counter() - start
+
+
+def run_batch(jobs, workers=None):
+    '''
+    Generates every job's WDL file across a process pool and returns
+    (results, report) where report holds the throughput figures.
+    '''
+    results, elapsed = run_pool(generate_project, jobs, workers)
+
+    succeeded = [r for r in results if r["status"] == "ok"]
+    line_count = sum(r["lines"] for r in succeeded)
+    report = {
+        "projects": len(jobs),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "lines": line_count,
+        "seconds": elapsed,
+        "projects_per_second": len(results) / elapsed if elapsed > 0 else 0.0,
+        "lines_per_second": line_count / elapsed if elapsed > 0 else 0.0,
+    }
+    return results, report
+
+
+def print_batch_report(results, report, stream=sys.stdout):
+    for result in results:
+        if result["status"] != "ok":
+            print(f"FAILED  {result['project']}: {result['error']}", file=stream)
+        elif result["warnings"] > 0:
+            message = result["error"] or f"skipped {result['warnings']} malformed row(s)"
+            print(f"WARNING {result['project']}: {message}", file=stream)
+
+    print(f"{report['succeeded']}/{report['projects']} projects written "
+          f"({report['lines']} lines) in {report['seconds']:.3f}s "
+          f"- {report['projects_per_second']:.1f} projects/s, "
+          f"{report['lines_per_second']:.0f} lines/s", file=stream)
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Templates
+
+###############################################################################################################
+###############################################################################################################
+
+# {{FIELD}} in a description is replaced by that field's value for each project
+PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*([^{}]+?)\s*\}\}')
+
+
+class WDLTemplate:
+    '''
+    A WDL model whose descriptions contain {{FIELD}} placeholders, compiled
+    once into a single format string for the whole file. Rendering a
+    project is then one str.format_map call, however many lines the
+    template has.
+
+        template = WDLTemplate.from_model(app)
+        text = template.render({"CLIENT": "ACME", "JOB": "1234"})
+    '''
+    def __init__(self, records, encoding=None):
+        records = [(number, description) for number, description in records if description != ""]
+        self.encoding = encoding
+        self.line_count = len(records)
+
+        # Field names may contain anything but braces, so each is given a safe format key
+        self.fields = []
+        keys = {}
+
+        def compile_description(description):
+            parts = PLACEHOLDER_PATTERN.split(description)
+            for position in range(0, len(parts), 2):
+                parts[position] = parts[position].replace("{", "{{").replace("}", "}}")
+            for position in range(1, len(parts), 2):
+                field = parts[position]
+                if field not in keys:
+                    keys[field] = f"f{len(keys)}"
+                    self.fields.append(field)
+                parts[position] = "{" + keys[field] + "}"
+            return "".join(parts)
+
+        self._format = "".join(format_wdl_record(number, compile_description(description)) for number, description in records)
+        self._keys = keys
+
+    @classmethod
+    def from_model(cls, model):
+        return cls(model.records(), model.document.encoding)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Compiles a template saved by Save As Template: an ordinary WDL file
+        whose descriptions contain placeholders.
+        '''
+        return cls.from_model(load_wdl_model(path))
+
+    def render(self, values):
+        '''
+        Returns the WDL text for one project. Raises KeyError naming the
+        first field values lacks or leaves empty (None), and ValueError for
+        a value the GUI would not accept in a description.
+        '''
+        arguments = {}
+        for field, key in self._keys.items():
+            if values.get(field) is None:
+                raise KeyError(field)
+            value = str(values[field])
+            problem = description_problem(value)
+            if problem is not None:
+                raise ValueError(f"value for {field}: {problem}")
+            arguments[key] = value
+        return self._format.format_map(arguments)
+
+
+def load_table(path):
+    '''
+    Reads per-project values from a CSV file with a header row, or from a
+    JSON list of objects (optionally under a "projects" key). Returns a
+    list of dicts.
+    '''
+    if os.path.splitext(path)[1].lower() == '.json':
+        with open(path, 'r') as fd:
+            table = json.load(fd)
+        if isinstance(table, dict):
+            table = table.get("projects", [])
+        if not isinstance(table, list) or not all(isinstance(row, dict) for row in table):
+            raise ValueError(f"{path}: expected a list of objects")
+        return table
+
+    import csv
+    with open(path, 'r', newline='') as fd:
+        # DictReader fills the columns a short row lacks with None; leave them out so they count as missing
+        return [{key.strip(): value for key, value in row.items() if key is not None and value is not None}
+                for row in csv.DictReader(fd)]
+
+
+def render_template_project(template, row, output_dir, project_field="project"):
+    '''
+    Renders and writes one project's WDL file. Returns a result dict in
+    the same shape as generate_project.
+    '''
+    project = "" if row.get(project_field) is None else str(row[project_field]).strip()
+    result = {"project": project, "path": None, "lines": 0, "warnings": 0, "status": "ok", "error": ""}
+    try:
+        if not PROJECT_NAME_PATTERN.match(project):
+            raise ValueError(f"invalid or missing {project_field!r} value")
+        text = template.render(row)
+        result["path"] = os.path.join(output_dir, f"{project}_wdtitle.wdl")
+        replace_file(result["path"], lambda fd: fd.write(text), template.encoding)
+        result["lines"] = template.line_count
+    except KeyError as e:
+        result["status"] = "failed"
+        result["error"] = f"missing value for {e.args[0]}"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def run_template(template, rows, output_dir, workers=None, project_field="project", task:BackgroundTask=None):
+    '''
+    Writes one <project>_wdtitle.wdl per row of values. The template is
+    compiled once and shared; rendering is a single C-level format call,
+    so the work is dominated by file writes, which run concurrently on a
+    thread pool. Returns (results, report) like run_batch.
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+
+    results = []
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as pool:
+        futures = [pool.submit(render_template_project, template, row, output_dir, project_field) for row in rows]
+        for future in futures:
+            if task is not None and task.cancelled:
+                for pending in futures:
+                    pending.cancel()
+                task.check_cancelled()
+            results.append(future.result())
+            if task is not None:
+                task.progress = len(results) / len(futures)
+    elapsed = time.perf_counter() - start
+
+    # Two rows with the same project would silently overwrite each other's file
+    seen = set()
+    for result in results:
+        if result["status"] == "ok":
+            if result["project"] in seen:
+                result["warnings"] += 1
+                result["error"] = "duplicate project; file written more than once"
+            seen.add(result["project"])
+
+    succeeded = [r for r in results if r["status"] == "ok"]
+    line_count = sum(r["lines"] for r in succeeded)
+    report = {
+        "projects": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "lines": line_count,
+        "seconds": elapsed,
+        "projects_per_second": len(results) / elapsed if elapsed > 0 else 0.0,
+        "lines_per_second": line_count / elapsed if elapsed > 0 else 0.0,
+    }
+    return results, report
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Diff and Merge
+
+###############################################################################################################
+###############################################################################################################
+
+def diff_models(old, new):
+    '''
+    Returns (line_number, old_description, new_description) for every
+    line that differs between two models (anything with items(), such as
+    Application), in line order. None means the line is absent from that
+    side. Lines are matched by number, so unlike a text diff this is
+    linear in the number of lines.
+    '''
+    # Hash lookups keep this linear; only the differences need sorting
+    old_lines = dict(old.items())
+    new_lines = dict(new.items())
+    differences = [(number, old_lines.get(number), description)
+                   for number, description in new_lines.items() if old_lines.get(number) != description]
+    differences.extend((number, description, None) for number, description in old_lines.items() if number not in new_lines)
+    differences.sort()
+    return differences
+
+
+def merge_changes(base, ours, theirs):
+    '''
+    Three-way merge by line number, expressed as the (line_number,
+    description) states to apply to ours (None removes the line). A line
+    changed only in theirs takes their version; a line changed in ours is
+    kept. Lines changed differently on both sides are conflicts: ours is
+    kept and each is reported as (line_number, base, ours, theirs).
+    Returns (states, conflicts).
+    '''
+    our_changes = {number: new for number, _, new in diff_models(base, ours)}
+
+    states = []
+    conflicts = []
+    for number, original, other in diff_models(base, theirs):
+        if number not in our_changes:
+            states.append((number, other))
+        elif our_changes[number] != other:
+            conflicts.append((number, original, our_changes[number], other))
+    return states, conflicts
+
+
+def merge_models(base, ours, theirs):
+    '''
+    Returns (merged Application, conflicts); see merge_changes.
+    '''
+    states, conflicts = merge_changes(base, ours, theirs)
+    merged = Application(headless=True)
+    merged.import_records(ours.items())
+    merged.set_descriptions(states)
+    return merged, conflicts
+
+
+def load_wdl_model(path):
+    '''
+    Reads a WDL file into a headless Application.
+    '''
+    model = Application(headless=True)
+    with open_wdl(path) as fd:
+        model.import_records(WDLReader(fd), encoding=fd.encoding)
+    return model
+
+
+def format_diff(differences, old_label="", new_label=""):
+    '''
+    Renders differences as WDL rows prefixed with - (old) and + (new).
+    '''
+    output = [f"--- {old_label}\n", f"+++ {new_label}\n"]
+    for number, old, new in differences:
+        if old is not None:
+            output.append("-" + format_wdl_record(number, old))
+        if new is not None:
+            output.append("+" + format_wdl_record(number, new))
+    return "".join(output)
+
+
+def diff_files(pair):
+    '''
+    Diffs one (old_path, new_path) pair inside a worker process and
+    returns plain data for the report.
+    '''
+    old_path, new_path = pair
+    result = {"old": old_path, "new": new_path, "status": "same", "added": 0, "removed": 0, "changed": 0,
+              "differences": [], "error": ""}
+    try:
+        differences = diff_models(load_wdl_model(old_path), load_wdl_model(new_path))
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+
+    for number, old, new in differences:
+        if old is None:
+            result["added"] += 1
+        elif new is None:
+            result["removed"] += 1
+        else:
+            result["changed"] += 1
+    if differences:
+        result["status"] = "different"
+        result["differences"] = differences
+    return result
+
+
+def find_wdtitle_files(root):
+    '''
+    The *_wdtitle.wdl files under root, as sorted paths relative to root.
+    '''
+    found = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if is_wdtitle_file(name):
+                found.append(os.path.relpath(os.path.join(directory, name), root))
+    return sorted(found)
+
+
+def pair_directories(old_root, new_root):
+    '''
+    Pairs the *_wdtitle.wdl files of two directory trees by relative path.
+    Files present on one side only are paired with None.
+    '''
+    old_files = set(find_wdtitle_files(old_root))
+    new_files = set(find_wdtitle_files(new_root))
+    return [(os.path.join(old_root, relative) if relative in old_files else None,
+             os.path.join(new_root, relative) if relative in new_files else None)
+            for relative in sorted(old_files | new_files)]
+
+
+def run_diffs(pairs, workers=None):
+    '''
+    Diffs every (old_path, new_path) pair across a process pool. A pair
+    with a missing side is reported as "missing". Returns (results, report).
+    '''
+    complete = [pair for pair in pairs if pair[0] is not None and pair[1] is not None]
+    diffed, elapsed = run_pool(diff_files, complete, workers)
+
+    results = diffed + [{"old": old, "new": new, "status": "missing", "added": 0, "removed": 0, "changed": 0,
+                         "differences": [], "error": ""} for old, new in pairs if old is None or new is None]
+
+    report = {"pairs": len(results), "seconds": elapsed,
+              "pairs_per_second": len(complete) / elapsed if elapsed > 0 else 0.0}
+    for status in ("same", "different", "missing", "failed"):
+        report[status] = sum(1 for result in results if result["status"] == status)
+    return results, report
+
+
+def print_diff_report(results, report, stream=sys.stdout):
+    for result in results:
+        if result["status"] == "different":
+            print(f"DIFFERENT {result['old']} {result['new']}: {result['added']} added, "
+                  f"{result['removed']} removed, {result['changed']} changed", file=stream)
+        elif result["status"] == "missing":
+            print(f"MISSING   {result['old'] or result['new']}: no counterpart", file=stream)
+        elif result["status"] == "failed":
+            print(f"FAILED    {result['old']} {result['new']}: {result['error']}", file=stream)
+
+    print(f"{report['pairs']} pairs: {report['same']} same, {report['different']} different, "
+          f"{report['missing']} missing, {report['failed']} failed in {report['seconds']:.3f}s "
+          f"- {report['pairs_per_second']:.1f} pairs/s", file=stream)
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Lint
+
+###############################################################################################################
+###############################################################################################################
+
+# A file that is nothing but well-formed "LINEn=description" rows, in the
+# form write_wdl produces, with line numbers of up to 9 digits and no
+# character description_warnings looks for; such a file can only break the
+# duplicate-line-number rule
+WDL_CLEAN_ROW = rf'LINE[1-9][0-9]{{0,8}}=[^\n{ILLEGAL_DESCRIPTION_CHARACTERS}{CONTROL_CHARACTERS}]*'
+WDL_CLEAN_TEXT_PATTERN = re.compile(rf'(?:{WDL_CLEAN_ROW}\n)*(?:{WDL_CLEAN_ROW})?')
+WDL_CLEAN_KEY_PATTERN = re.compile(r'^LINE([0-9]+)=', re.MULTILINE)
+
+
+def lint_wdl_text(text, max_findings=1000):
+    '''
+    Checks every row of a WDL file's text against LINT_RULES in one pass.
+    Returns (findings, counts): up to max_findings WDLDiagnostics in row
+    order, and the number of rows breaking each rule.
+    '''
+    # Most files are clean: one match over the whole text confirms it
+    if WDL_CLEAN_TEXT_PATTERN.fullmatch(text):
+        numbers = WDL_CLEAN_KEY_PATTERN.findall(text)
+        if len(set(numbers)) == len(numbers):
+            return [], {}
+    return lint_wdl_rows(text, max_findings)
+
+
+def lint_wdl_rows(text, max_findings=1000):
+    '''
+    The row-by-row check behind lint_wdl_text, without its fast path for
+    clean files. Returns the same (findings, counts).
+    '''
+    findings = []
+    counts = {}
+
+    def report(code, row_number, row, detail=""):
+        counts[code] = counts.get(code, 0) + 1
+        if len(findings) < max_findings:
+            findings.append(WDLDiagnostic.rule(code, row_number, row, detail))
+
+    # One search over the whole text; only a hit needs descriptions checked row by row
+    check = DESCRIPTION_WARNING_PATTERN.search(text) is not None
+
+    first_rows = {}
+    for row_number, row in enumerate(text.split('\n'), start=1):
+        number, description, code = parse_wdl_row(row)
+        if code is not None:
+            report(code, row_number, row.rstrip('\r'))
+        if number is None:
+            continue
+
+        first_row = first_rows.setdefault(number, row_number)
+        if first_row != row_number:
+            report("duplicate-line-number", row_number, row.rstrip('\r'), f"first on row {first_row}")
+
+        for code in description_warnings(description) if check else ():
+            report(code, row_number, row.rstrip('\r'))
+
+    findings.sort(key=lambda finding: finding.row)
+    return findings, counts
+
+
+def lint_wdl_file(path, max_findings=1000):
+    '''
+    Lints one WDL file inside a worker process and returns plain data for
+    the report. The file is read as bytes and decoded in its sniffed
+    encoding, so bytes that do not decode are reported rather than
+    failing the whole file.
+    '''
+    result = {"path": path, "status": "clean", "encoding": None, "rows": 0, "errors": 0, "warnings": 0,
+              "counts": {}, "findings": [], "error": ""}
+    try:
+        with open(path, 'rb') as fd:
+            encoding = sniff_wdl_encoding(fd)
+            data = fd.read()
+    except OSError as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+
+    result["encoding"] = encoding
+    encoding_problem = None
+    try:
+        text = data.decode(encoding)
+    except UnicodeDecodeError as e:
+        row_number = data.count(b'\n', 0, e.start) + 1
+        encoding_problem = (row_number, f"{encoding} byte 0x{data[e.start]:02x} at offset {e.start}")
+        text = data.decode(encoding, errors='replace')
+
+    findings, counts = lint_wdl_text(text, max_findings)
+    if encoding_problem is not None:
+        row_number, detail = encoding_problem
+        counts["encoding"] = 1
+        findings.append(WDLDiagnostic.rule("encoding", row_number, text.split('\n', row_number)[row_number - 1], detail))
+        findings.sort(key=lambda finding: finding.row)
+
+    result["rows"] = text.count('\n') + (not text.endswith('\n') and text != "")
+    result["counts"] = counts
+    result["findings"] = [{"row": finding.row, "code": finding.code, "severity": finding.severity,
+                           "message": finding.message, "text": finding.text} for finding in findings]
+    for code, count in counts.items():
+        result[LINT_RULES[code][0] + "s"] += count
+    if result["errors"]:
+        result["status"] = "errors"
+    elif result["warnings"]:
+        result["status"] = "warnings"
+    return result
+
+
+def run_lint(paths, workers=None):
+    '''
+    Lints every file across a process pool. Returns (results, report).
+    '''
+    results, elapsed = run_pool(lint_wdl_file, paths, workers)
+
+    rows = sum(result["rows"] for result in results)
+    report = {"files": len(results), "rows": rows, "seconds": elapsed,
+              "files_per_second": len(results) / elapsed if elapsed > 0 else 0.0,
+              "rows_per_second": rows / elapsed if elapsed > 0 else 0.0, "counts": {}}
+    for status in ("clean", "warnings", "errors", "failed"):
+        report[status] = sum(1 for result in results if result["status"] == status)
+    for result in results:
+        for code, count in result["counts"].items():
+            report["counts"][code] = report["counts"].get(code, 0) + count
+    return results, report
+
+
+def print_lint_report(results, report, stream=sys.stdout):
+    for result in results:
+        if result["status"] == "failed":
+            print(f"{result['path']}: FAILED {result['error']}", file=stream)
+        for finding in result["findings"]:
+            print(f"{result['path']}:{finding['row']}: {finding['severity']}: {finding['message']} [{finding['code']}]", file=stream)
+
+    print(f"{report['files']} files ({report['rows']} rows): {report['clean']} clean, {report['warnings']} with warnings, "
+          f"{report['errors']} with errors, {report['failed']} failed in {report['seconds']:.3f}s "
+          f"- {report['files_per_second']:.1f} files/s, {report['rows_per_second']:.0f} rows/s", file=stream)
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Transcoding
+
+###############################################################################################################
+###############################################################################################################
+
+def is_ascii_file(path, chunk_size=1 << 16):
+    with open(path, 'rb') as raw:
+        return all(chunk.isascii() for chunk in iter(lambda: raw.read(chunk_size), b''))
+
+
+def is_ascii_superset(encoding):
+    # True if ASCII text is written byte for byte in encoding, with no BOM
+    text = "".join(map(chr, range(128)))
+    return text.encode(encoding) == text.encode('ascii')
+
+
+def transcode_file(job):
+    '''
+    Rewrites one (source, target, encoding) file in encoding inside a
+    worker process, streaming it in chunks so memory stays constant.
+    Line endings are kept as they are. Returns plain data for the report.
+    '''
+    source, target, encoding = job
+    result = {"path": source, "output": target, "from": None, "to": encoding, "status": "converted", "bytes": 0, "error": ""}
+    try:
+        # Strict, so bytes that do not decode fail the file instead of being replaced or copied across
+        with open_wdl(source, newline='', errors='strict') as fd:
+            result["from"] = fd.encoding
+            # Pure ASCII sniffs as the default encoding but is already valid in any ASCII superset
+            if fd.encoding == DEFAULT_WDL_ENCODING and is_ascii_file(source):
+                result["from"] = 'ascii'
+            compatible = fd.encoding == encoding or (result["from"] == 'ascii' and is_ascii_superset(encoding))
+            if compatible and os.path.abspath(source) == os.path.abspath(target):
+                result["status"] = "unchanged"
+                return result
+
+            def write(out):
+                while True:
+                    chunk = fd.read(1 << 16)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+
+            os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+            replace_file(target, write, encoding, newline='', errors='strict')
+        result["bytes"] = os.path.getsize(target)
+    except UnicodeError as e:
+        result["status"] = "failed"
+        # Positions in e are relative to the chunk being converted, not the file
+        result["error"] = f"cannot convert from {result['from']} to {encoding}: {e.reason}"
+    except OSError as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def run_transcode(jobs, workers=None):
+    '''
+    Transcodes every (source, target, encoding) job across a process pool.
+    Returns (results, report).
+    '''
+    results, elapsed = run_pool(transcode_file, jobs, workers)
+
+    written = sum(result["bytes"] for result in results)
+    report = {"files": len(results), "bytes": written, "seconds": elapsed,
+              "files_per_second": len(results) / elapsed if elapsed > 0 else 0.0,
+              "megabytes_per_second": written / 2**20 / elapsed if elapsed > 0 else 0.0}
+    for status in ("converted", "unchanged", "failed"):
+        report[status] = sum(1 for result in results if result["status"] == status)
+    return results, report
+
+
+def print_transcode_report(results, report, stream=sys.stdout):
+    for result in results:
+        if result["status"] == "failed":
+            print(f"FAILED    {result['path']}: {result['error']}", file=stream)
+        elif result["status"] == "converted":
+            print(f"CONVERTED {result['path']}: {result['from']} -> {result['to']}", file=stream)
+
+    print(f"{report['files']} files: {report['converted']} converted, {report['unchanged']} unchanged, "
+          f"{report['failed']} failed in {report['seconds']:.3f}s "
+          f"- {report['files_per_second']:.1f} files/s, {report['megabytes_per_second']:.1f} MB/s", file=stream)
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Service
+
+###############################################################################################################
+###############################################################################################################
+
+DEFAULT_SERVICE_PORT = 8765
+
+# Bodies larger than this are refused before they are read
+MAX_REQUEST_BYTES = 64 << 20
+
+# Latency samples kept per route for the percentiles in /metrics
+LATENCY_SAMPLES = 1024
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ServiceMetrics:
+    '''
+    Request counts and latencies per route, plus connection reuse, for the
+    /metrics endpoint. Latency percentiles are taken over the most recent
+    LATENCY_SAMPLES requests of each route.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._routes = {}
+        self._connections = 0
+        self._requests = 0
+        self._errors = 0
+
+    def connection(self):
+        with self._lock:
+            self._connections += 1
+
+    def record(self, route, seconds, error=False):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                from collections import deque
+                stats = self._routes[route] = {"count": 0, "errors": 0, "seconds": 0.0, "samples": deque(maxlen=LATENCY_SAMPLES)}
+            stats["count"] += 1
+            stats["errors"] += error
+            stats["seconds"] += seconds
+            stats["samples"].append(seconds)
+            self._requests += 1
+            self._errors += error
+
+    def snapshot(self):
+        with self._lock:
+            uptime = time.perf_counter() - self._started
+            routes = {}
+            for route, stats in sorted(self._routes.items()):
+                samples = sorted(stats["samples"])
+
+                def percentile(p):
+                    return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+
+                routes[route] = {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "mean_ms": stats["seconds"] / stats["count"] * 1000,
+                    "p50_ms": percentile(0.50),
+                    "p95_ms": percentile(0.95),
+                    "p99_ms": percentile(0.99),
+                    "max_ms": samples[-1] * 1000,
+                }
+            return {
+                "uptime_seconds": uptime,
+                "requests": self._requests,
+                "errors": self._errors,
+                "requests_per_second": self._requests / uptime if uptime > 0 else 0.0,
+                "connections": self._connections,
+                "requests_per_connection": self._requests / self._connections if self._connections else 0.0,
+                "routes": routes,
+            }
+
+
+def service_records(lines, allow_removal=False):
+    '''
+    Validates the "lines" member of a request: an object mapping line
+    numbers to descriptions, or a list of [number, description] pairs.
+    Returns (line_number, description) records.
+    '''
+    if isinstance(lines, dict):
+        lines = lines.items()
+    elif not isinstance(lines, list):
+        raise ServiceError(400, "lines must be an object or a list of [number, description] pairs")
+
+    records = []
+    for entry in lines:
+        try:
+            number, description = entry
+            number = int(number)
+        except (TypeError, ValueError):
+            raise ServiceError(400, f"invalid line entry {entry!r}")
+        if not 0 < number <= MAX_LINE_NUMBER:
+            raise ServiceError(400, f"line number {number} out of range")
+        if description is None and allow_removal:
+            records.append((number, None))
+            continue
+        problem = description_problem(description)
+        if problem is not None:
+            raise ServiceError(400, f"invalid description for line {number}: {problem}")
+        records.append((number, description))
+    return records
+
+
+class WDLService:
+    '''
+    The model operations behind the HTTP service, independent of HTTP so
+    /batch can run its sub-requests in-process. Each open document is a
+    headless Application guarded by its own lock, so requests for
+    different documents run concurrently on the server's worker pool.
+
+        POST   /generate                 {"lines": ..., "edits": ...} -> {"output": ...}
+        POST   /documents                {"lines": ...}  -> {"id": ...}
+        GET    /documents/ID             -> line and description counts
+        POST   /documents/ID/import      {"lines": ...}
+        POST   /documents/ID/edit        {"lines": ...}, null removes a line
+        GET    /documents/ID/output      -> {"output": ...}
+        DELETE /documents/ID
+        POST   /batch                    {"requests": [{"method", "path", "body"}, ...]}
+        GET    /metrics, GET /health
+    '''
+    def __init__(self, max_documents=1000):
+        self.metrics = ServiceMetrics()
+        self._maxDocuments = max_documents
+        self._documents = {}
+        self._documentsLock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def handle(self, method, path, body):
+        '''
+        Runs one request and returns (status, route, payload), where route
+        is the path with the document id elided, for the metrics.
+        '''
+        parts = self._path_parts(path)
+        route = method + " /" + "/".join("{id}" if position == 1 and parts[0] == "documents" else part
+                                         for position, part in enumerate(parts))
+        try:
+            return 200, route, self._dispatch(method, parts, body)
+        except ServiceError as e:
+            return e.status, route, {"error": str(e)}
+
+    @staticmethod
+    def _path_parts(path):
+        # "/documents/7/edit?x" -> ["documents", "7", "edit"]
+        return [part for part in path.split('?', 1)[0].split('/') if part]
+
+    def _dispatch(self, method, parts, body):
+        if body is not None and not isinstance(body, dict):
+            raise ServiceError(400, "request body must be a JSON object")
+        body = body or {}
+
+        if parts == ["health"] and method == "GET":
+            return {"status": "ok"}
+        if parts == ["metrics"] and method == "GET":
+            return self.metrics.snapshot()
+        if parts == ["generate"] and method == "POST":
+            return self._generate(body)
+        if parts == ["batch"] and method == "POST":
+            return self._batch(body)
+        if parts == ["documents"] and method == "POST":
+            return self._create(body)
+
+        if len(parts) in (2, 3) and parts[0] == "documents":
+            action = parts[2] if len(parts) == 3 else None
+            if (method, action) == ("DELETE", None):
+                return self._delete(parts[1])
+            operation = {
+                ("GET", None): self._describe,
+                ("POST", "import"): self._import,
+                ("POST", "edit"): self._edit,
+                ("GET", "output"): self._output,
+            }.get((method, action))
+            if operation is not None:
+                model, lock = self._document(parts[1])
+                with lock:
+                    return operation(model, body)
+
+        raise ServiceError(404, f"no route for {method} /{'/'.join(parts)}")
+
+    def _generate(self, body):
+        model = Application(headless=True)
+        model.import_records(service_records(body.get("lines", {})))
+        if "edits" in body:
+            self._edit(model, {"lines": body["edits"]})
+        return self._output(model, body)
+
+    def _batch(self, body):
+        requests = body.get("requests")
+        if not isinstance(requests, list):
+            raise ServiceError(400, "requests must be a list")
+        responses = []
+        for request in requests:
+            if not isinstance(request, dict) or not isinstance(request.get("path"), str):
+                responses.append({"status": 400, "body": {"error": "each request needs a method and a path"}})
+                continue
+            method = str(request.get("method", "GET")).upper()
+            if method == "POST" and self._path_parts(request["path"]) == ["batch"]:
+                responses.append({"status": 400, "body": {"error": "batches cannot be nested"}})
+                continue
+            start = time.perf_counter()
+            status, route, payload = self.handle(method, request["path"], request.get("body"))
+            self.metrics.record("batch: " + route, time.perf_counter() - start, status >= 400)
+            responses.append({"status": status, "body": payload})
+        return {"responses": responses}
+
+    def _create(self, body):
+        model = Application(headless=True)
+        if "lines" in body:
+            model.import_records(service_records(body["lines"]))
+        with self._documentsLock:
+            if len(self._documents) >= self._maxDocuments:
+                raise ServiceError(503, f"too many open documents (limit {self._maxDocuments})")
+            document_id = str(next(self._ids))
+            self._documents[document_id] = (model, threading.Lock())
+        return {"id": document_id, **self._describe(model, body)}
+
+    def _document(self, document_id):
+        with self._documentsLock:
+            document = self._documents.get(document_id)
+        if document is None:
+            raise ServiceError(404, f"no document {document_id}")
+        return document
+
+    def _delete(self, document_id):
+        with self._documentsLock:
+            if self._documents.pop(document_id, None) is None:
+                raise ServiceError(404, f"no document {document_id}")
+        return {"id": document_id}
+
+    def _describe(self, model, body):
+        return {"lines": len(model.line_ids), "described": model.described_count}
+
+    def _import(self, model, body):
+        model.import_records(service_records(body.get("lines", {})))
+        return self._describe(model, body)
+
+    def _edit(self, model, body):
+        records = service_records(body.get("lines", {}), allow_removal=True)
+        model.set_descriptions(records, label="service")
+        return self._describe(model, body)
+
+    def _output(self, model, body):
+        return {"output": model.generate_output(), "lines": model.described_count}
+
+
+def make_service_server(service, port=DEFAULT_SERVICE_PORT, workers=None, idle_timeout=30):
+    '''
+    Returns an HTTP/1.1 server for service bound to localhost:port (0 picks
+    a free port). Connections are kept alive between requests and handled
+    on a fixed pool of worker threads; an idle connection gives its worker
+    back after idle_timeout seconds.
+    '''
+    # http.server is imported here to keep it off the GUI's startup path
+    import http.server
+    from concurrent.futures import ThreadPoolExecutor
+
+    class ServiceRequestHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        timeout = idle_timeout
+
+        # Headers and body go out in separate writes; Nagle would hold the
+        # body back until the client's delayed ACK, ~40ms per request
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            service.metrics.connection()
+
+        def _respond(self):
+            start = time.perf_counter()
+            body = None
+            try:
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                except ValueError:
+                    raise ServiceError(400, "invalid Content-Length")
+                if length > MAX_REQUEST_BYTES:
+                    raise ServiceError(413, f"request body over {MAX_REQUEST_BYTES} bytes")
+                if length:
+                    try:
+                        body = json.loads(self.rfile.read(length))
+                    except ValueError as e:
+                        raise ServiceError(400, f"invalid JSON: {e}")
+                status, route, payload = service.handle(self.command, self.path, body)
+            except ServiceError as e:
+                status, route, payload = e.status, self.command + " " + self.path, {"error": str(e)}
+                # The request could not be framed, so the connection cannot be reused
+                self.close_connection = True
+            except Exception as e:
+                status, route, payload = 500, self.command + " " + self.path, {"error": f"{type(e).__name__}: {e}"}
+
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            if self.close_connection:
+                self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(data)
+            service.metrics.record(route, time.perf_counter() - start, status >= 400)
+
+        do_GET = do_POST = do_DELETE = _respond
+
+        def log_message(self, format, *args):
+            pass
+
+    class ServiceServer(http.server.HTTPServer):
+        def __init__(self):
+            super().__init__(("127.0.0.1", port), ServiceRequestHandler)
+            self._pool = ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4),
+                                            thread_name_prefix="wdl-service")
+
+        def process_request(self, request, client_address):
+            self._pool.submit(self._process, request, client_address)
+
+        def _process(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+        def server_close(self):
+            super().server_close()
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    return ServiceServer()
+
+
+def run_service(port=DEFAULT_SERVICE_PORT, workers=None, stream=sys.stdout):
+    '''
+    Serves until interrupted, then prints the final metrics.
+    '''
+    service = WDLService()
+    server = make_service_server(service, port, workers)
+    print(f"WDL service listening on http://127.0.0.1:{server.server_address[1]}/ (Ctrl+C to stop)", file=stream)
+    stream.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    metrics = service.metrics.snapshot()
+    for route, stats in metrics["routes"].items():
+        print(f"{route:<36} {stats['count']:>8} requests  p50 {stats['p50_ms']:.2f}ms  p99 {stats['p99_ms']:.2f}ms", file=stream)
+    print(f"{metrics['requests']} requests over {metrics['connections']} connections "
+          f"in {metrics['uptime_seconds']:.1f}s - {metrics['requests_per_second']:.1f} requests/s", file=stream)
+
+
+###############################################################################################################
+###############################################################################################################
+
+#   Command Line
+
+###############################################################################################################
+###############################################################################################################
+
+def write_report(path, results, report):
+    '''
+    Writes a command's summary report and per-item results to path as JSON.
+    '''
+    with open(path, 'w') as fd:
+        json.dump({"report": report, "results": results}, fd, indent=2)
+
+
+def main(argv=None, window=None):
+    '''
+    Runs the command given in argv. With none, the application is shown in
+    window, the ApplicationWindow class when started from run.py.
+    '''
+    parser = argparse.ArgumentParser(description="WDL Builder")
+    parser.add_argument("--batch", metavar="MANIFEST", help="generate WDL files for every project in a JSON manifest, without a GUI")
+    parser.add_argument("--output-dir", metavar="DIR", help="override the manifest's output directory; also where --template and --transcode write")
+    parser.add_argument("--workers", type=int, default=None, help="number of workers (default: CPU count; 4x that for --template)")
+    parser.add_argument("--report", metavar="FILE", help="write the batch results and throughput report as JSON")
+    parser.add_argument("--index", metavar="DIR", help="index every *_wdtitle.wdl file under DIR for searching")
+    parser.add_argument("--search", metavar="TEXT", help="search the project index for line descriptions")
+    parser.add_argument("--db", metavar="FILE", default=DEFAULT_INDEX_PATH, help=f"project index database (default: {DEFAULT_INDEX_PATH})")
+    parser.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"), help="print the lines that differ between two WDL files")
+    parser.add_argument("--diff-dirs", nargs=2, metavar=("OLD_DIR", "NEW_DIR"), help="diff every *_wdtitle.wdl file in two directory trees, paired by relative path")
+    parser.add_argument("--diff-pairs", metavar="FILE", help="diff the file pairs listed in FILE, one tab-separated \"old<TAB>new\" pair per line")
+    parser.add_argument("--merge", nargs=3, metavar=("BASE", "OURS", "THEIRS"), help="three-way merge two edited copies of BASE")
+    parser.add_argument("--output", metavar="FILE", help="where --merge writes the merged WDL file (default: standard output)")
+    parser.add_argument("--template", metavar="TEMPLATE", help="render a WDL template once per row of --table, without a GUI")
+    parser.add_argument("--table", metavar="FILE", help="CSV or JSON table of placeholder values, one project per row")
+    parser.add_argument("--project-field", metavar="NAME", default="project", help="table column naming each project (default: project)")
+    parser.add_argument("--lint", metavar="PATH", nargs="+", help="check WDL files, or every *_wdtitle.wdl file under a directory, for problems")
+    parser.add_argument("--transcode", metavar="PATH", nargs="+", help="convert WDL files, or every *_wdtitle.wdl file under a directory, to --to")
+    parser.add_argument("--to", metavar="ENCODING", help="target encoding for --transcode, e.g. utf-8, utf-8-sig, utf-16, cp1252")
+    parser.add_argument("--serve", nargs="?", type=int, const=DEFAULT_SERVICE_PORT, metavar="PORT",
+                        help=f"run the local HTTP/JSON service on 127.0.0.1 (default port: {DEFAULT_SERVICE_PORT})")
+    parser.add_argument("--startup-time", action="store_true", help="print the time to first window and exit")
+    parser.add_argument("--no-autosave", action="store_true", help="do not journal unsaved changes for crash recovery")
+    parser.add_argument("--cache-mb", type=int, metavar="MB", help="memory budget for parsed files kept for quick reopening (default: 256)")
+    parser.add_argument("--instrument", action="store_true", default=None,
+                        help=f"time every UI action, logging to {DEFAULT_INSTRUMENT_LOG} (or set {INSTRUMENT_ENV}=1)")
+    args = parser.parse_args(argv)
+
+    if args.index or args.search:
+        index = ProjectIndex(args.db)
+        if args.index:
+            stats = index.update(args.index)
+            print(f"{stats['scanned']} files scanned, {stats['indexed']} indexed ({stats['lines']} lines), "
+                  f"{stats['unchanged']} unchanged, {stats['removed']} removed in {stats['seconds']:.3f}s")
+        if args.search:
+            start = time.perf_counter()
+            rows = index.search(args.search)
+            for path, number, description in rows:
+                print(f"{path}\tLINE{number}\t{description}")
+            print(f"{len(rows)} match(es) in {(time.perf_counter() - start) * 1000:.1f}ms", file=sys.stderr)
+        index.close()
+        return 0
+
+    if args.diff:
+        differences = diff_models(load_wdl_model(args.diff[0]), load_wdl_model(args.diff[1]))
+        sys.stdout.write(format_diff(differences, args.diff[0], args.diff[1]))
+        return 1 if differences else 0
+
+    if args.diff_dirs or args.diff_pairs:
+        if args.diff_dirs:
+            pairs = pair_directories(*args.diff_dirs)
+        else:
+            pairs = []
+            with open(args.diff_pairs, 'r') as fd:
+                for row_number, row in enumerate(fd, 1):
+                    if row.strip() == "":
+                        continue
+                    pair = row.rstrip('\r\n').split('\t')
+                    if len(pair) != 2:
+                        parser.error(f"{args.diff_pairs}:{row_number}: expected old<TAB>new")
+                    pairs.append(tuple(pair))
+
+        results, report = run_diffs(pairs, workers=args.workers)
+        print_diff_report(results, report)
+
+        if args.report:
+            write_report(args.report, results, report)
+
+        return 0 if report["same"] == report["pairs"] else 1
+
+    if args.merge:
+        base, ours, theirs = (load_wdl_model(path) for path in args.merge)
+        merged, conflicts = merge_models(base, ours, theirs)
+        if args.output:
+            merged.write_output(args.output)
+        else:
+            sys.stdout.write(merged.generate_output())
+        for number, original, mine, other in conflicts:
+            print(f"CONFLICT LINE{number}: base {original!r}, ours {mine!r}, theirs {other!r} (kept ours)", file=sys.stderr)
+        return 1 if conflicts else 0
+
+    if args.lint:
+        paths = []
+        for path in args.lint:
+            if os.path.isdir(path):
+                paths.extend(os.path.join(path, relative) for relative in find_wdtitle_files(path))
+            else:
+                paths.append(path)
+
+        results, report = run_lint(paths, workers=args.workers)
+        print_lint_report(results, report)
+
+        if args.report:
+            write_report(args.report, results, report)
+
+        return 0 if report["errors"] == 0 and report["failed"] == 0 else 1
+
+    if args.transcode:
+        if not args.to:
+            parser.error("--transcode requires --to")
+        import codecs
+        try:
+            encoding = codecs.lookup(args.to).name
+        except LookupError:
+            parser.error(f"unknown encoding {args.to!r}")
+
+        jobs = []
+        for path in args.transcode:
+            if os.path.isdir(path):
+                relatives = find_wdtitle_files(path)
+                sources = [os.path.join(path, relative) for relative in relatives]
+            else:
+                relatives, sources = [os.path.basename(path)], [path]
+            for relative, source in zip(relatives, sources):
+                target = os.path.join(args.output_dir, relative) if args.output_dir else source
+                jobs.append((source, target, encoding))
+
+        results, report = run_transcode(jobs, workers=args.workers)
+        print_transcode_report(results, report)
+
+        if args.report:
+            write_report(args.report, results, report)
+
+        return 0 if report["failed"] == 0 else 1
+
+    if args.serve is not None:
+        run_service(args.serve, workers=args.workers)
+        return 0
+
+    if args.template:
+        if not args.table:
+            parser.error("--template requires --table")
+        template = WDLTemplate.load(args.template)
+        rows = load_table(args.table)
+
+        results, report = run_template(template, rows, os.path.abspath(args.output_dir or "."),
+                                       workers=args.workers, project_field=args.project_field)
+        print_batch_report(results, report)
+
+        if args.report:
+            write_report(args.report, results, report)
+
+        return 0 if report["failed"] == 0 else 1
+
+    if args.batch:
+        try:
+            jobs = load_manifest(args.batch)
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot read manifest {args.batch}: {e}")
+        if args.output_dir:
+            for job in jobs:
+                job["output_dir"] = os.path.abspath(args.output_dir)
+
+        results, report = run_batch(jobs, workers=args.workers)
+        print_batch_report(results, report)
+
+        if args.report:
+            write_report(args.report, results, report)
+
+        return 0 if report["failed"] == 0 else 1
+
+    if window is None:
+        parser.error("no command given; start run.py for the window")
+    Application(instrument=args.instrument, report_startup=args.startup_time, autosave=not args.no_autosave, cache_megabytes=args.cache_mb, window=window)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())